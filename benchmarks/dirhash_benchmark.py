@@ -0,0 +1,95 @@
+"""
+Throughput of the docker context hashing backends on a synthetic build context.
+
+    python benchmarks/dirhash_benchmark.py --size-gb 5 --files 100000
+
+The context is generated once into --dir (a temporary directory by default) and every backend hashes it
+without the file hash index, ie. all files are read. The files stay in the page cache after the generation,
+so the numbers show the hashing throughput rather than the disk throughput unless the cache is dropped.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import checksumdir
+
+from wanna.core.utils.hashing import DEFAULT_WORKERS, dirhash, new_hasher
+
+POOL_SIZE = 16 * 1024 * 1024
+
+
+def generate_context(context_dir: Path, size: int, files: int, seed: int = 42) -> None:
+    """
+    Writes files with log-normally distributed sizes (many small sources, a few large data files)
+    summing up to about size bytes, 100 files per directory.
+    """
+    rng = random.Random(seed)
+    pool = os.urandom(POOL_SIZE)
+    weights = [rng.lognormvariate(0, 1.5) for _ in range(files)]
+    scale = size / sum(weights)
+    for i, weight in enumerate(weights):
+        file_dir = context_dir / f"dir{i // 100:05d}"
+        file_dir.mkdir(parents=True, exist_ok=True)
+        remaining = max(1, int(weight * scale))
+        with open(file_dir / f"file{i:06d}.bin", "wb") as f:
+            # unique header, so no two files have the same content
+            f.write(i.to_bytes(8, "little"))
+            while remaining > 0:
+                start = rng.randrange(POOL_SIZE - 1)
+                chunk = pool[start : start + remaining]
+                f.write(chunk)
+                remaining -= len(chunk)
+
+
+def available(hashfunc: str) -> bool:
+    try:
+        new_hasher(hashfunc)
+        return True
+    except ImportError:
+        return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-gb", type=float, default=5)
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--dir", type=Path, help="where to generate the context, reused if it exists")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    context_dir = args.dir or Path(tempfile.mkdtemp(prefix="wanna-dirhash-"))
+    if not context_dir.exists() or not any(context_dir.iterdir()):
+        print(f"Generating {args.files} files, {args.size_gb} GB in {context_dir}")
+        generate_context(context_dir, int(args.size_gb * 1024**3), args.files)
+    size = sum(path.stat().st_size for path in context_dir.rglob("*") if path.is_file())
+
+    runs = [("checksumdir sha256", lambda: checksumdir.dirhash(context_dir, "sha256"))]
+    for hashfunc in ("sha256", "xxh3", "blake3"):
+        if not available(hashfunc):
+            print(f"Skipping {hashfunc}, its package is not installed")
+            continue
+        for workers in sorted({1, args.workers}):
+            runs.append(
+                (
+                    f"{hashfunc} {workers} threads",
+                    lambda hashfunc=hashfunc, workers=workers: dirhash(context_dir, hashfunc, workers=workers),
+                )
+            )
+
+    print(f"{'backend':<28}{'seconds':>10}{'MB/s':>10}  digest")
+    for name, run in runs:
+        start = time.perf_counter()
+        digest = run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<28}{elapsed:>10.1f}{size / 1024**2 / elapsed:>10.0f}  {digest[:16]}")
+
+    if not args.dir:
+        shutil.rmtree(context_dir)
+
+
+if __name__ == "__main__":
+    main()
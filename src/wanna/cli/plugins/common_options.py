@@ -27,6 +27,14 @@ push_mode_option: PushMode = typer.Option(
     "Use all for dev",
 )
 
+compile_workers_option: int = typer.Option(
+    1,
+    "--compile-workers",
+    min=1,
+    help="Number of worker processes compiling the pipelines in parallel. "
+    "Can be overridden with WANNA_PIPELINE_COMPILE_WORKERS env variable.",
+)
+
 
 def instance_name_option(instance_type: str, operation: str, help: str = None):
     return typer.Option(
@@ -0,0 +1,155 @@
+import pathlib
+from pathlib import Path
+
+import typer
+
+from wanna.cli.plugins.base_plugin import BasePlugin
+from wanna.cli.plugins.common_options import instance_name_option, profile_name_option, wanna_file_option
+from wanna.core.models.docker import DockerLocalRetentionModel
+from wanna.core.services.docker import DockerService
+from wanna.core.utils.config_loader import load_config_from_yaml
+
+
+class DockerPlugin(BasePlugin):
+    """
+    Main entry point for managing docker images defined in wanna-ml yaml configuration
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.register_many(
+            [
+                self.status,
+                self.promote,
+                self.lint,
+                self.gc,
+            ]
+        )
+
+    @staticmethod
+    def status(
+        file: Path = wanna_file_option,
+        profile_name: str = profile_name_option,
+    ) -> None:
+        """
+        Show which docker images are stale and when they were last built and pushed.
+
+        The current build context, Dockerfile and build configuration of every image are compared
+        with the last build recorded in build/docker/build-state.db. Nothing is built or pushed.
+        """
+        config = load_config_from_yaml(file, gcp_profile_name=profile_name)
+        workdir = pathlib.Path(file).parent
+        docker_service = DockerService(
+            docker_model=config.docker,  # type: ignore
+            gcp_profile=config.gcp_profile,
+            version="dev",
+            work_dir=workdir,
+            wanna_project_name=config.wanna_project.name,
+            quick_mode=True,
+        )
+        docker_service.print_build_status()
+
+    @staticmethod
+    def promote(
+        version: str = typer.Option(..., "--version", "-v", help="Version of the images to promote"),
+        from_profile: str = typer.Option(..., "--from-profile", help="GCP profile the images were built with"),
+        to_profile: str = typer.Option(..., "--to-profile", help="GCP profile to promote the images to"),
+        file: Path = wanna_file_option,
+        instance_name: str = instance_name_option("docker image", "promote"),
+    ) -> None:
+        """
+        Copy built docker images from the registry of one GCP profile to the registry of another.
+
+        Manifests and layers are copied directly between the registries (layers in the same registry
+        are mounted across repositories), the images are never rebuilt nor pulled.
+        """
+        workdir = pathlib.Path(file).parent
+        services = []
+        for profile_name in (from_profile, to_profile):
+            config = load_config_from_yaml(file, gcp_profile_name=profile_name)
+            services.append(
+                DockerService(
+                    docker_model=config.docker,  # type: ignore
+                    gcp_profile=config.gcp_profile,
+                    version=version,
+                    work_dir=workdir,
+                    wanna_project_name=config.wanna_project.name,
+                    quick_mode=True,
+                )
+            )
+        source, target = services
+        target.promote_images(source, None if instance_name == "all" else [instance_name])
+
+    @staticmethod
+    def lint(
+        file: Path = wanna_file_option,
+        profile_name: str = profile_name_option,
+        instance_name: str = instance_name_option("docker image", "lint"),
+        strict: bool = typer.Option(False, "--strict", help="Exit with an error code if there are any findings"),
+    ) -> None:
+        """
+        Analyse the Dockerfiles of the images for patterns that break the docker layer cache.
+
+        Flags dependency installs after the sources are copied, ARGs declared long before their use and
+        package index updates cached apart from the installs, suggests a reordering and shows how many
+        instructions a source change rebuilds. With build_telemetry, the rebuild time of the last build is shown.
+        """
+        config = load_config_from_yaml(file, gcp_profile_name=profile_name)
+        workdir = pathlib.Path(file).parent
+        docker_service = DockerService(
+            docker_model=config.docker,  # type: ignore
+            gcp_profile=config.gcp_profile,
+            version="dev",
+            work_dir=workdir,
+            wanna_project_name=config.wanna_project.name,
+            quick_mode=True,
+        )
+        reports = docker_service.lint_images(None if instance_name == "all" else [instance_name])
+        docker_service.print_lint_reports(reports)
+        if strict and any(report.findings for report in reports):
+            raise typer.Exit(1)
+
+    @staticmethod
+    def gc(
+        file: Path = wanna_file_option,
+        profile_name: str = profile_name_option,
+        keep_versions: int = typer.Option(
+            None, "--keep-versions", help="Local versions of every image to keep, overrides local_retention"
+        ),
+        max_size_gb: float = typer.Option(
+            None, "--max-size-gb", help="Budget of all local images of the project, overrides local_retention"
+        ),
+        prune_dangling: bool = typer.Option(
+            False,
+            "--prune-dangling",
+            help="Also prune all dangling images of the docker host, overrides local_retention",
+        ),
+        dry_run: bool = typer.Option(False, "--dry-run", help="Only show which images would be removed"),
+    ) -> None:
+        """
+        Remove old local versions of the docker images of the project.
+
+        Every image keeps its most recently built or used versions, the least recently used versions
+        are then removed until the local images of the project fit in the size budget.
+        """
+        config = load_config_from_yaml(file, gcp_profile_name=profile_name)
+        workdir = pathlib.Path(file).parent
+        docker_service = DockerService(
+            docker_model=config.docker,  # type: ignore
+            gcp_profile=config.gcp_profile,
+            version="dev",
+            work_dir=workdir,
+            wanna_project_name=config.wanna_project.name,
+        )
+        retention = docker_service.local_retention or DockerLocalRetentionModel()
+        overrides = {
+            "keep_versions": keep_versions,
+            "max_size_gb": max_size_gb,
+            "prune_dangling": prune_dangling or None,
+        }
+        retention = DockerLocalRetentionModel(
+            **{**retention.dict(), **{key: value for key, value in overrides.items() if value is not None}}
+        )
+        removed = docker_service.gc_images(retention, dry_run=dry_run)
+        size = sum(size for _, _, size in removed)
+        typer.echo(f"{'Would remove' if dry_run else 'Removed'} {len(removed)} images, {size / 1024**3:.1f} GB")
@@ -51,7 +51,7 @@ class JobPlugin(BasePlugin):
         config = load_config_from_yaml(file, gcp_profile_name=profile_name)
         workdir = pathlib.Path(file).parent.resolve()
         job_service = JobService(config=config, workdir=workdir, version=version, push_mode=mode)
-        manifests = job_service.build(instance_name)
+        manifests = job_service.build(instance_name, push_images=True)
         job_service.push(manifests)
 
     @staticmethod
@@ -66,7 +66,7 @@ class JobPlugin(BasePlugin):
         config = load_config_from_yaml(file, gcp_profile_name=profile_name)
         workdir = pathlib.Path(file).parent.resolve()
         job_service = JobService(config=config, workdir=workdir, version=version)
-        manifests = job_service.build(instance_name)
+        manifests = job_service.build(instance_name, push_images=True)
         job_service.push(manifests, local=False)
         JobService.run([str(p) for p in manifests], sync=sync, hp_params=hp_params)
 
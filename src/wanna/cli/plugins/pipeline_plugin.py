@@ -5,6 +5,7 @@ import typer
 
 from wanna.cli.plugins.base_plugin import BasePlugin
 from wanna.cli.plugins.common_options import (
+    compile_workers_option,
     instance_name_option,
     profile_name_option,
     push_mode_option,
@@ -36,10 +37,13 @@ class PipelinePlugin(BasePlugin):
         profile_name: str = profile_name_option,
         instance_name: str = instance_name_option("pipeline", "compile"),
         mode: PushMode = push_mode_option,
+        compile_workers: int = compile_workers_option,
     ) -> None:
         config = load_config_from_yaml(file, gcp_profile_name=profile_name)
         workdir = pathlib.Path(file).parent
-        pipeline_service = PipelineService(config=config, workdir=workdir, version=version, push_mode=mode)
+        pipeline_service = PipelineService(
+            config=config, workdir=workdir, version=version, push_mode=mode, compile_workers=compile_workers
+        )
         pipeline_service.build(instance_name)
 
     @staticmethod
@@ -49,11 +53,14 @@ class PipelinePlugin(BasePlugin):
         profile_name: str = profile_name_option,
         instance_name: str = instance_name_option("pipeline", "push"),
         mode: PushMode = push_mode_option,
+        compile_workers: int = compile_workers_option,
     ) -> None:
         config = load_config_from_yaml(file, gcp_profile_name=profile_name)
         workdir = pathlib.Path(file).parent
-        pipeline_service = PipelineService(config=config, workdir=workdir, version=version, push_mode=mode)
-        manifests = pipeline_service.build(instance_name)
+        pipeline_service = PipelineService(
+            config=config, workdir=workdir, version=version, push_mode=mode, compile_workers=compile_workers
+        )
+        manifests = pipeline_service.build(instance_name, push_images=True)
         pipeline_service.push(manifests)
 
     @staticmethod
@@ -81,9 +88,10 @@ class PipelinePlugin(BasePlugin):
         config = load_config_from_yaml(file, gcp_profile_name=profile_name)
         workdir = pathlib.Path(file).parent
         pipeline_service = PipelineService(config=config, workdir=workdir, version=version)
-        manifests = pipeline_service.build(instance_name)
+        manifests = pipeline_service.build(instance_name, push_images=True)
         pipeline_service.push(manifests, local=False)
-        PipelineService.run([str(p) for p in manifests], extra_params=params, sync=sync)
+        if not PipelineService.run([str(p) for p in manifests], extra_params=params, sync=sync):
+            raise typer.Exit(1)
 
     @staticmethod
     def run_manifest(
@@ -91,7 +99,8 @@ class PipelinePlugin(BasePlugin):
         params: Path = typer.Option("params.yaml", "--params", "-p", help="Path to the params file in yaml format"),
         sync: bool = typer.Option(False, "--sync", "-s", help="Runs the pipeline in sync mode"),
     ) -> None:
-        PipelineService.run([manifest], extra_params=params, sync=sync)
+        if not PipelineService.run([manifest], extra_params=params, sync=sync):
+            raise typer.Exit(1)
 
     @staticmethod
     def report(
@@ -1,6 +1,7 @@
 import typer
 
 from wanna.cli.plugins.components_plugin import ComponentsPlugin
+from wanna.cli.plugins.docker_plugin import DockerPlugin
 from wanna.cli.plugins.job_plugin import JobPlugin
 from wanna.cli.plugins.notebook_plugin import ManagedNotebookPlugin, NotebookPlugin
 from wanna.cli.plugins.pipeline_plugin import PipelinePlugin
@@ -18,6 +19,7 @@ class PluginRunner:
             ("tensorboard", TensorboardPlugin()),
             ("managed-notebook", ManagedNotebookPlugin()),
             ("components", ComponentsPlugin()),
+            ("docker", DockerPlugin()),
         ]
         for name, subcommand in typers:
             self.app.add_typer(subcommand.app, name=name)
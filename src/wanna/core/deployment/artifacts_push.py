@@ -17,13 +17,23 @@ class ArtifactsPushMixin(IOMixin):
 
         def push_manifests(manifest_artifacts: List[PathArtifact]):
             for artifact in manifest_artifacts:
+                with self._open(artifact.source, "rb") as f:
+                    artifact.unchanged = self.is_unchanged(artifact.destination, f.read())
+                if artifact.unchanged:
+                    logger.user_info(f"{artifact.name} is unchanged at {artifact.destination}")
+                    continue
                 with logger.user_spinner(f"Pushing {artifact.name.lower()} to {artifact.destination}"):
                     self.upload_file(artifact.source, artifact.destination)
 
         def push_json(artifacts: List[JsonArtifact]):
             for artifact in artifacts:
+                body = json.dumps(artifact.json_body)
+                artifact.unchanged = self.is_unchanged(artifact.destination, body.encode())
+                if artifact.unchanged:
+                    logger.user_info(f"{artifact.name} is unchanged at {artifact.destination}")
+                    continue
                 with logger.user_spinner(f"Pushing {artifact.name.lower()} to {artifact.destination}"):
-                    self.write(artifact.destination, json.dumps(artifact.json_body))
+                    self.write(artifact.destination, body)
 
         results: PushResult = []
 
@@ -1,8 +1,13 @@
+import base64
 import contextlib
+import hashlib
 import json
+import os
+import shutil
 from pathlib import Path
 from typing import Any, Dict, Union
 
+import google_crc32c
 from google.cloud.storage import Client
 from smart_open import open as gcs_open
 
@@ -19,7 +24,36 @@ class IOMixin(GCPCredentialsMixIn):
     def upload_file(self, source: str, destination: str):
         with self._open(source, "rb") as f:
             with self._open(destination, "wb") as fout:
-                fout.write(f.read())
+                shutil.copyfileobj(f, fout)
+
+    def exists(self, uri: Union[Path, str]) -> bool:
+        uri = str(uri)
+        if uri.startswith("gs://"):
+            bucket_name, blob_name = uri[len("gs://") :].split("/", 1)
+            return bool(Client(credentials=self.credentials).bucket(bucket_name).blob(blob_name).exists())
+        return os.path.exists(uri)
+
+    def is_unchanged(self, destination: Union[Path, str], content: bytes) -> bool:
+        """
+        True if the destination already holds the content. GCS objects are compared by the MD5 of their
+        metadata, or by the CRC32C for composite objects which have no MD5, without downloading them.
+        """
+        destination = str(destination)
+        if destination.startswith("gs://"):
+            bucket_name, blob_name = destination[len("gs://") :].split("/", 1)
+            blob = Client(credentials=self.credentials).bucket(bucket_name).get_blob(blob_name)
+            if blob is None:
+                return False
+            if blob.md5_hash:
+                return bool(blob.md5_hash == base64.b64encode(hashlib.md5(content).digest()).decode())
+            if blob.crc32c:
+                checksum = google_crc32c.value(content).to_bytes(4, "big")
+                return bool(blob.crc32c == base64.b64encode(checksum).decode())
+            return False
+        if not os.path.isfile(destination):
+            return False
+        with open(destination, "rb") as f:
+            return hashlib.md5(f.read()).digest() == hashlib.md5(content).digest()
 
     def write(self, destination: Union[Path, str], body: str) -> None:
         with self._open(destination, "w") as fout:
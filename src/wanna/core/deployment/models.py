@@ -101,12 +101,16 @@ class JsonArtifact(PushArtifact):
     name: str
     json_body: Dict[Any, Any]
     destination: str
+    # the destination already had the same content, nothing was uploaded
+    unchanged: bool = False
 
 
 class PathArtifact(PushArtifact):
     name: str
     source: str
     destination: str
+    # the destination already had the same content, nothing was uploaded
+    unchanged: bool = False
 
 
 class ContainerArtifact(PushArtifact):
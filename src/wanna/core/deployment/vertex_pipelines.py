@@ -1,6 +1,8 @@
 import atexit
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 from google.cloud.aiplatform import PipelineJob
 from google.cloud.aiplatform.compat.types import pipeline_state_v1 as gca_pipeline_state_v1
@@ -21,6 +23,17 @@ from wanna.core.utils.time import get_timestamp
 
 logger = get_logger(__name__)
 
+# backoff of the polls shared by all the monitored pipeline runs
+PIPELINE_POLL_INITIAL_S = 10.0
+PIPELINE_POLL_MAX_S = 120.0
+PIPELINE_POLL_MULTIPLIER = 1.5
+# states in which a pipeline run does not change anymore, paused runs can still be resumed
+PIPELINE_COMPLETE_STATES = {
+    gca_pipeline_state_v1.PipelineState.PIPELINE_STATE_SUCCEEDED,
+    gca_pipeline_state_v1.PipelineState.PIPELINE_STATE_FAILED,
+    gca_pipeline_state_v1.PipelineState.PIPELINE_STATE_CANCELLED,
+}
+
 
 class VertexPipelinesMixInVertex(VertexSchedulingMixIn, ArtifactsPushMixin):
     @staticmethod
@@ -28,7 +41,8 @@ class VertexPipelinesMixInVertex(VertexSchedulingMixIn, ArtifactsPushMixin):
         @atexit.register
         def stop_pipeline_job():
             if sync and pipeline_job and getattr(pipeline_job._gca_resource, "name", None):
-                if pipeline_job.state != gca_pipeline_state_v1.PipelineState.PIPELINE_STATE_SUCCEEDED:
+                # completed runs, eg. failed ones, have nothing to shut down
+                if pipeline_job.state not in PIPELINE_COMPLETE_STATES:
                     logger.user_error(
                         "detected exit signal, "
                         f"shutting down running pipeline {pipeline_name} "
@@ -37,12 +51,16 @@ class VertexPipelinesMixInVertex(VertexSchedulingMixIn, ArtifactsPushMixin):
                     pipeline_job.wait()
                     pipeline_job.cancel()
 
-    def run_pipeline(
+    def submit_pipeline(
         self,
         resource: PipelineResource,
         extra_params: Optional[Path],
         sync: bool = True,
-    ) -> None:
+    ) -> PipelineJob:
+        """
+        Submits a run of the pipeline without waiting for it, see wait_for_pipelines.
+        In sync mode, the run is cancelled when wanna exits before it completes.
+        """
         mode = "sync mode" if sync else "fire-forget mode"
 
         logger.user_info(f"Running pipeline {resource.pipeline_name} in {mode}")
@@ -77,7 +95,76 @@ class VertexPipelinesMixInVertex(VertexSchedulingMixIn, ArtifactsPushMixin):
 
         if sync:
             logger.user_info(f"Pipeline dashboard at {pipeline_job._dashboard_uri()}.")
-            pipeline_job.wait()
+        return pipeline_job
+
+    def wait_for_pipelines(
+        self, pipeline_jobs: List[PipelineJob], submitted_at: datetime
+    ) -> List[gca_pipeline_state_v1.PipelineState]:
+        """
+        Polls the submitted pipeline runs until all of them complete and prints their status table
+        whenever a state changes. Every poll lists the runs of a project and location in one call,
+        the polls back off exponentially with one delay shared by all the runs.
+
+        Args:
+            pipeline_jobs: submitted pipeline runs
+            submitted_at: utc time before the first submission, only runs created since are listed
+
+        Returns:
+            final states of the runs
+        """
+        # tolerate a skew between the local and the server clock
+        since = (submitted_at - timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        states = {job.resource_name: job.gca_resource.state for job in pipeline_jobs}
+        started = time.monotonic()
+        delay = PIPELINE_POLL_INITIAL_S
+        self._echo_pipeline_states(pipeline_jobs, states, 0)
+        while any(state not in PIPELINE_COMPLETE_STATES for state in states.values()):
+            time.sleep(delay)
+            delay = min(delay * PIPELINE_POLL_MULTIPLIER, PIPELINE_POLL_MAX_S)
+            if self._poll_pipeline_states(pipeline_jobs, states, since):
+                self._echo_pipeline_states(pipeline_jobs, states, time.monotonic() - started)
+        return [states[job.resource_name] for job in pipeline_jobs]
+
+    @staticmethod
+    def _poll_pipeline_states(
+        pipeline_jobs: List[PipelineJob], states: Dict[str, gca_pipeline_state_v1.PipelineState], since: str
+    ) -> bool:
+        """
+        Updates the states of the runs which have not completed yet, returns True if any of them changed.
+        Runs missing in the list, eg. just after the submission, are fetched one by one.
+        """
+        pending = [job for job in pipeline_jobs if states[job.resource_name] not in PIPELINE_COMPLETE_STATES]
+        groups: Dict[Tuple[str, str], List[PipelineJob]] = {}
+        for job in pending:
+            groups.setdefault((job.project, job.location), []).append(job)
+        listed: Dict[str, gca_pipeline_state_v1.PipelineState] = {}
+        for project, location in groups:
+            for listed_job in PipelineJob.list(filter=f'create_time>="{since}"', project=project, location=location):
+                listed[listed_job.resource_name] = listed_job.gca_resource.state
+        changed = False
+        for job in pending:
+            state = listed[job.resource_name] if job.resource_name in listed else job.state
+            if state is not None and state != states[job.resource_name]:
+                states[job.resource_name] = state
+                changed = True
+        return changed
+
+    @staticmethod
+    def _echo_pipeline_states(
+        pipeline_jobs: List[PipelineJob], states: Dict[str, gca_pipeline_state_v1.PipelineState], elapsed_s: float
+    ) -> None:
+        rows = [("pipeline", "run", "state")] + [
+            (
+                job.display_name,
+                job.resource_name.split("/")[-1],
+                states[job.resource_name].name.replace("PIPELINE_STATE_", ""),
+            )
+            for job in pipeline_jobs
+        ]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        minutes, seconds = divmod(int(elapsed_s), 60)
+        lines = ["  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in rows]
+        logger.user_info(text="\n".join([f"Pipeline runs after {minutes}m{seconds:02d}s"] + lines))
 
     def deploy_pipeline(
         self, resource: PipelineResource, pipeline_paths: PipelinePaths, version: str, env: str
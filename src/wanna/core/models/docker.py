@@ -1,14 +1,30 @@
 import sys
+from datetime import datetime
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 if sys.version_info >= (3, 8):
     from typing import Literal
 else:
     from typing_extensions import Literal
 
-from pydantic import BaseModel, Extra, Field
+from pydantic import BaseModel, Extra, Field, root_validator
+
+
+class DockerCacheType(str, Enum):
+    registry = "registry"
+    local = "local"
+    inline = "inline"
+
+
+class DockerBuildCacheModel(BaseModel, extra=Extra.forbid):
+    type: DockerCacheType
+    # registry cache ref, defaults to {image}:buildcache
+    ref: Optional[str]
+    # local cache directory, defaults to build/docker/cache/{image name}
+    dir: Optional[Path]
+    mode: Literal["min", "max"] = "max"
 
 
 class DockerBuildConfigModel(BaseModel, extra=Extra.forbid):
@@ -21,6 +37,47 @@ class DockerBuildConfigModel(BaseModel, extra=Extra.forbid):
     secrets: Union[str, List[str]] = []
     ssh: Optional[str]
     target: Optional[str]
+    builder: Optional[str]
+    cache_from: Union[str, Dict[str, str], List[Dict[str, str]], None]
+    cache_to: Union[str, Dict[str, str], None]
+    # cache_from and cache_to derived from the image tags, explicit cache_from / cache_to take precedence
+    build_cache: Optional[DockerBuildCacheModel]
+
+
+class CloudBuildMachineType(str, Enum):
+    N1_HIGHCPU_8 = "N1_HIGHCPU_8"
+    N1_HIGHCPU_32 = "N1_HIGHCPU_32"
+    E2_HIGHCPU_8 = "E2_HIGHCPU_8"
+    E2_HIGHCPU_32 = "E2_HIGHCPU_32"
+
+
+class CloudBuildOptionsModel(BaseModel, extra=Extra.forbid):
+    # unset options fall back to the docker section options and then to the Cloud Build defaults
+    machine_type: Optional[CloudBuildMachineType]
+    disk_size_gb: Optional[int] = Field(default=None, ge=1, le=4000)
+    # private pool name in the gcp_profile project and region or the full projects/.../workerPools/... name
+    worker_pool: Optional[str]
+    timeout_s: Optional[int] = Field(default=None, ge=1)
+
+    @root_validator
+    def validate_worker_pool(  # pylint: disable=no-self-argument,no-self-use
+        cls, values: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        if values.get("worker_pool") and (values.get("machine_type") or values.get("disk_size_gb")):
+            raise ValueError("machine_type and disk_size_gb of a private worker pool are set on the pool itself")
+        return values
+
+    def merge(self, override: Optional["CloudBuildOptionsModel"]) -> "CloudBuildOptionsModel":
+        """
+        Options of this model updated with the options set in override.
+        A worker pool set in override replaces the machine type and the disk size of this model.
+        """
+        if not override:
+            return self
+        update = override.dict(exclude_none=True)
+        if override.worker_pool:
+            update.update(machine_type=None, disk_size_gb=None)
+        return self.copy(update=update)
 
 
 class ImageBuildType(str, Enum):
@@ -38,6 +95,7 @@ class LocalBuildImageModel(BaseDockerImageModel):
     build_args: Optional[Dict[str, str]]
     context_dir: Path
     dockerfile: Path
+    cloud_build_options: Optional[CloudBuildOptionsModel]
 
 
 class ProvidedImageModel(BaseDockerImageModel):
@@ -50,19 +108,151 @@ class NotebookReadyImageModel(BaseDockerImageModel):
     build_args: Optional[Dict[str, str]]
     base_image: str = "gcr.io/deeplearning-platform-release/base-cpu"
     requirements_txt: Path
+    # BuildKit cache mount of the pip cache, downloads and built wheels are reused between builds,
+    # opt-in as the rendered Dockerfile then needs BuildKit
+    pip_cache: bool = False
+    # local directory with wheels of the requirements built in the base image, one <requirement hash> dir each
+    wheelhouse: Optional[Path]
+    cloud_build_options: Optional[CloudBuildOptionsModel]
 
 
 DockerImageModel = Union[LocalBuildImageModel, ProvidedImageModel, NotebookReadyImageModel]
 
 
+class ContextCompression(str, Enum):
+    gzip = "gzip"
+    zstd = "zstd"
+    none = "none"
+
+
+class ContextHashFunction(str, Enum):
+    sha256 = "sha256"
+    xxh3 = "xxh3"
+    blake3 = "blake3"
+
+
+class DockerLocalRetentionModel(BaseModel, extra=Extra.forbid):
+    # local versions of every image to keep, the most recently built or used ones
+    keep_versions: int = Field(default=3, ge=1)
+    # budget of all the local images of the project, least recently used images are removed above it
+    max_size_gb: Optional[float] = Field(default=None, gt=0)
+    # remove the old images after every local build
+    gc_after_build: bool = True
+    # also prune all dangling images of the docker host, including the ones of other projects
+    prune_dangling: bool = False
+
+
 class DockerModel(BaseModel, extra=Extra.forbid, validate_assignment=True):
     images: List[DockerImageModel] = []
     repository: str
     registry: Optional[str] = None
     cloud_build: bool = False
+    cloud_build_stream_context: bool = False
+    cloud_build_context_compression: ContextCompression = ContextCompression.gzip
+    cloud_build_batch: bool = False
+    cloud_build_options: CloudBuildOptionsModel = CloudBuildOptionsModel()
+    remote_cache: bool = False
+    pin_digests: bool = False
+    build_telemetry: bool = False
+    bake: bool = False
+    build_workers: int = Field(default=4, ge=1)
+    # build the pinned requirements shared by notebook ready images with the same base image once
+    notebook_common_base: bool = False
+    push_workers: int = Field(default=2, ge=1)
+    context_hash_function: ContextHashFunction = ContextHashFunction.sha256
+    local_retention: Optional[DockerLocalRetentionModel] = None
+
+
+class DockerBuildStateModel(BaseModel, extra=Extra.forbid):
+    name: str
+    repository: str
+    context_digest: str
+    dockerfile_digest: str
+    # canonical json of the build configuration
+    build_args: str
+    tags: List[str] = []
+    pushed_digest: Optional[str] = None
+    build_duration_s: Optional[float] = None
+    # not set for images only tagged in the registry from the remote cache, they are not in the local docker
+    built_at: Optional[datetime] = None
+    pushed_at: Optional[datetime] = None
+
+    def stale_reason(self, previous: Optional["DockerBuildStateModel"]) -> Optional[str]:
+        """
+        Compares the current state of the image inputs with the last recorded build.
+
+        Returns:
+            why the image needs to be built or None when the last build is up to date
+        """
+        if not previous or not (previous.built_at or previous.pushed_digest):
+            return "never built"
+        if previous.context_digest != self.context_digest:
+            return "context changed"
+        if previous.dockerfile_digest != self.dockerfile_digest:
+            return "Dockerfile changed"
+        if previous.build_args != self.build_args:
+            return "build args changed"
+        return None
+
+
+class ImageBuildJobModel(BaseModel, extra=Extra.forbid):
+    docker_image_ref: str
+    context_dir: Path
+    dockerfile: Path
+    tags: List[str]
+    state: DockerBuildStateModel
+    build_args: Dict[str, Any] = {}
+    cloud_build_options: CloudBuildOptionsModel = CloudBuildOptionsModel()
+    # images built in the same batch this image is built FROM, name -> tag
+    depends_on: Dict[str, str] = {}
 
 
 class DockerBuildResult(BaseModel, extra=Extra.forbid):
     name: str
     tags: List[str]
     build_type: ImageBuildType
+    digest: Optional[str] = None
+
+
+class DockerBuildStepReport(BaseModel, extra=Extra.forbid):
+    name: str
+    # None when the builder does not tell (GCP Cloud Build steps)
+    cached: Optional[bool] = None
+    duration_s: Optional[float] = None
+
+
+class DockerfileFindingModel(BaseModel, extra=Extra.forbid):
+    line: int
+    rule: str
+    message: str
+    # reordered instructions fixing the finding
+    suggestion: Optional[str] = None
+
+
+class DockerfileLintReport(BaseModel, extra=Extra.forbid):
+    name: str
+    dockerfile: Path
+    findings: List[DockerfileFindingModel] = []
+    instructions: int = 0
+    # instructions (and RUN instructions) rebuilt after a change of a source file in the build context
+    invalidated: int = 0
+    invalidated_runs: int = 0
+    invalidated_from_line: Optional[int] = None
+    # duration of the invalidated instructions in the last recorded build telemetry
+    rebuild_duration_s: Optional[float] = None
+
+
+class DockerImageBuildReport(BaseModel, extra=Extra.forbid):
+    name: str
+    status: Literal["built", "cloud_build", "skipped", "remote_cache", "provided"]
+    tag: Optional[str] = None
+    build_duration_s: Optional[float] = None
+    push_duration_s: Optional[float] = None
+    steps: List[DockerBuildStepReport] = []
+    layer_sizes: List[int] = []
+    image_size: Optional[int] = None
+
+    @property
+    def cache_hit_ratio(self) -> Optional[float]:
+        known = [step for step in self.steps if step.cached is not None]
+        return sum(step.cached for step in known) / len(known) if known else None  # type: ignore
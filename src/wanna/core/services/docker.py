@@ -1,21 +1,43 @@
+import contextlib
+import hashlib
+import json
 import os
+import re
 import shutil
+import tempfile
+import textwrap
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
 
-from caseconverter import kebabcase
-from checksumdir import dirhash
+import requests
+import typer
 from google.cloud.devtools import cloudbuild_v1
 from google.cloud.devtools.cloudbuild_v1.services.cloud_build import CloudBuildClient
-from google.cloud.devtools.cloudbuild_v1.types import Build, BuildStep, Source, StorageSource
+from google.cloud.devtools.cloudbuild_v1.types import Build, BuildOptions, BuildStep, Source, StorageSource, TimeSpan
 from google.protobuf.duration_pb2 import Duration  # pylint: disable=no-name-in-module
+from pydantic import ValidationError
 from python_on_whales import Image, docker
+from python_on_whales.exceptions import DockerException
+from python_on_whales.utils import run
 
+from wanna.core.deployment.io import IOMixin
 from wanna.core.loggers.wanna_logger import get_logger
 from wanna.core.models.docker import (
+    ContextCompression,
     DockerBuildConfigModel,
+    DockerBuildStateModel,
+    DockerBuildStepReport,
+    DockerCacheType,
+    DockerfileLintReport,
+    DockerImageBuildReport,
     DockerImageModel,
+    DockerLocalRetentionModel,
     DockerModel,
+    ImageBuildJobModel,
     ImageBuildType,
     LocalBuildImageModel,
     NotebookReadyImageModel,
@@ -23,9 +45,24 @@ from wanna.core.models.docker import (
 )
 from wanna.core.models.gcp_profile import GCPProfileModel
 from wanna.core.utils import loaders
+from wanna.core.utils.archive import ARCHIVE_SUFFIXES, context_key, write_tarfile
+from wanna.core.utils.build_state import BuildStateStore
+from wanna.core.utils.buildkit import parse_plain_progress
 from wanna.core.utils.credentials import get_credentials
-from wanna.core.utils.gcp import make_tarfile, upload_file_to_gcs
+from wanna.core.utils.dockerfile_lint import lint_dockerfile
+from wanna.core.utils.dockerignore import DOCKERIGNORE_FILENAME, DockerIgnore
+from wanna.core.utils.gcp import make_tarfile
+from wanna.core.utils.hashing import dirhash, hash_file
+from wanna.core.utils.registry import RegistryClient, parse_image_ref
+from wanna.core.utils.requirements import common_requirements, remove_requirements
 from wanna.core.utils.templates import render_template
+from wanna.core.utils.wheelhouse import (
+    WHEELHOUSE_MOUNT,
+    collect_wheels,
+    missing_requirements,
+    requirement_keys,
+    wheel_script,
+)
 
 logger = get_logger(__name__)
 
@@ -34,7 +71,45 @@ class DockerClientException(Exception):
     pass
 
 
-class DockerService:
+def _env_override(docker_model: DockerModel, field_name: str, env_name: str) -> Any:
+    """
+    Value of the docker model field overridden by the env variable, validated like the field itself.
+    """
+    value = os.getenv(env_name)
+    if value is None:
+        return getattr(docker_model, field_name)
+    validated, errors = DockerModel.__fields__[field_name].validate(value, {}, loc=env_name, cls=DockerModel)
+    if errors:
+        raise ValidationError([errors], DockerModel)
+    return validated
+
+
+def _timespan_seconds(timespan: Optional[TimeSpan]) -> Optional[float]:
+    if not timespan or not timespan.start_time or not timespan.end_time:
+        return None
+    return float((timespan.end_time - timespan.start_time).total_seconds())
+
+
+def _echo_table(rows: Sequence[Tuple[str, ...]]) -> None:
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        typer.echo("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def _seconds(value: Optional[float]) -> str:
+    return f"{value:.1f}s" if value is not None else "-"
+
+
+def digest_ref(tag: str, digest: str) -> str:
+    """
+    Replaces the tag of the image reference with the digest, eg. repo/image:v1 -> repo/image@sha256:...
+    """
+    name, _, version = tag.rpartition(":")
+    repository = name if name and "/" not in version else tag
+    return f"{repository.partition('@')[0]}@{digest}"
+
+
+class DockerService(IOMixin):
     def __init__(
         self,
         docker_model: DockerModel,
@@ -43,6 +118,7 @@ class DockerService:
         work_dir: Path,
         wanna_project_name: str,
         quick_mode: bool = False,  # just returns tags but does not build
+        pin_digests: bool = True,  # False for consumers that cannot reference images by digest
     ):
         self.image_models = docker_model.images
         self.image_store: Dict[str, Tuple[DockerImageModel, Optional[Image], str]] = {}
@@ -66,11 +142,95 @@ class DockerService:
         self.build_config = self._read_build_config(self.docker_build_config_path)
         self.cloud_build = os.getenv("WANNA_DOCKER_BUILD_IN_CLOUD", docker_model.cloud_build)
         self.bucket = gcp_profile.bucket
+        self.context_store = f"gs://{self.bucket}/build/docker/contexts"
         self.quick_mode = quick_mode
-        assert self.cloud_build or self._is_docker_client_active(), DockerClientException(
+        self.cloud_build_stream_context = docker_model.cloud_build_stream_context
+        self.cloud_build_context_compression = docker_model.cloud_build_context_compression
+        self.cloud_build_batch = docker_model.cloud_build_batch
+        self.cloud_build_options = docker_model.cloud_build_options
+        self.bake = docker_model.bake
+        # images collected by build_images to be built together in one Cloud Build or buildx bake
+        self._build_queue: Optional[List[ImageBuildJobModel]] = None
+        self.remote_cache = docker_model.remote_cache
+        self.registry_client = RegistryClient(credentials=get_credentials())
+        # manifest digests of the images resolved in the registry
+        self.image_digests: Dict[str, str] = {}
+        self.pin_digests = docker_model.pin_digests and pin_digests
+        self.build_telemetry = docker_model.build_telemetry
+        self.build_reports: Dict[str, DockerImageBuildReport] = {}
+        # tags that already live in the registry (remote cache hits) and the cache tags to add after a push
+        self._remote_tags: Set[str] = set()
+        self._pending_cache_tags: Dict[str, str] = {}
+        # docker image ref of every tag prepared by this service, to find the build state of pushed tags
+        self._tag_refs: Dict[str, str] = {}
+        self._wheelhouse_lock = threading.Lock()
+        self.context_hash_function = docker_model.context_hash_function
+        self.push_workers: int = _env_override(docker_model, "push_workers", "WANNA_DOCKER_PUSH_WORKERS")
+        # background pushes of the images built by build_images(push=True), keyed by tag
+        self._push_executor: Optional[ThreadPoolExecutor] = None
+        self._pushes: Dict[str, "Future[None]"] = {}
+        # set by build_images(push=True), digests of locally built images are resolved only when they can be pushed
+        self._push_requested = False
+        self._pushed_tags: Set[str] = set()
+        self.build_workers: int = _env_override(docker_model, "build_workers", "WANNA_DOCKER_BUILD_WORKERS")
+        self.local_retention = docker_model.local_retention
+        # notebook ready images built FROM a common image with their shared requirements, by image name,
+        # and the requirements of every common image
+        self._common_bases: Dict[str, NotebookReadyImageModel] = {}
+        self._common_requirements: Dict[str, List[str]] = {}
+        if docker_model.notebook_common_base:
+            self._add_common_base_images()
+        assert self.cloud_build or self.quick_mode or self._is_docker_client_active(), DockerClientException(
             "You need running docker client on your machine to use WANNA cli with local docker build"
         )
 
+    def _add_common_base_images(self) -> None:
+        """
+        Finds notebook ready images with the same base image and pinned requirements in common
+        and adds a common image with these requirements installed for every such group.
+        The images of the group are then built FROM the common image and install only their own requirements.
+        """
+        groups: Dict[str, List[NotebookReadyImageModel]] = {}
+        for docker_image_model in self.image_models:
+            if isinstance(docker_image_model, NotebookReadyImageModel):
+                groups.setdefault(docker_image_model.base_image, []).append(docker_image_model)
+        for base_image, models in groups.items():
+            if len(models) < 2:
+                continue
+            requirements = common_requirements([self.work_dir / model.requirements_txt for model in models])
+            if not requirements:
+                continue
+            common_model = NotebookReadyImageModel(
+                name=f"notebook-common-{hashlib.sha256(base_image.encode('utf-8')).hexdigest()[:8]}",
+                build_type=ImageBuildType.notebook_ready_image,
+                base_image=base_image,
+                # not read, the common requirements are written to the build context instead
+                requirements_txt=models[0].requirements_txt,
+                pip_cache=all(model.pip_cache for model in models),
+                wheelhouse=models[0].wheelhouse if len({model.wheelhouse for model in models}) == 1 else None,
+            )
+            self.image_models = self.image_models + [common_model]
+            self._common_requirements[common_model.name] = requirements
+            self._common_bases.update({model.name: common_model for model in models})
+            logger.debug(
+                f"{len(requirements)} requirements of {', '.join(model.name for model in models)} "
+                f"are installed once in {common_model.name}"
+            )
+
+    def _get_common_base_dependency(self, docker_image_ref: str) -> Dict[str, str]:
+        """
+        Common base image the image is built FROM, as {name: tag}.
+        """
+        common_model = self._common_bases.get(docker_image_ref)
+        return {common_model.name: self._get_image_tags(common_model)[0]} if common_model else {}
+
+    @property
+    def build_state(self) -> BuildStateStore:
+        """
+        Local database with the last build and push of every image, build/docker/build-state.db.
+        """
+        return BuildStateStore(self.build_dir / "build-state.db")
+
     def _read_build_config(self, config_path: Union[Path, str]) -> Union[DockerBuildConfigModel, None]:
         """
         Reads the DockerBuildConfig from local file.
@@ -104,35 +264,277 @@ class DockerService:
         self, context_dir, file_path: Path, tags: List[str], docker_image_ref: str, **build_args
     ) -> Union[Image, None]:
 
-        should_build = self._should_build_by_context_dir_checksum(self.build_dir / docker_image_ref, context_dir)
+        if self.quick_mode:
+            logger.user_info(
+                text=f"Skipping build for context_dir={context_dir}, dockerfile={file_path} and image {tags[0]}"
+            )
+            return None
+
+        self._tag_refs.update({tag: docker_image_ref for tag in tags})
+        state = self._get_build_state(docker_image_ref, context_dir, file_path, tags, build_args)
+        previous = self.build_state.get(docker_image_ref, self.docker_repository)
+        stale_reason = state.stale_reason(previous)
+        if previous and not previous.built_at and not stale_reason and not set(tags).issubset(previous.tags):
+            # only in the registry from the remote cache, the new tags are added by the remote cache lookup
+            stale_reason = "not tagged in the registry"
+        should_build = stale_reason is not None
+        if should_build:
+            logger.debug(f"Docker image {docker_image_ref} needs a build: {stale_reason}")
+
+        cache_tag = None
+        if should_build and self.remote_cache:
+            cache_tag = self._get_cache_tag(tags[0], state, context_dir, file_path)
+            if self._tag_from_remote_cache(cache_tag, tags):
+                logger.user_info(text=f"Found {docker_image_ref} docker image in remote cache as {cache_tag}")
+                # the image is only in the registry, it is recorded as pushed and not as a local build
+                self.build_state.save(
+                    state.copy(
+                        update={
+                            "pushed_digest": self.registry_client.get_digest(tags[0]),
+                            "pushed_at": datetime.now(),
+                        }
+                    )
+                )
+                self._report(docker_image_ref, status="remote_cache", tag=tags[0])
+                return None
 
-        if should_build and not self.quick_mode:
+        if should_build:
             if self.cloud_build:
-                logger.user_info(text=f"Building {docker_image_ref} docker image in GCP Cloud build")
-                self._build_image_on_gcp_cloud_build(
-                    context_dir=context_dir, file_path=file_path, docker_image_ref=docker_image_ref, tags=tags
+                build_job = ImageBuildJobModel(
+                    docker_image_ref=docker_image_ref,
+                    context_dir=context_dir,
+                    dockerfile=file_path,
+                    tags=tags + [cache_tag] if cache_tag else tags,
+                    state=state,
+                    depends_on=self._get_common_base_dependency(docker_image_ref),
+                    cloud_build_options=self.cloud_build_options.merge(
+                        getattr(self.find_image_model_by_name(docker_image_ref), "cloud_build_options", None)
+                    ),
                 )
-                self._write_context_dir_checksum(self.build_dir / docker_image_ref, context_dir)
+                if self._build_queue is not None:
+                    logger.user_info(text=f"Adding {docker_image_ref} docker image to GCP Cloud build batch")
+                    self._build_queue.append(build_job)
+                    return None
+                logger.user_info(text=f"Building {docker_image_ref} docker image in GCP Cloud build")
+                self._build_images_on_gcp_cloud_build([build_job])
                 return None
             else:
+                for key, value in self._get_build_cache_args(docker_image_ref, tags).items():
+                    build_args[key] = build_args.get(key) or value
+                if self._build_queue is not None:
+                    logger.user_info(text=f"Adding {docker_image_ref} docker image to buildx bake plan")
+                    self._build_queue.append(
+                        ImageBuildJobModel(
+                            docker_image_ref=docker_image_ref,
+                            context_dir=context_dir,
+                            dockerfile=file_path,
+                            tags=tags,
+                            state=state,
+                            build_args=build_args,
+                            depends_on=self._get_common_base_dependency(docker_image_ref),
+                        )
+                    )
+                    if cache_tag:
+                        self._pending_cache_tags.update({tag: cache_tag for tag in tags})
+                    return None
                 logger.user_info(text=f"Building {docker_image_ref} docker image locally with {build_args}")
-                image = docker.build(context_dir, file=file_path, load=True, tags=tags, **build_args)
-                self._write_context_dir_checksum(self.build_dir / docker_image_ref, context_dir)
-                return image  # type: ignore
+                start = time.monotonic()
+                if self.build_telemetry:
+                    image = self._build_image_with_telemetry(context_dir, file_path, tags, docker_image_ref, build_args)
+                else:
+                    image = docker.build(  # type: ignore
+                        context_dir, file=file_path, load=True, tags=tags, **build_args
+                    )
+                duration = time.monotonic() - start
+                self._report(docker_image_ref, status="built", tag=tags[0], build_duration_s=duration)
+                self._record_build(state, duration)
+                if cache_tag:
+                    # the cache tag is added in the registry once the image is pushed
+                    self._pending_cache_tags.update({tag: cache_tag for tag in tags})
+                return image
         else:
             logger.user_info(
                 text=f"Skipping build for context_dir={context_dir}, dockerfile={file_path} and image {tags[0]}"
             )
+            if previous and not previous.built_at:
+                # tagged from the remote cache by a previous run, there is no local image to push
+                self._remote_tags.update(tags)
+            self._report(docker_image_ref, status="skipped", tag=tags[0])
             return None
 
-    def _pull_image(self, image_url: str) -> Union[Image, None]:
-        if self.cloud_build or self.quick_mode:
-            # TODO: verify that images exists remotely but dont pull them to local
-            return None
+    def _build_image_with_telemetry(
+        self, context_dir: Path, file_path: Path, tags: List[str], docker_image_ref: str, build_args: Dict[str, Any]
+    ) -> Image:
+        """
+        Local build with plain BuildKit progress parsed into step timings and the layer sizes of the result.
+        """
+        logs = docker.build(
+            context_dir, file=file_path, load=True, tags=tags, progress="plain", stream_logs=True, **build_args
+        )
+        lines = []
+        for line in logs:  # type: ignore
+            logger.debug(line.rstrip())
+            lines.append(line)
+        image = docker.image.inspect(tags[0])
+        history = run(docker.docker_cmd + ["image", "history", "--human=false", "--format", "{{.Size}}", tags[0]])
+        self._report(
+            docker_image_ref,
+            steps=parse_plain_progress(lines),
+            layer_sizes=[int(size) for size in str(history or "").split()],
+            image_size=image.size,
+        )
+        return image
+
+    def _report(self, docker_image_ref: str, **fields: Any) -> None:
+        """
+        Records build telemetry of the image, if enabled.
+        """
+        if not self.build_telemetry:
+            return
+        report = self.build_reports.get(docker_image_ref) or DockerImageBuildReport(
+            name=docker_image_ref, status=fields.pop("status", "built")
+        )
+        self.build_reports[docker_image_ref] = report.copy(update=fields)
+
+    def write_build_report(self) -> None:
+        """
+        Writes the build telemetry of all images of the command to build/docker/build-report.json
+        and prints the summary table. Does nothing if build_telemetry is not enabled.
+        """
+        if not self.build_telemetry or not self.build_reports:
+            return
+        os.makedirs(self.build_dir, exist_ok=True)
+        report_path = self.build_dir / "build-report.json"
+        with open(report_path, "w") as f:
+            json.dump(
+                [
+                    {**report.dict(), "cache_hit_ratio": report.cache_hit_ratio}
+                    for report in self.build_reports.values()
+                ],
+                f,
+                indent=2,
+            )
+
+        rows = [("image", "status", "build", "push", "steps", "cached", "size")]
+        for report in self.build_reports.values():
+            cached = report.cache_hit_ratio
+            rows.append(
+                (
+                    report.name,
+                    report.status,
+                    _seconds(report.build_duration_s),
+                    _seconds(report.push_duration_s),
+                    str(len(report.steps)) if report.steps else "-",
+                    f"{cached:.0%}" if cached is not None else "-",
+                    f"{report.image_size / 1024**2:.0f}MB" if report.image_size else "-",
+                )
+            )
+        logger.user_info(text=f"Docker build report written to {report_path}")
+        _echo_table(rows)
+
+    def _get_build_cache_args(self, docker_image_ref: str, tags: List[str]) -> Dict[str, Dict[str, str]]:
+        """
+        BuildKit cache_from / cache_to arguments of a local build derived from the build_cache
+        settings and the image tags.
+
+        Args:
+            docker_image_ref: name of the docker image
+            tags: image tags as constructed by construct_image_tag
+
+        Returns:
+            dict with cache_from and cache_to, empty if build_cache is not set
+        """
+        build_cache = self.build_config.build_cache if self.build_config else None
+        if not build_cache:
+            return {}
+        image = tags[0].rpartition(":")[0]
+        if build_cache.type == DockerCacheType.registry:
+            ref = build_cache.ref or f"{image}:buildcache"
+            return {
+                "cache_from": {"type": "registry", "ref": ref},
+                "cache_to": {"type": "registry", "ref": ref, "mode": build_cache.mode},
+            }
+        elif build_cache.type == DockerCacheType.local:
+            cache_dir = str(
+                self.work_dir / build_cache.dir if build_cache.dir else self.build_dir / "cache" / docker_image_ref
+            )
+            return {
+                "cache_from": {"type": "local", "src": cache_dir},
+                "cache_to": {"type": "local", "dest": cache_dir, "mode": build_cache.mode},
+            }
         else:
-            with logger.user_spinner("Pulling image locally"):
-                image = docker.pull(image_url, quiet=True)
-            return image  # type: ignore
+            return {
+                "cache_from": {"type": "registry", "ref": f"{image}:latest"},
+                "cache_to": {"type": "inline"},
+            }
+
+    def _get_cloud_build_cache_args(self, tags: List[str]) -> List[str]:
+        """
+        Cloud Build runs docker with the default driver where registry and local caches cannot be exported,
+        the last pushed image with BuildKit inline cache is used as the cache source instead.
+        """
+        if not (self.build_config and self.build_config.build_cache):
+            return []
+        image = tags[0].rpartition(":")[0]
+        return ["--cache-from", f"{image}:latest", "--build-arg", "BUILDKIT_INLINE_CACHE=1"]
+
+    def _get_cache_tag(self, image_tag: str, state: DockerBuildStateModel, context_dir: Path, file_path: Path) -> str:
+        """
+        Remote cache tag of the image, ie. the image name tagged with ctx-<digest> where the digest
+        covers the build context, the Dockerfile and the build configuration. The tag is shared between
+        machines, so the context is keyed exactly as docker sends it: paths, modes and contents of all
+        files not excluded by the .dockerignore.
+        """
+        key = context_key(
+            context_dir,
+            self._get_dockerignore(context_dir, [file_path]),
+            ContextCompression.none,
+            index_path=self._index_path(state.name, "cache"),
+        )
+        hasher = hashlib.sha256(key.encode("utf-8"))
+        hasher.update(state.dockerfile_digest.encode("utf-8"))
+        hasher.update(state.build_args.encode("utf-8"))
+        return f"{image_tag.rpartition(':')[0]}:ctx-{hasher.hexdigest()}"
+
+    def _tag_from_remote_cache(self, cache_tag: str, tags: List[str]) -> bool:
+        """
+        Checks if an image with the same context digest is already in the registry
+        and if so, tags it with the version tags directly in the registry.
+
+        Returns:
+            True if the image was found in the remote cache
+        """
+        try:
+            if not self.registry_client.manifest_exists(cache_tag):
+                return False
+            for tag in tags:
+                self.registry_client.add_tag(cache_tag, parse_image_ref(tag)[2])
+        except requests.RequestException as e:
+            logger.user_error(f"Remote docker cache lookup of {cache_tag} failed, building the image: {e}")
+            return False
+        self._remote_tags.update(tags)
+        return True
+
+    def _get_provided_image_digest(self, image_url: str) -> Optional[str]:
+        """
+        Verifies that the provided image exists with a registry manifest lookup, no layers are pulled.
+
+        Args:
+            image_url: full image reference
+
+        Returns:
+            manifest digest of the image, None if it could not be verified
+        """
+        if self.quick_mode:
+            return None
+        try:
+            digest = self.registry_client.get_digest(image_url)
+        except requests.RequestException as e:
+            logger.user_error(f"Could not verify docker image {image_url} in the registry: {e}")
+            return None
+        if not digest:
+            raise ValueError(f"Docker image {image_url} does not exist")
+        return digest
 
     def find_image_model_by_name(self, image_name: str) -> DockerImageModel:
         """
@@ -169,6 +571,115 @@ class DockerService:
             self.image_store.update({docker_image_ref: image})
             return image
 
+    def build_images(self, docker_image_refs: List[str], push: bool = False) -> None:
+        """
+        Prepares all docker images the current command needs up front and caches them in image_store.
+        Independent images are built / pulled in parallel with at most self.build_workers workers,
+        subsequent calls to get_image are then served from image_store.
+        With cloud_build_batch, all images that need a build are built together in one GCP Cloud Build,
+        with bake, all local builds are run by one docker buildx bake invocation.
+        With push, every image starts pushing in the background (at most self.push_workers at once)
+        as soon as it is built, while the next images build. A failed push stops the remaining builds,
+        push_image waits for the background push of the same tags. Every call uses its own push executor,
+        which is shut down when the call returns.
+
+        Args:
+            docker_image_refs: names of the docker images to prepare, duplicates are built only once
+            push: push the locally built images right after their build
+        """
+        common_refs = [self._common_bases[ref].name for ref in docker_image_refs if ref in self._common_bases]
+        refs = [ref for ref in dict.fromkeys(common_refs + docker_image_refs) if ref not in self.image_store]
+        if not refs:
+            return
+
+        self._push_requested = self._push_requested or push
+        if push and not self.cloud_build and not self.quick_mode and not self._push_executor:
+            self._push_executor = ThreadPoolExecutor(max_workers=self.push_workers, thread_name_prefix="docker-push")
+
+        queue_builds = not self.quick_mode and (self.cloud_build_batch if self.cloud_build else self.bake)
+        if queue_builds:
+            self._build_queue = []
+        try:
+            # common base images are prepared first, the images built FROM them then find them in image_store
+            common_refs = [ref for ref in refs if ref in self._common_requirements]
+            if common_refs:
+                self._prepare_images(common_refs)
+            self._prepare_images([ref for ref in refs if ref not in common_refs])
+            if self._build_queue:
+                # images were queued by parallel workers, keep the requested order in the build
+                queue = sorted(self._build_queue, key=lambda image: refs.index(image.docker_image_ref))
+                self._build_queue = None
+                if self.cloud_build:
+                    self._build_images_on_gcp_cloud_build(queue)
+                else:
+                    self._bake_images(queue)
+                for queued in queue:
+                    model, _, tag = self.image_store[queued.docker_image_ref]
+                    image = None if self.cloud_build else docker.image.inspect(queued.tags[0])
+                    if self.pin_digests:
+                        tag = self._pin_digest(queued.docker_image_ref, image, queued.tags)
+                    self.image_store[queued.docker_image_ref] = (model, image, tag)
+                    self._push_in_background(queued.docker_image_ref)
+        finally:
+            self._build_queue = None
+            if self._push_executor:
+                # started pushes finish in the background and push_image waits for them,
+                # the worker threads exit once they are done
+                self._push_executor.shutdown(wait=False)
+                self._push_executor = None
+        if self.local_retention and self.local_retention.gc_after_build and not (self.cloud_build or self.quick_mode):
+            self.gc_images()
+
+    def _prepare_images(self, refs: List[str]) -> None:
+        if not refs:
+            return
+        if self.build_workers == 1 or len(refs) == 1:
+            for ref in refs:
+                self.get_image(docker_image_ref=ref)
+                self._push_in_background(ref)
+                self._raise_push_errors()
+            return
+
+        workers = min(self.build_workers, len(refs))
+        logger.user_info(text=f"Preparing {len(refs)} docker images with {workers} parallel workers")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._get_image, docker_image_ref=ref): ref for ref in refs}
+            for done, future in enumerate(as_completed(futures), start=1):
+                ref = futures[future]
+                try:
+                    image = future.result()
+                    self.image_store.update({ref: image})
+                    self._push_in_background(ref)
+                    self._raise_push_errors()
+                except Exception:
+                    for pending in futures:
+                        pending.cancel()
+                    logger.user_error(f"Preparing docker image {ref} failed")
+                    raise
+                logger.user_success(f"Docker image {ref} ready ({done}/{len(refs)})")
+
+    def _push_in_background(self, docker_image_ref: str) -> None:
+        """
+        Starts the push of a built image on the push executor, if build_images was asked to push.
+        """
+        if not self._push_executor or self._is_provided_image(docker_image_ref):
+            return
+        if docker_image_ref in self._common_requirements:
+            # the layers of common base images are pushed with the images built from them
+            return
+        if self._build_queue is not None and any(i.docker_image_ref == docker_image_ref for i in self._build_queue):
+            # pushed once the queued build finishes
+            return
+        model, image, _ = self.image_store[docker_image_ref]
+        tags = self._get_image_tags(model)
+        future = self._push_executor.submit(self._push, image or tags)
+        self._pushes.update({tag: future for tag in tags})
+
+    def _raise_push_errors(self) -> None:
+        for future in set(self._pushes.values()):
+            if future.done() and future.exception():
+                raise future.exception()  # type: ignore
+
     def _get_image(
         self,
         docker_image_ref: str,
@@ -176,7 +687,7 @@ class DockerService:
         """
         Given the docker_image_ref, this function prepares the image for you.
         Depending on the build_type, it either build the docker image or
-        if you work with provided_image type, it will pull the image to verify the url.
+        if you work with provided_image type, it will look up the image digest in the registry to verify the url.
         Args:
             docker_image_ref:
 
@@ -185,125 +696,713 @@ class DockerService:
         """
         docker_image_model = self.find_image_model_by_name(docker_image_ref)
 
-        build_dir = self.work_dir / Path("build") / "docker" / docker_image_model.name
-        os.makedirs(build_dir, exist_ok=True)
-        build_args = self.build_config.dict() if self.build_config else {}
-
-        if isinstance(docker_image_model, NotebookReadyImageModel):
-            image_name = f"{self.wanna_project_name}/{docker_image_model.name}"
-            tags = self.construct_image_tag(
-                registry=self.docker_registry,
-                project=self.docker_project_id,
-                repository=self.docker_repository,
-                image_name=image_name,
-                versions=[self.version, "latest"],
-                registry_suffix=self.docker_registry_suffix,
-            )
-            template_path = Path("notebook_template.Dockerfile")
-            shutil.copy2(
-                self.work_dir / docker_image_model.requirements_txt,
-                build_dir / "requirements.txt",
-            )
-            file_path = self._jinja_render_dockerfile(docker_image_model, template_path, build_dir=build_dir)
-            context_dir = build_dir
+        if isinstance(docker_image_model, (NotebookReadyImageModel, LocalBuildImageModel)):
+            if docker_image_ref in self._common_bases:
+                self.get_image(self._common_bases[docker_image_ref].name)
+            tags, context_dir, file_path = self._prepare_build_context(docker_image_model)
             image = self._build_image(
-                context_dir, file_path=file_path, tags=tags, docker_image_ref=docker_image_ref, **build_args
-            )
-        elif isinstance(docker_image_model, LocalBuildImageModel):
-            image_name = f"{self.wanna_project_name}/{docker_image_model.name}"
-            tags = self.construct_image_tag(
-                registry=self.docker_registry,
-                project=self.docker_project_id,
-                repository=self.docker_repository,
-                image_name=image_name,
-                versions=[self.version, "latest"],
-                registry_suffix=self.docker_registry_suffix,
-            )
-            file_path = self.work_dir / docker_image_model.dockerfile
-            context_dir = self.work_dir / docker_image_model.context_dir
-            image = self._build_image(
-                context_dir, file_path=file_path, tags=tags, docker_image_ref=docker_image_ref, **build_args
+                context_dir, file_path=file_path, tags=tags, docker_image_ref=docker_image_ref, **self._get_build_args()
             )
+            if not self.cloud_build and not self.quick_mode and not self._remote_tags.issuperset(tags):
+                self.build_state.touch_local_image(tags)
         elif isinstance(docker_image_model, ProvidedImageModel):
-            image = self._pull_image(docker_image_model.image_url)
+            image = None
             tags = [docker_image_model.image_url]
+            digest = self._get_provided_image_digest(docker_image_model.image_url)
+            if digest:
+                self.image_digests[docker_image_ref] = digest
+            self._report(docker_image_ref, status="provided", tag=tags[0])
         else:
             raise Exception("Invalid image model type.")
 
+        if self.pin_digests and not self.quick_mode:
+            return docker_image_model, image, self._pin_digest(docker_image_ref, image, tags)
         return (
             docker_image_model,
             image,
             tags[0],
         )
 
-    def _get_dirhash(self, directory: Path):
-        dockerignore = directory / ".dockerignore"
-        excluded_files = [f"{directory}/component.yaml", f"{directory}/tests/"]
-
-        if dockerignore.exists():
-            with open(dockerignore, "r") as f:
-                lines = f.readlines()
-                new_files = list(map(lambda ignore: f"{directory}/{ignore.rstrip()}", lines))
-                excluded_files += new_files
-
-        excluded_files = list(set(excluded_files))
-        return dirhash(directory, "sha256", excluded_files=excluded_files, excluded_extensions=["pyc", "md"])
-
-    def _should_build_by_context_dir_checksum(self, hash_cache_dir: Path, context_dir: Path) -> bool:
-        cache_file = hash_cache_dir / f"{self.docker_repository}-cache.sha256"
-        sha256hash = self._get_dirhash(context_dir)
-        if cache_file.exists():
-            with open(cache_file, "r") as f:
-                old_hash = f.read()
-                return old_hash != sha256hash
-        else:
-            return True
+    def _get_build_args(self) -> Dict[str, Any]:
+        return self.build_config.dict(exclude={"build_cache"}) if self.build_config else {}
+
+    def _get_image_tags(self, docker_image_model: DockerImageModel) -> List[str]:
+        """
+        Version and latest tags of an image built by WANNA in the registry of the current profile.
+        """
+        return self.construct_image_tag(
+            registry=self.docker_registry,
+            project=self.docker_project_id,
+            repository=self.docker_repository,
+            image_name=f"{self.wanna_project_name}/{docker_image_model.name}",
+            versions=[self.version, "latest"],
+            registry_suffix=self.docker_registry_suffix,
+        )
+
+    def _prepare_build_context(
+        self,
+        docker_image_model: Union[NotebookReadyImageModel, LocalBuildImageModel],
+        build_dir: Optional[Path] = None,
+        build_wheels: bool = True,
+    ) -> Tuple[List[str], Path, Path]:
+        """
+        Tags, build context directory and Dockerfile of an image built by WANNA.
+        Notebook ready images get their requirements and rendered Dockerfile in build/docker/<name>.
+
+        Args:
+            docker_image_model: local build or notebook ready image
+            build_dir: where to generate the context of notebook ready images instead of build/docker/<name>
+            build_wheels: build the missing wheels of notebook ready images with the wheelhouse set
+
+        Returns:
+            (tags, context directory, Dockerfile path)
+        """
+        tags = self._get_image_tags(docker_image_model)
+        if isinstance(docker_image_model, NotebookReadyImageModel):
+            build_dir = build_dir or self.build_dir / docker_image_model.name
+            os.makedirs(build_dir, exist_ok=True)
+            template_path = Path("notebook_template.Dockerfile")
+            common_base = self._common_bases.get(docker_image_model.name)
+            if docker_image_model.name in self._common_requirements:
+                requirements = self._common_requirements[docker_image_model.name]
+                (build_dir / "requirements.txt").write_text("\n".join(requirements) + "\n")
+            elif common_base:
+                requirements = remove_requirements(
+                    self.work_dir / docker_image_model.requirements_txt, self._common_requirements[common_base.name]
+                )
+                (build_dir / "requirements.txt").write_text("\n".join(requirements) + "\n")
+            else:
+                shutil.copy2(
+                    self.work_dir / docker_image_model.requirements_txt,
+                    build_dir / "requirements.txt",
+                )
+            if docker_image_model.wheelhouse and not self.quick_mode:
+                self._prepare_wheelhouse(docker_image_model, build_dir, build_missing=build_wheels)
+            file_path = self._jinja_render_dockerfile(
+                docker_image_model,
+                template_path,
+                build_dir=build_dir,
+                common_base=self._get_image_tags(common_base)[0] if common_base else None,
+                common_requirements=self._common_requirements[common_base.name] if common_base else None,
+            )
+            return tags, build_dir, file_path
+        return tags, self.work_dir / docker_image_model.context_dir, self.work_dir / docker_image_model.dockerfile
+
+    @contextlib.contextmanager
+    def _inspect_build_context(
+        self, docker_image_model: Union[NotebookReadyImageModel, LocalBuildImageModel]
+    ) -> Iterator[Tuple[List[str], Path, Path]]:
+        """
+        Same as _prepare_build_context, for the commands that only inspect the images. The context of
+        notebook ready images is generated in a temporary directory, build/docker/<name> is left as it is
+        and missing wheels are not built.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            yield self._prepare_build_context(
+                docker_image_model, build_dir=Path(tmp_dir) / docker_image_model.name, build_wheels=False
+            )
+
+    def promote_images(self, source: "DockerService", docker_image_refs: Optional[List[str]] = None) -> None:
+        """
+        Copies already built images from the registry of the source profile to the registry of this profile,
+        nothing is built or pulled to the local docker. Provided images are not promoted.
+
+        Args:
+            source: docker service of the profile the images were built with, with the same version
+            docker_image_refs: names of the images to promote, all built images when not set
+        """
+        for docker_image_model in self.image_models:
+            if isinstance(docker_image_model, ProvidedImageModel):
+                continue
+            if docker_image_refs and docker_image_model.name not in docker_image_refs:
+                continue
+            source_tag = source._get_image_tags(docker_image_model)[0]
+            target_tags = self._get_image_tags(docker_image_model)
+            if source_tag == target_tags[0]:
+                logger.user_info(text=f"Docker image {source_tag} is already in the target registry")
+                continue
+            if not self.registry_client.get_digest(source_tag):
+                raise ValueError(f"Docker image {source_tag} was not found in the registry, build and push it first")
+            logger.user_info(text=f"Promoting docker image {source_tag} to {target_tags}")
+            digest = self.registry_client.copy_image(source_tag, target_tags)
+            self.image_digests[docker_image_model.name] = digest
+            logger.user_success(
+                f"Docker image {docker_image_model.name} promoted as {digest_ref(target_tags[0], digest)}"
+            )
+
+    def get_build_status(self) -> List[Tuple[str, str, Optional[DockerBuildStateModel]]]:
+        """
+        Compares the current build context, Dockerfile and build configuration of every image
+        with its last build recorded in the build state, nothing is built or pushed
+        and the build directory is left untouched. The build contexts are hashed in full,
+        without reading or updating the file hash index of the builds.
+
+        Returns:
+            list of (image name, status, last recorded state)
+        """
+        statuses: List[Tuple[str, str, Optional[DockerBuildStateModel]]] = []
+        for docker_image_model in self.image_models:
+            if isinstance(docker_image_model, ProvidedImageModel):
+                statuses.append((docker_image_model.name, "provided", None))
+                continue
+            with self._inspect_build_context(docker_image_model) as (tags, context_dir, file_path):
+                state = self._get_build_state(
+                    docker_image_model.name,
+                    context_dir,
+                    file_path,
+                    tags,
+                    self._get_build_args(),
+                    use_index=False,
+                )
+            previous = self.build_state.get(docker_image_model.name, self.docker_repository)
+            stale_reason = state.stale_reason(previous)
+            status = f"stale ({stale_reason})" if stale_reason else "up to date"
+            if not stale_reason and not previous.pushed_digest:  # type: ignore
+                status = "up to date, not pushed"
+            statuses.append((docker_image_model.name, status, previous))
+        return statuses
+
+    def print_build_status(self) -> None:
+        """
+        Prints the table of images with their build status, last build and last push.
+        """
+        rows = [("image", "status", "built at", "build", "pushed digest", "pushed at")]
+        for name, status, state in self.get_build_status():
+            rows.append(
+                (
+                    name,
+                    status,
+                    state.built_at.strftime("%Y-%m-%d %H:%M:%S") if state and state.built_at else "-",
+                    _seconds(state.build_duration_s) if state else "-",
+                    state.pushed_digest[:19] if state and state.pushed_digest else "-",
+                    state.pushed_at.strftime("%Y-%m-%d %H:%M:%S") if state and state.pushed_at else "-",
+                )
+            )
+        _echo_table(rows)
+
+    def lint_images(self, docker_image_refs: Optional[List[str]] = None) -> List[DockerfileLintReport]:
+        """
+        Analyses the layer cache efficiency of the Dockerfiles of the images built by WANNA,
+        notebook ready images are analysed in their Dockerfile rendered to a temporary directory.
+        Rebuild durations are estimated from the steps in build/docker/build-report.json,
+        if the build telemetry was recorded.
+
+        Args:
+            docker_image_refs: names of the images to analyse, all built images when not set
+
+        Returns:
+            report of every analysed image
+        """
+        steps: Dict[str, List[DockerBuildStepReport]] = {}
+        telemetry_path = self.build_dir / "build-report.json"
+        if telemetry_path.exists():
+            with open(telemetry_path) as f:
+                steps = {
+                    report["name"]: [DockerBuildStepReport(**step) for step in report.get("steps", [])]
+                    for report in json.load(f)
+                }
+        reports = []
+        for docker_image_model in self.image_models:
+            if isinstance(docker_image_model, ProvidedImageModel):
+                continue
+            if docker_image_refs and docker_image_model.name not in docker_image_refs:
+                continue
+            with self._inspect_build_context(docker_image_model) as (_, _, file_path):
+                reports.append(lint_dockerfile(docker_image_model.name, file_path, steps.get(docker_image_model.name)))
+        return reports
+
+    @staticmethod
+    def print_lint_reports(reports: List[DockerfileLintReport]) -> None:
+        """
+        Prints the findings and the source change impact of every image.
+        """
+        for report in reports:
+            typer.echo(f"{report.name} ({report.dockerfile})")
+            for finding in report.findings:
+                typer.echo(f"  line {finding.line} [{finding.rule}] {finding.message}")
+                if finding.suggestion:
+                    typer.echo(textwrap.indent(finding.suggestion, "      "))
+            if report.invalidated_from_line:
+                impact = (
+                    f"  a source change rebuilds {report.invalidated} of {report.instructions} instructions "
+                    f"({report.invalidated_runs} RUN) from line {report.invalidated_from_line}"
+                )
+                if report.rebuild_duration_s is not None:
+                    impact += f", {_seconds(report.rebuild_duration_s)} in the last recorded build"
+                typer.echo(impact)
+            else:
+                typer.echo("  a source change does not invalidate any layer")
+
+    def gc_images(
+        self, retention: Optional[DockerLocalRetentionModel] = None, dry_run: bool = False
+    ) -> List[Tuple[str, List[str], int]]:
+        """
+        Removes old versions of the images of this project from the local docker, dangling images
+        of the whole docker host are pruned only with retention.prune_dangling.
+        Every image keeps its retention.keep_versions most recently built or used versions, then the least
+        recently used versions are removed until all the images fit in retention.max_size_gb.
+        Images prepared by this service are never removed. Sizes count the layers shared by the images
+        for every image, the budget is an upper estimate. Images that docker fails to remove are logged and kept.
 
-    def _write_context_dir_checksum(self, hash_cache_dir: Path, context_dir: Path):
-        os.makedirs(hash_cache_dir, exist_ok=True)
-        cache_file = hash_cache_dir / f"{kebabcase(self.docker_repository)}-cache.sha256"
-        sha256hash = self._get_dirhash(context_dir)
-        with open(cache_file, "w") as f:
-            f.write(sha256hash)
+        Args:
+            retention: retention policy, defaults to the local_retention of the docker section
+            dry_run: only return what would be removed
+
+        Returns:
+            list of the removed (image name, tags, size in bytes)
+        """
+        retention = retention or self.local_retention or DockerLocalRetentionModel()
+        repositories = {
+            self._get_image_tags(model)[0].rsplit(":", 1)[0]: model.name
+            for model in self.image_models
+            if not isinstance(model, ProvidedImageModel)
+        }
+        protected = {
+            tag
+            for model, _, _ in self.image_store.values()
+            if not isinstance(model, ProvidedImageModel)
+            for tag in self._get_image_tags(model)
+        }
+        usage = self.build_state.local_image_usage()
+
+        versions: Dict[str, List[Tuple[datetime, List[str], int]]] = {}
+        for image in docker.image.list():
+            tags = [tag for tag in image.repo_tags if tag.rsplit(":", 1)[0] in repositories]
+            if not tags:
+                continue
+            created = image.created.astimezone().replace(tzinfo=None) if image.created.tzinfo else image.created
+            last_used = max([usage[tag] for tag in tags if tag in usage] or [created])
+            versions.setdefault(repositories[tags[0].rsplit(":", 1)[0]], []).append((last_used, tags, image.size))
+
+        evicted = []
+        kept = []
+        for name, image_versions in versions.items():
+            for i, (last_used, tags, size) in enumerate(sorted(image_versions, key=lambda v: v[0], reverse=True)):
+                if i < retention.keep_versions or protected.intersection(tags):
+                    kept.append((last_used, name, tags, size))
+                else:
+                    evicted.append((name, tags, size))
+        if retention.max_size_gb:
+            budget = retention.max_size_gb * 1024**3
+            total = sum(size for _, _, _, size in kept)
+            for last_used, name, tags, size in sorted(kept, key=lambda v: v[0]):
+                if total <= budget:
+                    break
+                if not protected.intersection(tags):
+                    evicted.append((name, tags, size))
+                    total -= size
+
+        if dry_run:
+            for name, tags, size in evicted:
+                logger.user_info(text=f"Would remove local docker image {name} {tags} ({size / 1024**2:.0f} MB)")
+            return evicted
+
+        removed = []
+        for name, tags, size in evicted:
+            logger.user_info(text=f"Removing local docker image {name} {tags} ({size / 1024**2:.0f} MB)")
+            images: List[Union[str, Image]] = list(tags)
+            try:
+                docker.image.remove(images, prune=True)
+            except DockerException as e:
+                logger.user_error(f"Could not remove local docker image {name} {tags}: {e}")
+                continue
+            self.build_state.forget_local_images(tags)
+            removed.append((name, tags, size))
+        if retention.prune_dangling:
+            docker.image.prune()
+        return removed
+
+    def _pin_digest(self, docker_image_ref: str, image: Optional[Image], tags: List[str]) -> str:
+        """
+        Resolves the image to an immutable repo@sha256:... reference. Locally built images must be pushed
+        to get a registry digest, so they are pushed right away (unless the registry already has them)
+        if build_images was asked to push. Otherwise they are pinned only if the registry already has them,
+        else they are referenced by the tag.
+
+        Args:
+            docker_image_ref: name of the docker image
+            image: locally built image, if any
+            tags: image tags
+
+        Returns:
+            digest reference or the first tag if the digest is not known yet (queued build, image not pushed)
+        """
+        if self._build_queue and any(i.docker_image_ref == docker_image_ref for i in self._build_queue):
+            return tags[0]
+        if docker_image_ref not in self.image_digests:
+            if not self.cloud_build and not self._is_provided_image(docker_image_ref):
+                if self._push_requested:
+                    self.push_image(image or tags)
+                elif not self._is_pushed(tags[:1]):
+                    logger.warning(
+                        f"Docker image {tags[0]} is not in the registry and pushing was not requested, "
+                        "it is referenced by the tag instead of the digest"
+                    )
+                    return tags[0]
+            digest = self.registry_client.get_digest(tags[0])
+            if not digest:
+                raise ValueError(f"Docker image {tags[0]} was not found in the registry")
+            self.image_digests[docker_image_ref] = digest
+        return digest_ref(tags[0], self.image_digests[docker_image_ref])
+
+    def _is_provided_image(self, docker_image_ref: str) -> bool:
+        return isinstance(self.find_image_model_by_name(docker_image_ref), ProvidedImageModel)
 
-    def _build_image_on_gcp_cloud_build(
-        self, context_dir: Path, file_path: Path, tags: List[str], docker_image_ref: str
+    def _prepare_wheelhouse(
+        self, image_model: NotebookReadyImageModel, build_dir: Path, build_missing: bool = True
     ) -> None:
         """
-        Build a docker container in GCP Cloud Build and push the images to registry.
-        Folder context_dir is tarred, uploaded to GCS and then used to building.
+        Builds the wheels of new requirements into the local wheelhouse and copies the wheels
+        of all current requirements to build_dir/wheelhouse, where the Dockerfile mounts them from.
+        Wheels are built in the base image, so they match its platform and python version.
+        Every requirement line is keyed by its hash, only new or changed requirements are fetched or compiled.
 
         Args:
-            context_dir: directory with all necessary files for docker image build
-            file_path: path to Dockerfile
-            tags:
+            image_model: notebook ready image with the wheelhouse set
+            build_dir: docker build context of the image with requirements.txt already copied in
+            build_missing: build the wheels missing in the wheelhouse, otherwise only the existing ones are copied
+        """
+        wheelhouse = (self.work_dir / image_model.wheelhouse).resolve()  # type: ignore
+        keys = requirement_keys(build_dir / "requirements.txt")
+        # images built in parallel can share the wheelhouse
+        with self._wheelhouse_lock:
+            missing = missing_requirements(wheelhouse, keys) if build_missing else {}
+            if missing and self.cloud_build:
+                logger.user_info(
+                    text=f"{len(missing)} requirements of {image_model.name} have no wheels in {wheelhouse}, "
+                    "they are installed from the package index"
+                )
+            elif missing:
+                logger.user_info(text=f"Building wheels of {len(missing)} requirements into {wheelhouse}")
+                os.makedirs(wheelhouse, exist_ok=True)
+                docker.run(
+                    image_model.base_image,
+                    ["sh", "-c", wheel_script(missing)],
+                    volumes=[(wheelhouse, WHEELHOUSE_MOUNT)],
+                    remove=True,
+                )
+            wheels = collect_wheels(wheelhouse, keys, build_dir / "wheelhouse")
+        logger.user_info(text=f"Using {len(wheels)} wheels from the wheelhouse for {image_model.name}")
+
+    def _get_dockerignore(self, context_dir: Path, file_paths: Optional[List[Path]] = None) -> DockerIgnore:
+        """
+        Reads .dockerignore of the context directory. Same as docker CLI, the .dockerignore
+        and the Dockerfiles (if they live in the context) are always part of the context.
+
+        Args:
+            context_dir: docker build context directory
+            file_paths: paths to the Dockerfiles
+
+        Returns:
+            DockerIgnore
+        """
+        keep = [f"!{DOCKERIGNORE_FILENAME}"]
+        for file_path in file_paths or []:
+            dockerfile = os.path.relpath(file_path, context_dir)
+            if not dockerfile.startswith(".."):
+                keep.append(f"!{dockerfile}")
+        return DockerIgnore.from_context_dir(context_dir).extend(keep)
+
+    def _index_path(self, docker_image_ref: str, name: str) -> Path:
+        """
+        File hash index of the image, kept apart from build/docker/<image>/, the build context
+        of notebook ready images, so that writing it does not change the context.
+        """
+        return self.build_dir / ".index" / docker_image_ref / f"{name}-index.json"
+
+    def _get_dirhash(self, directory: Path, index_path: Optional[Path] = None) -> str:
+        ignore = self._get_dockerignore(directory).extend(["component.yaml", "tests", "**/*.pyc", "**/*.md"])
+        # wanna build outputs (manifests, hash indexes) must not change the context hash
+        build_dir = os.path.relpath(self.work_dir / "build", directory)
+        if not build_dir.startswith(".."):
+            ignore.extend([build_dir])
+        return dirhash(directory, self.context_hash_function.value, ignore=ignore, index_path=index_path)
+
+    def _get_build_state(
+        self,
+        docker_image_ref: str,
+        context_dir: Path,
+        file_path: Path,
+        tags: List[str],
+        build_args: Dict[str, Any],
+        use_index: bool = True,
+    ) -> DockerBuildStateModel:
+        """
+        Current state of the image inputs, ie. digests of the build context and the Dockerfile
+        and the build configuration. Compared with the last recorded build to decide if the image is stale.
+        Contexts generated in temporary directories are hashed without the file hash index.
+        """
+        index_path = self._index_path(docker_image_ref, "context") if use_index else None
+        return DockerBuildStateModel(
+            name=docker_image_ref,
+            repository=self.docker_repository,
+            context_digest=self._get_dirhash(context_dir, index_path=index_path),
+            dockerfile_digest=hash_file(str(file_path)),
+            build_args=json.dumps(build_args, sort_keys=True, default=str),
+            tags=tags,
+        )
+
+    def _record_build(self, state: DockerBuildStateModel, duration: Optional[float] = None) -> None:
+        self.build_state.save(state.copy(update={"build_duration_s": duration, "built_at": datetime.now()}))
+
+    def _build_images_on_gcp_cloud_build(self, images: List[ImageBuildJobModel]) -> None:
         """
+        Build docker containers in GCP Cloud Build and push the images to registry.
+        Images with the same cloud_build_options are built in one Cloud Build, builds with different
+        options (eg. a large machine for CUDA images) are started together and run in parallel.
 
-        dockerfile = os.path.relpath(file_path, context_dir)
-        tar_filename = self.work_dir / f"build/docker/{docker_image_ref}.tar.gz"
-        make_tarfile(context_dir, tar_filename)
-        blob_name = os.path.relpath(tar_filename, self.work_dir)
-        blob = upload_file_to_gcs(filename=tar_filename, bucket_name=self.bucket, blob_name=blob_name)
-        tags_args = " ".join([f"-t {t}" for t in tags]).split()
-        steps = BuildStep(name="gcr.io/cloud-builders/docker", args=["build", ".", "-f", dockerfile] + tags_args)
+        Args:
+            images: docker images to build
+        """
+        groups: Dict[str, List[ImageBuildJobModel]] = {}
+        for image in images:
+            groups.setdefault(image.cloud_build_options.json(), []).append(image)
+        operations = []
+        building: Dict[str, Any] = {}
+        for group in groups.values():
+            group_refs = [image.docker_image_ref for image in group]
+            for dependency in {ref for image in group for ref in image.depends_on if ref not in group_refs}:
+                # common base image built with different options must be in the registry first
+                if dependency in building:
+                    building[dependency].result()
+            operation = self._create_cloud_build(group)
+            building.update({ref: operation for ref in group_refs})
+            operations.append((group, operation))
+        for group, operation in operations:
+            result = operation.result()
+            digests = {built.name: built.digest for built in result.results.images}
+            push_timings = {built.name: built.push_timing for built in result.results.images}
+            step_timings = {step.id: step.timing for step in result.steps}
+            for image in group:
+                build_timing = step_timings.get(f"build-{image.docker_image_ref}")
+                self._record_build(image.state, _timespan_seconds(build_timing))
+                if digests.get(image.tags[0]):
+                    self.image_digests[image.docker_image_ref] = digests[image.tags[0]]
+                    self.build_state.record_push(
+                        image.docker_image_ref, self.docker_repository, image.tags, digests[image.tags[0]]
+                    )
+                self._report(
+                    image.docker_image_ref,
+                    status="cloud_build",
+                    tag=image.tags[0],
+                    build_duration_s=_timespan_seconds(build_timing),
+                    push_duration_s=_timespan_seconds(push_timings.get(image.tags[0])),
+                )
+
+    def _create_cloud_build(self, images: List[ImageBuildJobModel]):
+        """
+        Starts one GCP Cloud Build of the images, all of them must have the same cloud_build_options.
+        Every context folder is tarred and uploaded to GCS once, images sharing the same context reuse it.
+        All images are built concurrently on the build worker, each of them waits only for its own context.
+
+        Args:
+            images: docker images to build
 
+        Returns:
+            long-running operation of the build
+        """
+        options = images[0].cloud_build_options
+        refs = [image.docker_image_ref for image in images]
+        contexts: Dict[Path, List[ImageBuildJobModel]] = {}
+        for image in images:
+            contexts.setdefault(image.context_dir, []).append(image)
+
+        source = None
+        steps = []
+        for i, (context_dir, context_images) in enumerate(contexts.items()):
+            target_dir = "." if len(contexts) == 1 else f"context-{i}"
+            context_uri = self._upload_build_context(
+                context_dir, [image.dockerfile for image in context_images], context_images[0].docker_image_ref
+            )
+            context_source, fetch_steps = self._get_cloud_build_source(context_uri, target_dir)
+            source = source or context_source
+            wait_for = ["-"]
+            for fetch_step in fetch_steps:
+                fetch_step.id = f"fetch-context-{i}"
+                fetch_step.wait_for = ["-"]
+                wait_for = [fetch_step.id]
+            steps.extend(fetch_steps)
+            for image in context_images:
+                dockerfile = os.path.relpath(image.dockerfile, context_dir)
+                tags_args = " ".join([f"-t {t}" for t in image.tags]).split()
+                cache_args = self._get_cloud_build_cache_args(image.tags)
+                steps.append(
+                    BuildStep(
+                        name="gcr.io/cloud-builders/docker",
+                        id=f"build-{image.docker_image_ref}",
+                        dir_=target_dir,
+                        # images built FROM a common base image in this build wait for it too
+                        wait_for=wait_for + [f"build-{ref}" for ref in image.depends_on if ref in refs],
+                        # BuildKit is needed for the inline cache and RUN --mount of notebook images
+                        env=["DOCKER_BUILDKIT=1"],
+                        args=["build", ".", "-f", dockerfile] + tags_args + cache_args,
+                    )
+                )
+
+        if len(images) > 1:
+            logger.user_info(text=f"Building {len(images)} docker images in one GCP Cloud build")
         timeout = Duration()
-        timeout.seconds = 7200
+        timeout.seconds = options.timeout_s or 7200
+        build_options = BuildOptions(disk_size_gb=options.disk_size_gb or 0)
+        if options.machine_type:
+            build_options.machine_type = getattr(BuildOptions.MachineType, options.machine_type.value)
+        # builds in a private pool must be created in the region of the pool
+        parent = ""
+        if options.worker_pool:
+            pool = options.worker_pool
+            if "/" not in pool:
+                pool = f"projects/{self.project_id}/locations/{self.location}/workerPools/{pool}"
+            build_options.pool = BuildOptions.PoolOption(name=pool)
+            parent = pool.split("/workerPools/")[0]
         build = Build(
-            source=Source(storage_source=StorageSource(bucket=blob.bucket.name, object_=blob.name)),
-            steps=[steps],
-            images=tags,
+            source=source,
+            steps=steps,
+            images=[tag for image in images for tag in image.tags],
             timeout=timeout,
+            options=build_options,
         )
         # TODO: make sure credentials does come from global scope
         client = CloudBuildClient(credentials=get_credentials())
         request = cloudbuild_v1.CreateBuildRequest(
-            # parent=f"projects/{self.project_id}/locations/{self.location}",
+            parent=parent,
             project_id=self.project_id,
             build=build,
         )
-        res = client.create_build(request=request)
-        res.result()
+        return client.create_build(request=request)
+
+    def _bake_images(self, images: List[ImageBuildJobModel]) -> None:
+        """
+        Build docker images locally with one docker buildx bake invocation.
+        The bake file with one target per image is written to build/docker/docker-bake.json,
+        BuildKit then builds all targets in parallel and builds stages shared between images only once.
+
+        Args:
+            images: docker images to build
+        """
+        targets = {re.sub(r"[^a-zA-Z0-9_-]", "-", image.docker_image_ref): image for image in images}
+        target_names = {image.docker_image_ref: name for name, image in targets.items()}
+        bake_file = self.build_dir / "docker-bake.json"
+        os.makedirs(self.build_dir, exist_ok=True)
+        with open(bake_file, "w") as f:
+            json.dump(
+                {
+                    "group": {"default": {"targets": list(targets)}},
+                    "target": {name: self._get_bake_target(image, target_names) for name, image in targets.items()},
+                },
+                f,
+                indent=2,
+            )
+
+        logger.user_info(text=f"Building {len(images)} docker images locally with buildx bake plan {bake_file}")
+        start = time.monotonic()
+        docker.buildx.bake(
+            targets=list(targets), files=[bake_file], load=True, builder=images[0].build_args.get("builder")
+        )
+        duration = time.monotonic() - start
+        for image in images:
+            self._record_build(image.state, duration)
+            self._report(image.docker_image_ref, status="built", tag=image.tags[0], build_duration_s=duration)
+
+    @staticmethod
+    def _get_bake_target(image: ImageBuildJobModel, target_names: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Translates the docker.build arguments of the image into a bake file target.
+        Common base images built in the same bake are passed to the target as named contexts.
+        """
+
+        def to_csv(value: Union[str, Dict[str, str]]) -> str:
+            return value if isinstance(value, str) else ",".join(f"{key}={val}" for key, val in value.items())
+
+        def to_list(value: Any) -> List[Any]:
+            if not value:
+                return []
+            return value if isinstance(value, list) else [value]
+
+        build_args = image.build_args
+        if build_args.get("add_hosts"):
+            logger.user_error(f"add_hosts is not supported by buildx bake, ignoring it for {image.docker_image_ref}")
+        target = {
+            "context": str(image.context_dir),
+            "dockerfile": str(image.dockerfile),
+            "tags": image.tags,
+            "args": build_args.get("build_args") or {},
+            "labels": build_args.get("labels") or {},
+            "platforms": to_list(build_args.get("platforms")),
+            "secret": to_list(build_args.get("secrets")),
+            "ssh": to_list(build_args.get("ssh")),
+            "cache-from": [to_csv(value) for value in to_list(build_args.get("cache_from"))],
+            "cache-to": [to_csv(value) for value in to_list(build_args.get("cache_to"))],
+            "target": build_args.get("target"),
+            "network": build_args.get("network"),
+            "contexts": {
+                tag: f"target:{target_names[ref]}"
+                for ref, tag in image.depends_on.items()
+                if target_names and ref in target_names
+            },
+        }
+        return {key: value for key, value in target.items() if value not in (None, [], {})}
+
+    def _upload_build_context(self, context_dir: Path, file_paths: List[Path], docker_image_ref: str) -> str:
+        """
+        Tar the build context (respecting .dockerignore) and upload it to the context store.
+        Archives are reproducible and stored under their content hash,
+        the upload is skipped when the same context was already uploaded by anyone before.
+
+        Args:
+            context_dir: directory with all necessary files for docker image build
+            file_paths: paths to Dockerfiles built from this context
+            docker_image_ref: name of the docker image
+
+        Returns:
+            uri of the uploaded build context
+        """
+        compression = self.cloud_build_context_compression
+        ignore = self._get_dockerignore(context_dir, file_paths)
+        key = context_key(context_dir, ignore, compression, index_path=self._index_path(docker_image_ref, "archive"))
+        archive_name = f"{key}{ARCHIVE_SUFFIXES[compression]}"
+        context_uri = f"{self.context_store}/{archive_name}"
+        if self.exists(context_uri):
+            logger.user_info(f"Build context of {docker_image_ref} is already uploaded as {context_uri}")
+        elif self.cloud_build_stream_context:
+            with logger.user_spinner(f"Streaming {docker_image_ref} build context to {context_uri}"):
+                with self._open(context_uri, "wb") as f:
+                    write_tarfile(context_dir, f, ignore=ignore, compression=compression)
+        else:
+            tar_filename = self.build_dir / "contexts" / archive_name
+            make_tarfile(context_dir, tar_filename, ignore=ignore, compression=compression)
+            self.upload_file(str(tar_filename), context_uri)
+        return context_uri
+
+    def _get_cloud_build_source(
+        self, context_uri: str, target_dir: str = "."
+    ) -> Tuple[Optional[Source], List[BuildStep]]:
+        """
+        Cloud Build can fetch only gzipped tar as a build source, other archives are
+        fetched and unpacked by an extra build step.
+
+        Args:
+            context_uri: gs:// uri of the build context archive
+            target_dir: where to unpack the context inside the /workspace
+
+        Returns:
+            build source (None if fetched by a step) and the steps to fetch it
+        """
+        compression = self.cloud_build_context_compression
+        if compression == ContextCompression.gzip and target_dir == ".":
+            bucket_name, blob_name = context_uri[len("gs://") :].split("/", 1)
+            return Source(storage_source=StorageSource(bucket=bucket_name, object_=blob_name)), []
+        decompress = {
+            ContextCompression.gzip: "gzip -dc | ",
+            ContextCompression.zstd: "zstd -dc | ",
+            ContextCompression.none: "",
+        }[compression]
+        install = (
+            "(command -v zstd || (apt-get -qq update && apt-get -qq install -y zstd)) > /dev/null && "
+            if compression == ContextCompression.zstd
+            else ""
+        )
+        script = f"{install}mkdir -p {target_dir} && gsutil cat {context_uri} | {decompress}tar -x -C {target_dir}"
+        return None, [BuildStep(name="gcr.io/cloud-builders/gcloud", entrypoint="bash", args=["-c", script])]
 
     def push_image(self, image_or_tags: Union[Image, List[str]], quiet: bool = False) -> None:
         """
@@ -312,10 +1411,65 @@ class DockerService:
         Args:
             image: image to push
         """
+        tags = image_or_tags.repo_tags if isinstance(image_or_tags, Image) else image_or_tags
+        for future in {self._pushes[tag] for tag in tags if tag in self._pushes}:
+            # the image is being pushed by build_images, errors of the background push are raised here
+            future.result()
+        self._push(image_or_tags, quiet)
+
+    def _push(self, image_or_tags: Union[Image, List[str]], quiet: bool = False) -> None:
         if not self.cloud_build:
             tags = image_or_tags.repo_tags if isinstance(image_or_tags, Image) else image_or_tags
+            # digest references are pinned only once the image is in the registry
+            tags = [tag for tag in tags if "@" not in tag]
+            if (
+                self._remote_tags.union(self._pushed_tags).issuperset(tags)
+                or self._is_pushed_by_state(tags)
+                or (self.pin_digests and self._is_pushed(tags))
+            ):
+                logger.user_info(text=f"Docker image {tags} is already in the registry")
+                return
             logger.user_info(text=f"Pushing docker image {tags}")
+            start = time.monotonic()
             docker.image.push(tags, quiet)
+            self._pushed_tags.update(tags)
+            self._record_push(tags)
+            for ref, report in list(self.build_reports.items()):
+                if report.tag in tags:
+                    self._report(ref, push_duration_s=time.monotonic() - start)
+            for tag in tags:
+                cache_tag = self._pending_cache_tags.pop(tag, None)
+                if cache_tag:
+                    self.registry_client.add_tag(tag, parse_image_ref(cache_tag)[2])
+
+    def _is_pushed_by_state(self, tags: List[str]) -> bool:
+        """
+        Checks in the build state if the local image was already pushed with all the tags, no registry is called.
+        """
+        docker_image_ref = self._tag_refs.get(tags[0]) if tags else None
+        state = self.build_state.get(docker_image_ref, self.docker_repository) if docker_image_ref else None
+        if not state or not state.pushed_digest or not set(tags).issubset(state.tags):
+            return False
+        return digest_ref(tags[0], state.pushed_digest) in docker.image.inspect(tags[0]).repo_digests
+
+    def _record_push(self, tags: List[str]) -> None:
+        docker_image_ref = self._tag_refs.get(tags[0]) if tags else None
+        if not docker_image_ref:
+            return
+        repository = digest_ref(tags[0], "")
+        repo_digests = docker.image.inspect(tags[0]).repo_digests
+        digest = next((d[len(repository) :] for d in repo_digests if d.startswith(repository)), None)
+        self.build_state.record_push(docker_image_ref, self.docker_repository, tags, digest)
+
+    def _is_pushed(self, tags: List[str]) -> bool:
+        """
+        Checks if the registry digest of all tags matches the local image, ie. there is nothing to push.
+        """
+        for tag in tags:
+            remote_digest = self.registry_client.get_digest(tag)
+            if not remote_digest or digest_ref(tag, remote_digest) not in docker.image.inspect(tag).repo_digests:
+                return False
+        return True
 
     def push_image_ref(self, image_ref: str, quiet: bool = False) -> None:
         """
@@ -342,7 +1496,7 @@ class DockerService:
         image_name: str,
         registry_suffix: str,
         versions: List[str] = ["latest"],
-    ):
+    ) -> List[str]:
         """
         Construct full image tag.
         Args:
@@ -363,6 +1517,8 @@ class DockerService:
         image_model: DockerImageModel,
         template_path: Path,
         build_dir: Path,
+        common_base: Optional[str] = None,
+        common_requirements: Optional[List[str]] = None,
     ) -> Path:
         """
         Based on image_model.type, we render dockerfile for this image type.
@@ -370,6 +1526,8 @@ class DockerService:
             image_model: docker image model
             template_path: path to the dockerfile jinja template
             build_dir: build directory (where to save rendered dockerfile)
+            common_base: tag of the common image to build FROM instead of image_model.base_image
+            common_requirements: requirements installed in the common image
 
         Returns:
             path to the rendered dockerfile
@@ -377,8 +1535,16 @@ class DockerService:
         if isinstance(image_model, NotebookReadyImageModel):
             rendered = render_template(
                 source_path=template_path,
-                base_image=image_model.base_image,
+                base_image=common_base or image_model.base_image,
+                # changes the Dockerfile digest when the common image changes, its tag stays the same
+                common_digest=hashlib.sha256(
+                    "\n".join([image_model.base_image] + common_requirements).encode("utf-8")
+                ).hexdigest()
+                if common_base and common_requirements
+                else None,
                 requirements_txt=image_model.requirements_txt,
+                pip_cache=image_model.pip_cache,
+                wheelhouse=bool(image_model.wheelhouse),
             )
         else:
             raise Exception("Invalid docker image type.")
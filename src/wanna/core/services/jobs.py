@@ -78,24 +78,32 @@ class JobService(BaseService[Union[CustomJobModel, TrainingCustomJobModel]]):
         self.build_dir = workdir / "build"
         self.version = version
 
-    def build(self, instance_name: str) -> List[Path]:
+    def build(self, instance_name: str, push_images: bool = False) -> List[Path]:
         """
         Based on wanna config and setup it creates a JobManifest that
         can later be pushed, deployed or run
         Args:
             instance_name: the give job(s) that will be built
                 "all" means it will build all jobs
+            push_images: start pushing the docker images while the remaining images are built
 
         Returns:
             Job Manifests and associated local paths where those were built
         """
         instances = self._filter_instances_by_name(instance_name)
+        self.docker_service.build_images(
+            [docker_image_ref for instance in instances for docker_image_ref in self._get_docker_image_refs(instance)],
+            push=push_images and self.push_mode.can_push_containers(),
+        )
+        self.docker_service.write_build_report()
         return [self._build(instance) for instance in instances]
 
     def push(self, manifests: List[Path], local: bool = False) -> PushResult:
-        return self.connector.push_artifacts(
+        result = self.connector.push_artifacts(
             self.docker_service.push_image, self._prepare_push(manifests, self.version, local)
         )
+        self.docker_service.write_build_report()
+        return result
 
     def _prepare_push(self, manifests: List[Path], version: str, local: bool = False) -> List[PushTask]:
         """
@@ -195,6 +203,25 @@ class JobService(BaseService[Union[CustomJobModel, TrainingCustomJobModel]]):
 
         return self.write_manifest(manifest_path, resource)
 
+    @staticmethod
+    def _get_docker_image_refs(instance: Union[CustomJobModel, TrainingCustomJobModel]) -> List[str]:
+        """
+        Collects all docker image refs used by the job workers
+        Args:
+            instance: custom job model
+
+        Returns:
+            docker image refs in order of the workers
+        """
+        workers = instance.workers if isinstance(instance, CustomJobModel) else [instance.worker]
+        refs = []
+        for worker in workers:
+            if worker.container:
+                refs.append(worker.container.docker_image_ref)
+            elif worker.python_package:
+                refs.append(worker.python_package.docker_image_ref)
+        return refs
+
     def _create_custom_job_resource(
         self,
         job_model: CustomJobModel,
@@ -59,6 +59,8 @@ class NotebookService(BaseService[NotebookModel]):
                 version=version,
                 work_dir=workdir,
                 wanna_project_name=self.wanna_project.name,
+                # notebook container images are referenced by repository and tag only
+                pin_digests=False,
             )
             if config.docker
             else None
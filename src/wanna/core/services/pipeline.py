@@ -1,11 +1,15 @@
 import json
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from caseconverter import snakecase
 from google.cloud import aiplatform
-from kfp.v2.compiler.main import compile_pyfile
+from google.cloud.aiplatform.compat.types import pipeline_state_v1 as gca_pipeline_state_v1
+from pydantic import BaseModel, Field, ValidationError
 from python_on_whales import Image
 
 from wanna.core.deployment.artifacts_push import PushResult
@@ -28,10 +32,36 @@ from wanna.core.services.path_utils import PipelinePaths
 from wanna.core.services.tensorboard import TensorboardService
 from wanna.core.utils.gcp import convert_project_id_to_project_number
 from wanna.core.utils.loaders import load_yaml_path
+from wanna.core.utils.pipeline_compiler import (
+    compile_fingerprint,
+    compile_pipeline,
+    compile_pipeline_isolated,
+    is_compiled,
+    save_fingerprint,
+)
 
 logger = get_logger(__name__)
 
 
+class _CompileSettings(BaseModel):
+    compile_workers: int = Field(default=1, ge=1)
+
+
+def _compile_workers(compile_workers: int) -> Any:
+    """
+    Number of compile worker processes overridden by the WANNA_PIPELINE_COMPILE_WORKERS env variable,
+    validated like the --compile-workers option.
+    """
+    value = os.getenv("WANNA_PIPELINE_COMPILE_WORKERS")
+    if value is None:
+        return compile_workers
+    field = _CompileSettings.__fields__["compile_workers"]
+    validated, errors = field.validate(value, {}, loc="WANNA_PIPELINE_COMPILE_WORKERS", cls=_CompileSettings)
+    if errors:
+        raise ValidationError([errors], _CompileSettings)
+    return validated
+
+
 class PipelineService(BaseService[PipelineModel]):
     def __init__(
         self,
@@ -40,6 +70,7 @@ class PipelineService(BaseService[PipelineModel]):
         version: str = "dev",
         push_mode: PushMode = PushMode.all,
         connector: VertexConnector[PipelineResource] = VertexConnector[PipelineResource](),
+        compile_workers: int = 1,
     ):
         super().__init__(
             instance_type="pipeline",
@@ -51,6 +82,8 @@ class PipelineService(BaseService[PipelineModel]):
         self.tensorboard_service = TensorboardService(config=config)
         self.version = version
         self.push_mode = push_mode
+        # with more than one worker, pipelines are compiled in separate processes
+        self.compile_workers: int = _compile_workers(compile_workers)
         self.docker_service = DockerService(
             docker_model=config.docker,  # type: ignore
             gcp_profile=config.gcp_profile,
@@ -61,20 +94,30 @@ class PipelineService(BaseService[PipelineModel]):
         )
         self.notification_channels = {channel.name: channel for channel in self.config.notification_channels}
 
-    def build(self, instance_name: str) -> List[Path]:
+    def build(self, instance_name: str, push_images: bool = False) -> List[Path]:
         """
         Create an instance with name "name" based on wanna-ml config.
         Args:
             instance_name: The name of the only instance from wanna-ml config that should be created.
                   Set to "all" to create everything from wanna-ml yaml configuration.
+            push_images: start pushing the docker images while the remaining images are built
         """
         instances = self._filter_instances_by_name(instance_name)
+        self.docker_service.build_images(
+            [docker_image_ref for instance in instances for docker_image_ref in instance.docker_image_ref],
+            push=push_images and self.push_mode.can_push_containers(),
+        )
+        self.docker_service.write_build_report()
+        if self.compile_workers > 1 and len(instances) > 1:
+            return self._compile_instances_in_processes(instances)
         return [self._compile_one_instance(instance) for instance in instances]
 
     def push(self, manifests: List[Path], local: bool = False) -> PushResult:
-        return self.connector.push_artifacts(
+        result = self.connector.push_artifacts(
             self.docker_service.push_image, self._prepare_push(manifests, self.version, local)
         )
+        self.docker_service.write_build_report()
+        return result
 
     def _prepare_push(self, pipelines: List[Path], version: str, local: bool = False) -> List[PushTask]:
         push_tasks = []
@@ -148,12 +191,46 @@ class PipelineService(BaseService[PipelineModel]):
         pipelines: List[str],
         extra_params: Optional[Path] = None,
         sync: bool = True,
-    ) -> None:
+        submit_workers: int = 8,
+    ) -> bool:
+        """
+        Submits runs of all the pipelines concurrently. In sync mode, waits for all of them
+        and shows their live status.
+
+        Args:
+            pipelines: paths to the deployment manifests
+            extra_params: yaml file overriding the compiled pipeline params
+            sync: wait for the runs to complete
+            submit_workers: how many runs are submitted at once
+
+        Returns:
+            False if any run did not succeed, cancelled runs count as failed
+        """
         connector = VertexConnector[PipelineResource]()
+        manifests = []
         for manifest_path in pipelines:
             manifest = PipelineService.read_manifest(connector, str(manifest_path))
             aiplatform.init(location=manifest.location, project=manifest.project)
-            connector.run_pipeline(manifest, extra_params, sync)
+            manifests.append(manifest)
+
+        submitted_at = datetime.utcnow()
+        with ThreadPoolExecutor(max_workers=max(1, min(submit_workers, len(manifests)))) as executor:
+            pipeline_jobs = list(
+                executor.map(lambda manifest: connector.submit_pipeline(manifest, extra_params, sync), manifests)
+            )
+        if not sync or not pipeline_jobs:
+            return True
+
+        states = connector.wait_for_pipelines(pipeline_jobs, submitted_at)
+        # a cancelled run has no results, it fails the command like a failed run
+        failed = [
+            job.display_name
+            for job, state in zip(pipeline_jobs, states)
+            if state != gca_pipeline_state_v1.PipelineState.PIPELINE_STATE_SUCCEEDED
+        ]
+        for name in failed:
+            logger.user_error(f"Pipeline {name} did not succeed")
+        return not failed
 
     def _export_pipeline_params(
         self,
@@ -192,15 +269,16 @@ class PipelineService(BaseService[PipelineModel]):
         if tensorboard:
             pipeline_env_params["tensorboard"] = tensorboard
 
-        # Export Pipeline wanna ENV params to be available during compilation
+        # Pipeline wanna ENV params to be exported during compilation
+        compile_env = {}
         pipeline_name_prefix = snakecase(f"{pipeline_instance.name}").upper()
         for key, value in pipeline_env_params.items():
             env_name = snakecase(f"{pipeline_name_prefix}_{key.upper()}").upper()
-            os.environ[env_name] = value
+            compile_env[env_name] = value
 
         for (docker_image_model, _, tag) in images:
             env_name = snakecase(f"{docker_image_model.name}_DOCKER_URI").upper()
-            os.environ[env_name] = tag
+            compile_env[env_name] = tag
 
         # Collect pipeline compile params from wanna config
         if pipeline_instance.pipeline_params and isinstance(pipeline_instance.pipeline_params, Path):
@@ -211,10 +289,76 @@ class PipelineService(BaseService[PipelineModel]):
         else:
             pipeline_compile_params = {}
 
-        return pipeline_env_params, pipeline_compile_params
+        return pipeline_env_params, pipeline_compile_params, compile_env
 
     def _compile_one_instance(self, pipeline: PipelineModel) -> Path:
+        compile_args, deployment_manifest = self._prepare_one_instance(pipeline)
+        fingerprint = self._compile_fingerprint(compile_args)
+        if is_compiled(compile_args["package_path"], fingerprint):
+            logger.user_info(text=f"Pipeline {pipeline.name} is unchanged, reusing the compiled spec")
+            os.environ.update(compile_args["env"])
+        else:
+            compile_pipeline(**compile_args)
+            save_fingerprint(compile_args["package_path"], fingerprint)
+        return self._write_manifest(deployment_manifest)
 
+    @staticmethod
+    def _compile_fingerprint(compile_args: Dict[str, Any]) -> str:
+        return compile_fingerprint(
+            pyfile=compile_args["pyfile"],
+            function_name=compile_args["function_name"],
+            pipeline_parameters=compile_args["pipeline_parameters"],
+            env=compile_args["env"],
+        )
+
+    def _compile_instances_in_processes(self, pipelines: List[PipelineModel]) -> List[Path]:
+        """
+        Compiles the pipelines in a pool of worker processes. Every pipeline exports its env variables
+        and imports its modules in a worker, so they do not leak between pipelines compiled in parallel.
+        Images, tensorboards and the other compile inputs are prepared in this process before,
+        the env variables of all pipelines are exported in this process afterwards, as by the serial compilation.
+
+        Args:
+            pipelines: pipelines to compile
+
+        Returns:
+            paths to the deployment manifests
+        """
+        prepared = [self._prepare_one_instance(pipeline) for pipeline in pipelines]
+        stale = []
+        for pipeline, (compile_args, _) in zip(pipelines, prepared):
+            fingerprint = self._compile_fingerprint(compile_args)
+            if is_compiled(compile_args["package_path"], fingerprint):
+                logger.user_info(text=f"Pipeline {pipeline.name} is unchanged, reusing the compiled spec")
+            else:
+                stale.append((pipeline, compile_args, fingerprint))
+        if stale:
+            workers = min(self.compile_workers, len(stale))
+            logger.user_info(text=f"Compiling {len(stale)} pipelines in {workers} worker processes")
+            # spawned workers do not inherit the locks of the grpc and docker client threads
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = [executor.submit(compile_pipeline_isolated, **compile_args) for _, compile_args, _ in stale]
+                for future, (pipeline, compile_args, fingerprint) in zip(futures, stale):
+                    try:
+                        future.result()
+                    except Exception:
+                        logger.user_error(f"Compiling pipeline {pipeline.name} failed")
+                        for pending in futures:
+                            pending.cancel()
+                        raise
+                    save_fingerprint(compile_args["package_path"], fingerprint)
+        for compile_args, _ in prepared:
+            os.environ.update(compile_args["env"])
+        return [self._write_manifest(deployment_manifest) for _, deployment_manifest in prepared]
+
+    def _prepare_one_instance(self, pipeline: PipelineModel) -> Tuple[Dict[str, Any], PipelineResource]:
+        """
+        Prepares everything the compilation of the pipeline needs.
+
+        Returns:
+            (compile_pipeline arguments, deployment manifest written after the compilation)
+        """
         image_tags = [
             self.docker_service.get_image(docker_image_ref=docker_image_ref)
             for docker_image_ref in pipeline.docker_image_ref
@@ -237,18 +381,15 @@ class PipelineService(BaseService[PipelineModel]):
         network = f"projects/{project_number}/global/networks/{pipeline_network}"
 
         # Collect kubeflow pipeline params for compilation
-        pipeline_env_params, pipeline_params = self._export_pipeline_params(
+        pipeline_env_params, pipeline_params, compile_env = self._export_pipeline_params(
             pipeline_paths, pipeline, self.version, image_tags, tensorboard, network
         )
-
-        # Compile kubeflow V2 Pipeline
-        compile_pyfile(
+        compile_args = dict(
             pyfile=str(self.workdir / pipeline.pipeline_file),
             function_name=pipeline.pipeline_function,
             pipeline_parameters=pipeline_params,
             package_path=pipeline_paths.get_local_pipeline_json_spec_path(self.version),
-            type_check=True,
-            use_experimental=False,
+            env=compile_env,
         )
 
         docker_refs = [
@@ -256,6 +397,7 @@ class PipelineService(BaseService[PipelineModel]):
                 name=model.name,
                 tags=image.repo_tags if image and image.repo_tags else [tag],
                 build_type=model.build_type,
+                digest=self.docker_service.image_digests.get(model.name),
             )
             for model, image, tag in image_tags
         ]
@@ -287,7 +429,14 @@ class PipelineService(BaseService[PipelineModel]):
             compile_env_params=pipeline_env_params,
             notification_channels=channels,
         )
+        return compile_args, deployment_manifest
 
+    def _write_manifest(self, deployment_manifest: PipelineResource) -> Path:
+        pipeline_paths = PipelinePaths(
+            self.workdir,
+            deployment_manifest.pipeline_bucket or f"gs://{self.config.gcp_profile.bucket}",
+            deployment_manifest.pipeline_name,
+        )
         manifest_path = pipeline_paths.get_local_wanna_manifest_path(self.version)
         self.connector.write(manifest_path, deployment_manifest.json())
         return Path(manifest_path).resolve()
@@ -0,0 +1,182 @@
+import contextlib
+import hashlib
+import io
+import os
+import stat
+import tarfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Deque, Iterator, Optional, Union
+
+from wanna.core.models.docker import ContextCompression
+from wanna.core.utils.dockerignore import DockerIgnore, walk_context
+from wanna.core.utils.hashing import FileHashIndex
+
+ARCHIVE_SUFFIXES = {
+    ContextCompression.gzip: ".tar.gz",
+    ContextCompression.zstd: ".tar.zst",
+    ContextCompression.none: ".tar",
+}
+# bump when the archive layout or compression settings change, so old context keys are not reused
+ARCHIVE_FORMAT_VERSION = 1
+
+
+def _gzip_member(block: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(block) + compressor.flush()
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    Writable stream that gzips the data in blocks on multiple threads (zlib releases the GIL).
+    Every block is written as a separate gzip member, concatenated members form a valid gzip file
+    readable by gzip, tar, python and go. At most 2 * workers blocks are kept in memory.
+
+    Args:
+        fileobj: binary stream where the compressed data is written, it is not closed
+        level: gzip compression level
+        block_size: size of the uncompressed block compressed by one worker
+        workers: number of compression threads, defaults to cpu count
+    """
+
+    def __init__(self, fileobj: BinaryIO, level: int = 6, block_size: int = 1024 * 1024, workers: Optional[int] = None):
+        super().__init__()
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        workers = workers or os.cpu_count() or 1
+        self.max_pending = 2 * workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending: Deque[Future] = deque()  # type: ignore
+        self.buffer = bytearray()
+        self.blocks = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[: self.block_size]))
+            del self.buffer[: self.block_size]
+        return len(data)
+
+    def _submit(self, block: bytes) -> None:
+        self.blocks += 1
+        self.pending.append(self.executor.submit(_gzip_member, block, self.level))
+        while len(self.pending) > self.max_pending:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self.buffer or not self.blocks:
+                self._submit(bytes(self.buffer))
+                self.buffer.clear()
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown()
+            super().close()
+
+
+@contextlib.contextmanager
+def open_compressor(fileobj: BinaryIO, compression: ContextCompression) -> Iterator[BinaryIO]:
+    """
+    Wraps a binary stream with a multi-threaded compressor. The underlying stream is not closed.
+
+    Args:
+        fileobj: binary stream for the compressed data
+        compression: gzip, zstd (needs the optional zstandard package) or none
+
+    Returns:
+        writable binary stream
+    """
+    if compression == ContextCompression.gzip:
+        writer: BinaryIO = ParallelGzipWriter(fileobj)  # type: ignore
+    elif compression == ContextCompression.zstd:
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("zstd context compression needs the zstandard package, pip install zstandard") from e
+        writer = zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(fileobj, closefd=False)
+    else:
+        yield fileobj
+        return
+    try:
+        yield writer
+    finally:
+        writer.close()
+
+
+def _normalize_tarinfo(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
+    # the same context must always produce the same archive bytes, no matter who or when created it
+    tarinfo.mtime = 0
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = ""
+    return tarinfo
+
+
+def context_key(
+    source_dir: Union[Path, str],
+    ignore: Optional[DockerIgnore] = None,
+    compression: ContextCompression = ContextCompression.gzip,
+    index_path: Optional[Path] = None,
+) -> str:
+    """
+    Content address of the archive write_tarfile would produce for the source_dir.
+    The archive is reproducible, so the key is computed from the archived paths, modes and file digests
+    without building the archive. Unchanged files are not read again when index_path is given.
+
+    Args:
+        source_dir: directory to archive
+        ignore: .dockerignore matcher
+        compression: gzip, zstd or none
+        index_path: where to persist the file hash index
+
+    Returns:
+        sha256 hexdigest
+    """
+    index = FileHashIndex(index_path)
+    hasher = hashlib.sha256(f"wanna-context-v{ARCHIVE_FORMAT_VERSION} {compression.value}\n".encode("utf-8"))
+    for rel_path, path, is_dir in walk_context(source_dir, ignore):
+        st = os.lstat(path)
+        mode = stat.S_IMODE(st.st_mode)
+        if is_dir:
+            entry = f"d {mode:o} {rel_path}"
+        elif stat.S_ISLNK(st.st_mode):
+            entry = f"l {os.readlink(path)} {rel_path}"
+        elif not stat.S_ISREG(st.st_mode):
+            # sockets and fifos are skipped by tarfile too
+            continue
+        else:
+            entry = f"f {mode:o} {index.file_hash(path, name=rel_path)} {rel_path}"
+        hasher.update(entry.encode("utf-8", "surrogateescape") + b"\0")
+    index.save()
+    return hasher.hexdigest()
+
+
+def write_tarfile(
+    source_dir: Union[Path, str],
+    fileobj: BinaryIO,
+    ignore: Optional[DockerIgnore] = None,
+    compression: ContextCompression = ContextCompression.gzip,
+) -> None:
+    """
+    Streams a compressed TAR of the source_dir to fileobj without any temporary file.
+    Files matched by ignore are not added, ignored directories are not even walked.
+    Entries are sorted and their mtimes and owners are normalised, so the output is reproducible.
+
+    Args:
+        source_dir: directory to archive
+        fileobj: binary stream for the archive
+        ignore: .dockerignore matcher
+        compression: gzip, zstd or none
+    """
+    with open_compressor(fileobj, compression) as stream:
+        with tarfile.open(fileobj=stream, mode="w|") as tar:
+            for rel_path, path, _ in walk_context(source_dir, ignore):
+                tar.add(path, arcname=rel_path, recursive=False, filter=_normalize_tarinfo)
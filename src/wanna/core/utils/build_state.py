@@ -0,0 +1,167 @@
+import contextlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from wanna.core.models.docker import DockerBuildStateModel
+
+SCHEMA_VERSION = 2
+COLUMNS = [
+    "name",
+    "repository",
+    "context_digest",
+    "dockerfile_digest",
+    "build_args",
+    "tags",
+    "pushed_digest",
+    "build_duration_s",
+    "built_at",
+    "pushed_at",
+]
+
+
+class BuildStateStore:
+    """
+    Local SQLite database with the state of the last build and push of every docker image.
+    Images are keyed by name and docker repository. It also records when the local image tags
+    were last used, for the eviction of old images from the local docker. Every operation uses its own short connection,
+    so the store can be shared by parallel build workers and concurrent wanna processes.
+
+    Args:
+        db_path: path to the database file, created on the first write
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        os.makedirs(self.db_path.parent, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                with conn:
+                    if version:
+                        # the state is only a cache, an old schema is dropped and images are built again
+                        conn.execute("DROP TABLE IF EXISTS images")
+                        conn.execute("DROP TABLE IF EXISTS local_images")
+                    conn.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS images (
+                            name TEXT NOT NULL,
+                            repository TEXT NOT NULL,
+                            context_digest TEXT NOT NULL,
+                            dockerfile_digest TEXT NOT NULL,
+                            build_args TEXT NOT NULL,
+                            tags TEXT NOT NULL,
+                            pushed_digest TEXT,
+                            build_duration_s REAL,
+                            built_at TEXT,
+                            pushed_at TEXT,
+                            PRIMARY KEY (name, repository)
+                        )
+                        """
+                    )
+                    conn.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS local_images (
+                            tag TEXT PRIMARY KEY,
+                            last_used_at TEXT NOT NULL
+                        )
+                        """
+                    )
+                    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_model(row: Tuple[Any, ...]) -> DockerBuildStateModel:
+        values = dict(zip(COLUMNS, row))
+        values["tags"] = json.loads(values["tags"])
+        return DockerBuildStateModel(**values)
+
+    def get(self, name: str, repository: str) -> Optional[DockerBuildStateModel]:
+        """
+        Last recorded state of the image or None if it was never built.
+        """
+        if not self.db_path.exists():
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM images WHERE name = ? AND repository = ?", (name, repository)
+            ).fetchone()
+        return self._to_model(row) if row else None
+
+    def list(self) -> List[DockerBuildStateModel]:
+        """
+        States of all recorded images.
+        """
+        if not self.db_path.exists():
+            return []
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM images ORDER BY name, repository").fetchall()
+        return [self._to_model(row) for row in rows]
+
+    def save(self, state: DockerBuildStateModel) -> None:
+        """
+        Inserts or replaces the state of the image.
+        """
+        values = state.dict()
+        values["tags"] = json.dumps(state.tags)
+        for column in ("built_at", "pushed_at"):
+            values[column] = values[column].isoformat() if values[column] else None
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO images ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [values[column] for column in COLUMNS],
+            )
+
+    def record_push(self, name: str, repository: str, tags: List[str], digest: Optional[str]) -> None:
+        """
+        Records the registry digest of the pushed image, pushed tags are added to the image tags.
+        """
+        state = self.get(name, repository)
+        if not state:
+            return
+        self.save(
+            state.copy(
+                update={
+                    "tags": list(dict.fromkeys(state.tags + tags)),
+                    "pushed_digest": digest,
+                    "pushed_at": datetime.now(),
+                }
+            )
+        )
+
+    def touch_local_image(self, tags: List[str]) -> None:
+        """
+        Records that the local image tags were just built or used.
+        """
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO local_images (tag, last_used_at) VALUES (?, ?)", [(tag, now) for tag in tags]
+            )
+
+    def local_image_usage(self) -> Dict[str, datetime]:
+        """
+        When every recorded local image tag was last used.
+        """
+        if not self.db_path.exists():
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute("SELECT tag, last_used_at FROM local_images").fetchall()
+        return {tag: datetime.fromisoformat(last_used_at) for tag, last_used_at in rows}
+
+    def forget_local_images(self, tags: List[str]) -> None:
+        """
+        Removes the tags removed from the local docker.
+        """
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM local_images WHERE tag = ?", [(tag,) for tag in tags])
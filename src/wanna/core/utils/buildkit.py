@@ -0,0 +1,38 @@
+import re
+from typing import Dict, Iterable, List
+
+from wanna.core.models.docker import DockerBuildStepReport
+
+# "#5 [2/4] RUN pip install ...", "#5 CACHED", "#5 DONE 12.3s", "#5 0.512 Collecting ..."
+STEP_LINE = re.compile(r"^#(\d+) (.*)$")
+STEP_DONE = re.compile(r"^DONE (\d+(?:\.\d+)?)s$")
+
+
+def parse_plain_progress(lines: Iterable[str]) -> List[DockerBuildStepReport]:
+    """
+    Parses the BuildKit `--progress=plain` output into Dockerfile steps with their timings
+    and whether they were served from the layer cache. Internal BuildKit steps
+    (loading the context, exporting the image, ...) are left out.
+
+    Args:
+        lines: build output lines
+
+    Returns:
+        Dockerfile steps in the order they were started
+    """
+    steps: Dict[str, DockerBuildStepReport] = {}
+    for line in lines:
+        match = STEP_LINE.match(line.strip())
+        if not match:
+            continue
+        vertex, rest = match.groups()
+        step = steps.get(vertex)
+        if step is None:
+            steps[vertex] = DockerBuildStepReport(name=rest, cached=False)
+        elif rest == "CACHED":
+            step.cached = True
+        else:
+            done = STEP_DONE.match(rest)
+            if done:
+                step.duration_s = float(done.group(1))
+    return [step for step in steps.values() if step.name.startswith("[") and not step.name.startswith("[internal]")]
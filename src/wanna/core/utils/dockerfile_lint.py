@@ -0,0 +1,276 @@
+import json
+import posixpath
+import re
+import shlex
+from operator import attrgetter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from wanna.core.models.docker import DockerBuildStepReport, DockerfileFindingModel, DockerfileLintReport
+
+# commands installing the dependencies of the project
+INSTALL_COMMAND = re.compile(
+    r"\b(?:pip3?|python3? -m pip|poetry|pipenv|conda|mamba|micromamba|npm|yarn)\s+(?:install|sync|ci)\b"
+)
+# files describing the dependencies, copying only them keeps the install layer cached on source changes
+DEPENDENCY_FILE = re.compile(
+    r"(?:^|/)(?:requirements[^/\s]*\.(?:txt|in)|constraints[^/\s]*\.txt|pyproject\.toml|poetry\.lock|setup\.(?:py|cfg)"
+    r"|Pipfile(?:\.lock)?|environment\.ya?ml|package(?:-lock)?\.json|yarn\.lock)$"
+)
+# "[2/4] RUN pip install ..." or "[builder 2/4] RUN ..." steps of the BuildKit progress
+STEP_PREFIX = re.compile(r"^\[[^\]]*\]\s*")
+
+
+class Instruction:
+    """
+    One Dockerfile instruction, continuation lines are joined and comments left out.
+
+    Args:
+        line: line number where the instruction starts
+        keyword: upper case instruction, eg. RUN
+        arguments: rest of the instruction with normalized whitespace
+    """
+
+    def __init__(self, line: int, keyword: str, arguments: str):
+        self.line = line
+        self.keyword = keyword
+        self.arguments = arguments
+        self.flags: Dict[str, str] = {}
+        self.paths: List[str] = []
+        if keyword in ("COPY", "ADD"):
+            self.flags, self.paths = self._split_copy(arguments)
+
+    def __str__(self) -> str:
+        return f"{self.keyword} {self.arguments}"
+
+    @staticmethod
+    def _split_copy(arguments: str) -> Tuple[Dict[str, str], List[str]]:
+        try:
+            tokens = json.loads(arguments) if arguments.startswith("[") else shlex.split(arguments)
+        except ValueError:
+            tokens = arguments.split()
+        flags = {}
+        while tokens and tokens[0].startswith("--"):
+            key, _, value = tokens.pop(0)[2:].partition("=")
+            flags[key.lower()] = value
+        return flags, tokens
+
+    @property
+    def sources(self) -> List[str]:
+        """
+        Build context paths copied by COPY or ADD, empty for copies from other stages or images.
+        """
+        if "from" in self.flags:
+            return []
+        return [path for path in self.paths[:-1] if not re.match(r"^(https?|git)://|^git@", path)]
+
+    @property
+    def destination(self) -> str:
+        return self.paths[-1] if self.paths else ""
+
+    @property
+    def copies_sources(self) -> bool:
+        """
+        True if the instruction copies other files than the dependency files, eg. COPY . .
+        """
+        return any(not DEPENDENCY_FILE.search(source) for source in self.sources)
+
+    @property
+    def installs_dependencies(self) -> bool:
+        return self.keyword == "RUN" and bool(INSTALL_COMMAND.search(self.arguments))
+
+
+def parse_dockerfile(text: str) -> List[Instruction]:
+    """
+    Splits the Dockerfile into instructions. Heredocs are not supported.
+    """
+    instructions = []
+    current, start = "", 0
+    for number, line in enumerate(text.splitlines(), start=1):
+        stripped = line.strip()
+        # docker drops comments and empty lines even inside continuations
+        if not stripped or stripped.startswith("#"):
+            continue
+        if not current:
+            start = number
+        if stripped.endswith("\\"):
+            current += stripped[:-1] + " "
+            continue
+        keyword, _, arguments = (current + stripped).partition(" ")
+        instructions.append(Instruction(start, keyword.upper(), " ".join(arguments.split())))
+        current = ""
+    if current:
+        keyword, _, arguments = current.partition(" ")
+        instructions.append(Instruction(start, keyword.upper(), " ".join(arguments.split())))
+    return instructions
+
+
+def _split_stages(instructions: List[Instruction]) -> List[List[Instruction]]:
+    """
+    Build stages, each starting with its FROM. Global ARGs before the first FROM are left out.
+    """
+    stages: List[List[Instruction]] = []
+    for instruction in instructions:
+        if instruction.keyword == "FROM":
+            stages.append([instruction])
+        elif stages:
+            stages[-1].append(instruction)
+    return stages
+
+
+def _stage_names(index: int, stage: List[Instruction]) -> List[str]:
+    tokens = [token for token in stage[0].arguments.split() if not token.startswith("--")]
+    names = [str(index)]
+    if len(tokens) == 3 and tokens[1].upper() == "AS":
+        names.append(tokens[2].lower())
+    return names
+
+
+def _invalidated_instructions(stages: List[List[Instruction]]) -> List[Instruction]:
+    """
+    Instructions whose layer cache a change of a source file in the build context invalidates:
+    everything from the first instruction copying the sources on, including the stages built on top of them.
+    """
+    invalidated: List[Instruction] = []
+    invalidated_stages = set()
+    for index, stage in enumerate(stages):
+        base = next((token for token in stage[0].arguments.split() if not token.startswith("--")), "")
+        hit = base.lower() in invalidated_stages
+        for instruction in stage[1:]:
+            hit = hit or instruction.copies_sources or instruction.flags.get("from", "").lower() in invalidated_stages
+            if hit:
+                invalidated.append(instruction)
+        if hit:
+            invalidated_stages.update(_stage_names(index, stage))
+    return invalidated
+
+
+def _check_copy_before_install(stage: List[Instruction]) -> List[DockerfileFindingModel]:
+    findings = []
+    source_copy = None
+    workdir = copy_dir = "/"
+    for instruction in stage[1:]:
+        if instruction.keyword == "WORKDIR":
+            workdir = posixpath.join(workdir, instruction.arguments)
+        elif source_copy is None and instruction.copies_sources:
+            source_copy = instruction
+            copy_dir = posixpath.normpath(posixpath.join(workdir, instruction.destination))
+        elif source_copy is not None and instruction.installs_dependencies:
+            destination = source_copy.destination
+            destination = destination if destination.endswith("/") else f"{destination}/"
+            # paths of the dependency files in the build context, when the whole context was copied
+            dependency_files = [
+                posixpath.relpath(posixpath.join(workdir, token), copy_dir)
+                for token in instruction.arguments.split()
+                if DEPENDENCY_FILE.search(token)
+            ]
+            outside_context = any(path.startswith("..") for path in dependency_files)
+            if not dependency_files or outside_context or "." not in source_copy.sources:
+                dependency_files = ["<dependency files>"]
+            copy_dependencies = f"COPY {' '.join(dependency_files)} {destination}"
+            findings.append(
+                DockerfileFindingModel(
+                    line=instruction.line,
+                    rule="copy-before-install",
+                    message=f"dependencies are installed after the sources are copied at line {source_copy.line}, "
+                    "every source change reinstalls them",
+                    suggestion="\n".join([copy_dependencies, str(instruction), str(source_copy)]),
+                )
+            )
+    return findings
+
+
+def _check_early_args(stage: List[Instruction]) -> List[DockerfileFindingModel]:
+    findings = []
+    for index, instruction in enumerate(stage):
+        if instruction.keyword != "ARG":
+            continue
+        following = stage[index + 1 :]
+        for declaration in instruction.arguments.split():
+            name = declaration.partition("=")[0]
+            usage = re.compile(r"\$\{?" + re.escape(name) + r"\b")
+            first_use = next((later for later in following if usage.search(later.arguments)), None)
+            # every RUN after an ARG gets it as an environment variable, a new value reruns all of them
+            runs = [
+                later.line
+                for later in following
+                if later.keyword == "RUN" and (first_use is None or later.line < first_use.line)
+            ]
+            if not runs:
+                continue
+            lines = ", ".join(str(line) for line in runs)
+            if first_use:
+                message = f"ARG {name} is first used at line {first_use.line}, changing it also reruns lines {lines}"
+                suggestion = f"move ARG {name} right above line {first_use.line}"
+            else:
+                message = f"ARG {name} is not referenced, but changing it reruns lines {lines}"
+                suggestion = f"remove ARG {name} or move it above the RUN that needs it"
+            findings.append(
+                DockerfileFindingModel(line=instruction.line, rule="early-arg", message=message, suggestion=suggestion)
+            )
+    return findings
+
+
+def _check_apt_update(stage: List[Instruction]) -> List[DockerfileFindingModel]:
+    return [
+        DockerfileFindingModel(
+            line=instruction.line,
+            rule="apt-update-alone",
+            message="the cached package index of a separate update layer is reused by later installs",
+            suggestion="RUN apt-get update && apt-get install -y ...",
+        )
+        for instruction in stage
+        if instruction.keyword == "RUN"
+        and re.search(r"\bapt(?:-get)? update\b", instruction.arguments)
+        and not re.search(r"\bapt(?:-get)? (?:-\S+ )*install\b", instruction.arguments)
+    ]
+
+
+def _step_durations(steps: List[DockerBuildStepReport]) -> Dict[str, float]:
+    return {
+        " ".join(STEP_PREFIX.sub("", step.name).split()): step.duration_s
+        for step in steps
+        if step.duration_s is not None
+    }
+
+
+def lint_dockerfile(
+    name: str, dockerfile: Path, steps: Optional[List[DockerBuildStepReport]] = None
+) -> DockerfileLintReport:
+    """
+    Statically analyses the layer cache efficiency of the Dockerfile.
+    Finds dependency installs after the sources are copied, ARGs declared long before their use
+    and package index updates cached apart from the installs. Estimates which instructions
+    a change of a source file in the build context rebuilds.
+
+    Args:
+        name: docker image name
+        dockerfile: path to the Dockerfile
+        steps: Dockerfile steps of the last recorded build telemetry, to estimate the rebuild duration
+
+    Returns:
+        DockerfileLintReport
+    """
+    stages = _split_stages(parse_dockerfile(dockerfile.read_text()))
+    findings: List[DockerfileFindingModel] = []
+    for stage in stages:
+        findings.extend(_check_copy_before_install(stage))
+        findings.extend(_check_early_args(stage))
+        findings.extend(_check_apt_update(stage))
+
+    invalidated = _invalidated_instructions(stages)
+    rebuild_duration_s = None
+    if steps:
+        durations = _step_durations(steps)
+        known = [durations[str(instruction)] for instruction in invalidated if str(instruction) in durations]
+        rebuild_duration_s = sum(known) if known else None
+    return DockerfileLintReport(
+        name=name,
+        dockerfile=dockerfile,
+        findings=sorted(findings, key=attrgetter("line")),
+        instructions=sum(len(stage) - 1 for stage in stages),
+        invalidated=len(invalidated),
+        invalidated_runs=sum(instruction.keyword == "RUN" for instruction in invalidated),
+        invalidated_from_line=invalidated[0].line if invalidated else None,
+        rebuild_duration_s=rebuild_duration_s,
+    )
@@ -0,0 +1,175 @@
+import os
+import posixpath
+import re
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+DOCKERIGNORE_FILENAME = ".dockerignore"
+
+
+class IgnorePattern:
+    """
+    One .dockerignore pattern compiled the same way as docker does it
+    (https://docs.docker.com/engine/reference/builder/#dockerignore-file).
+
+    Args:
+        pattern: cleaned pattern without the leading "!"
+        exclusion: True for "!" patterns that re-include previously ignored paths
+    """
+
+    def __init__(self, pattern: str, exclusion: bool = False):
+        self.pattern = pattern
+        self.exclusion = exclusion
+        self.regex = re.compile(self._to_regex(pattern))
+
+    def __repr__(self) -> str:
+        return f"{'!' if self.exclusion else ''}{self.pattern}"
+
+    @staticmethod
+    def _to_regex(pattern: str) -> str:
+        regex = "^"
+        in_class = False
+        i = 0
+        while i < len(pattern):
+            ch = pattern[i]
+            i += 1
+            if in_class:
+                # character classes [a-z], [^a-z] are passed to the regex as they are
+                in_class = ch != "]"
+                regex += ch
+            elif ch == "[":
+                in_class = True
+                regex += ch
+            elif ch == "*":
+                if i < len(pattern) and pattern[i] == "*":
+                    i += 1
+                    # treat "**/" as "**"
+                    if i < len(pattern) and pattern[i] == "/":
+                        i += 1
+                    # "**" at the end matches everything, otherwise any number of directories (even zero)
+                    regex += ".*" if i == len(pattern) else "(.*/)?"
+                else:
+                    regex += "[^/]*"
+            elif ch == "?":
+                regex += "[^/]"
+            elif ch == "\\":
+                if i < len(pattern):
+                    regex += re.escape(pattern[i])
+                    i += 1
+                else:
+                    regex += re.escape(ch)
+            elif ch in ".+()|{}$^]":
+                regex += "\\" + ch
+            else:
+                regex += ch
+        return regex + "$"
+
+    def match(self, path: str) -> bool:
+        return self.regex.match(path) is not None
+
+
+class DockerIgnore:
+    """
+    Docker compatible .dockerignore matcher. Supports globs, "**", "!" negations
+    (the last matching pattern wins) and pruning of ignored directories during the walk.
+
+    Args:
+        patterns: lines of the .dockerignore file
+    """
+
+    def __init__(self, patterns: Optional[List[str]] = None):
+        self.patterns: List[IgnorePattern] = []
+        self.extend(patterns or [])
+
+    @classmethod
+    def from_context_dir(cls, context_dir: Union[Path, str]) -> "DockerIgnore":
+        """
+        Reads .dockerignore from the context directory, an empty matcher is returned if there is none.
+        """
+        dockerignore = Path(context_dir) / DOCKERIGNORE_FILENAME
+        if not dockerignore.exists():
+            return cls()
+        with open(dockerignore, "r") as f:
+            return cls(f.read().splitlines())
+
+    def extend(self, patterns: List[str]) -> "DockerIgnore":
+        for line in patterns:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            exclusion = line.startswith("!")
+            if exclusion:
+                line = line[1:].strip()
+            if not line:
+                continue
+            pattern = posixpath.normpath(line.replace(os.sep, "/"))
+            if len(pattern) > 1 and pattern.startswith("/"):
+                pattern = pattern.lstrip("/")
+            self.patterns.append(IgnorePattern(pattern, exclusion))
+        return self
+
+    @property
+    def has_exclusions(self) -> bool:
+        return any(p.exclusion for p in self.patterns)
+
+    def matches(self, path: str) -> bool:
+        """
+        Checks if the path (relative to the context, "/" separated) is ignored.
+        A pattern matches the path itself or any of its parent directories.
+        """
+        path = posixpath.normpath(path)
+        parents = path.split("/")[:-1]
+        ignored = False
+        for pattern in self.patterns:
+            match = pattern.match(path)
+            if not match:
+                match = any(pattern.match("/".join(parents[: i + 1])) for i in range(len(parents)))
+            if match:
+                ignored = not pattern.exclusion
+        return ignored
+
+    def can_prune(self, path: str) -> bool:
+        """
+        Checks if an ignored directory can be skipped entirely, ie. no "!" pattern can re-include
+        anything inside it. Uses the same prefix rule as docker.
+        """
+        prefix = posixpath.normpath(path) + "/"
+        return not any(p.exclusion and (p.pattern + "/").startswith(prefix) for p in self.patterns)
+
+
+def walk_context(
+    context_dir: Union[Path, str], ignore: Optional[DockerIgnore] = None
+) -> Iterator[Tuple[str, str, bool]]:
+    """
+    Walks the docker build context in a deterministic (sorted) order and yields the entries
+    that are not ignored. Ignored directories are pruned without being listed, unless
+    an exclusion pattern might re-include something in them.
+
+    Args:
+        context_dir: docker build context directory
+        ignore: .dockerignore matcher, nothing is ignored if not set
+
+    Returns:
+        iterator of (relative posix path, absolute path, is_dir), symlinks are never reported as directories
+    """
+    ignore = ignore or DockerIgnore()
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(context_dir, rel_dir)) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            is_dir = entry.is_dir(follow_symlinks=False)
+            ignored = ignore.matches(rel_path)
+            if is_dir:
+                if ignored and (not ignore.has_exclusions or ignore.can_prune(rel_path)):
+                    continue
+                if not ignored:
+                    yield rel_path, entry.path, True
+                subdirs.append(rel_path)
+            elif not ignored:
+                yield rel_path, entry.path, False
+        # depth-first in sorted order
+        stack.extend(reversed(subdirs))
@@ -1,6 +1,5 @@
 import os
 import re
-import tarfile
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
@@ -13,7 +12,10 @@ from google.cloud.compute_v1.services.images import ImagesClient
 from google.cloud.compute_v1.types import ListImagesRequest
 from google.cloud.resourcemanager_v3.services.projects import ProjectsClient
 
+from wanna.core.models.docker import ContextCompression
+from wanna.core.utils.archive import write_tarfile
 from wanna.core.utils.credentials import get_credentials
+from wanna.core.utils.dockerignore import DockerIgnore
 
 DEFAULT_VALIDATION_MODE = "remote"
 VALIDATION_MODE = os.environ.get("WANNA_VALIDATION_MODE", DEFAULT_VALIDATION_MODE)
@@ -325,17 +327,25 @@ def construct_vm_image_family_from_vm_image(framework: str, version: str, os: Op
     return f"{framework}-{version}-notebooks"
 
 
-def make_tarfile(source_dir: Path, output_filename: Path):
+def make_tarfile(
+    source_dir: Path,
+    output_filename: Path,
+    ignore: Optional[DockerIgnore] = None,
+    compression: ContextCompression = ContextCompression.gzip,
+):
     """
     TAR a given folder and save the result to output_filename.
+    Files matched by ignore are not added, ignored directories are not even walked.
 
     Args:
         source_dir:
         output_filename:
+        ignore: .dockerignore matcher
+        compression: gzip (multi-threaded), zstd or none
     """
     os.makedirs(output_filename.parent.absolute(), exist_ok=True)
-    with tarfile.open(output_filename, "w:gz") as tar:
-        tar.add(source_dir, arcname=".")
+    with open(output_filename, "wb") as f:
+        write_tarfile(source_dir, f, ignore=ignore, compression=compression)
 
 
 def upload_file_to_gcs(filename: Path, bucket_name: str, blob_name: str) -> storage.blob.Blob:
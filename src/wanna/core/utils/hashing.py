@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from wanna.core.loggers.wanna_logger import get_logger
+from wanna.core.utils.dockerignore import DockerIgnore, walk_context
+
+logger = get_logger(__name__)
+
+INDEX_VERSION = 1
+BLOCK_SIZE = 1024 * 1024
+# file reads and hashing release the GIL, a few more threads than cores keep the disk busy
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+# files modified this recently are hashed but not trusted by the index,
+# their mtime could still change within the filesystem timestamp granularity
+RACY_WINDOW_NS = 2 * 10**9
+
+IndexEntry = Tuple[int, int, int, str]  # size, mtime_ns, inode, hexdigest
+
+
+class FileHashIndex:
+    """
+    Persistent index of file digests keyed by path, size, mtime and inode.
+    Files whose stat information did not change since the last run are not read again,
+    only new or modified files are rehashed.
+
+    Args:
+        index_path: json file where the index is persisted, None keeps the index in memory only
+        hashfunc: name of the hashlib function used for file digests
+    """
+
+    def __init__(self, index_path: Optional[Path] = None, hashfunc: str = "sha256"):
+        self.index_path = index_path
+        self.hashfunc = hashfunc
+        self.entries: Dict[str, IndexEntry] = self._load()
+        self.seen: Dict[str, IndexEntry] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> Dict[str, IndexEntry]:
+        if not self.index_path or not self.index_path.exists():
+            return {}
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            logger.warning(f"Corrupted file hash index {self.index_path}, rebuilding it")
+            return {}
+        if index.get("version") != INDEX_VERSION or index.get("hashfunc") != self.hashfunc:
+            return {}
+        return {path: tuple(entry) for path, entry in index.get("files", {}).items()}  # type: ignore
+
+    def save(self) -> None:
+        """
+        Persist only the entries seen since the index was loaded, deleted files are dropped.
+        """
+        if not self.index_path:
+            return
+        os.makedirs(self.index_path.parent, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"version": INDEX_VERSION, "hashfunc": self.hashfunc, "files": self.seen}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _lookup(self, name: str, stat: os.stat_result) -> Optional[str]:
+        entry = self.entries.get(name)
+        if entry and tuple(entry[:3]) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            self.hits += 1
+            return entry[3]
+        self.misses += 1
+        return None
+
+    def _remember(self, name: str, stat: os.stat_result, digest: str) -> None:
+        if time.time_ns() - stat.st_mtime_ns > RACY_WINDOW_NS:
+            self.seen[name] = (stat.st_size, stat.st_mtime_ns, stat.st_ino, digest)
+
+    def file_hash(self, path: str, name: Optional[str] = None) -> str:
+        """
+        Returns the hexdigest of the file content, reusing the indexed digest if the file did not change.
+
+        Args:
+            path: path to the file
+            name: key of the file in the index, defaults to path
+
+        Returns:
+            hexdigest of the file content
+        """
+        name = name or path
+        stat = os.stat(path)
+        digest = self._lookup(name, stat) or hash_file(path, self.hashfunc)
+        self._remember(name, stat, digest)
+        return digest
+
+    def file_hashes(self, files: List[Tuple[str, str]], workers: Optional[int] = None) -> List[str]:
+        """
+        Hexdigests of many files. Files that are not in the index are read and hashed on a thread pool,
+        the digests are returned in the order of files, no matter which thread finished first.
+
+        Args:
+            files: list of (key in the index, path to the file)
+            workers: number of hashing threads, defaults to DEFAULT_WORKERS, 1 hashes in the calling thread
+
+        Returns:
+            hexdigests of the files
+        """
+        stats = [os.stat(path) for _, path in files]
+        digests = [self._lookup(name, stat) for (name, _), stat in zip(files, stats)]
+        missing = [i for i, digest in enumerate(digests) if digest is None]
+        paths = [files[i][1] for i in missing]
+        workers = min(workers or DEFAULT_WORKERS, len(paths))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for i, hexdigest in zip(missing, executor.map(hash_file, paths, repeat(self.hashfunc))):
+                    digests[i] = hexdigest
+        else:
+            for i, path in zip(missing, paths):
+                digests[i] = hash_file(path, self.hashfunc)
+        for (name, _), stat, digest in zip(files, stats, digests):
+            self._remember(name, stat, digest)  # type: ignore
+        return digests  # type: ignore
+
+
+def new_hasher(hashfunc: str = "sha256") -> Any:
+    """
+    Creates a hashlib compatible hasher. Besides the hashlib algorithms, the fast xxh3
+    (needs the optional xxhash package) and blake3 (needs the optional blake3 package) are supported.
+    """
+    if hashfunc == "xxh3":
+        try:
+            import xxhash
+        except ImportError as e:
+            raise ImportError("xxh3 context hashing needs the xxhash package, pip install xxhash") from e
+        return xxhash.xxh3_128()
+    if hashfunc == "blake3":
+        try:
+            import blake3
+        except ImportError as e:
+            raise ImportError("blake3 context hashing needs the blake3 package, pip install blake3") from e
+        return blake3.blake3()
+    return hashlib.new(hashfunc)
+
+
+def hash_file(path: str, hashfunc: str = "sha256") -> str:
+    """
+    Hash the content of a file in blocks.
+
+    Args:
+        path: path to the file
+        hashfunc: name of the hash function, see new_hasher
+
+    Returns:
+        hexdigest of the file content
+    """
+    hasher = new_hasher(hashfunc)
+    buffer = bytearray(BLOCK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        size = f.readinto(buffer)
+        while size:
+            hasher.update(view[:size])
+            size = f.readinto(buffer)
+    return str(hasher.hexdigest())
+
+
+def reduce_hashes(hashes: List[str], hashfunc: str = "sha256") -> str:
+    """
+    Combine file digests into one digest independently of their order.
+    """
+    hasher = new_hasher(hashfunc)
+    for hashvalue in sorted(hashes):
+        hasher.update(hashvalue.encode("utf-8"))
+    return str(hasher.hexdigest())
+
+
+def dirhash(
+    directory: Union[Path, str],
+    hashfunc: str = "sha256",
+    ignore: Optional[DockerIgnore] = None,
+    index_path: Optional[Path] = None,
+    workers: Optional[int] = None,
+) -> str:
+    """
+    Deterministic digest of all files in a directory that are not ignored, compatible with
+    checksumdir.dirhash (only file contents count, not the file names).
+    Ignored directories are pruned during the walk and never read.
+    When index_path is given, the file digests are cached there and only new or modified files are read.
+    Files are hashed on multiple threads, the file digests are combined in sorted order,
+    so the result does not depend on the thread scheduling.
+
+    Args:
+        directory: directory to hash
+        hashfunc: name of the hash function, sha256 or another hashlib function, xxh3 or blake3
+        ignore: .dockerignore matcher of the files to skip
+        index_path: where to persist the file hash index
+        workers: number of hashing threads, defaults to DEFAULT_WORKERS
+
+    Returns:
+        hexdigest of the directory
+    """
+    if not os.path.isdir(directory):
+        raise TypeError(f"{directory} is not a directory.")
+
+    index = FileHashIndex(index_path, hashfunc)
+    files = []
+    hashes = []
+    for rel_path, path, is_dir in walk_context(directory, ignore):
+        if is_dir or os.path.isdir(path):
+            continue
+        if os.path.exists(path):
+            files.append((rel_path, path))
+        else:
+            # broken symlinks count as empty files
+            hashes.append(new_hasher(hashfunc).hexdigest())
+    hashes.extend(index.file_hashes(files, workers))
+    index.save()
+    logger.debug(f"Hashed {directory}: {index.hits} files reused from index, {index.misses} files read")
+    return reduce_hashes(hashes, hashfunc)
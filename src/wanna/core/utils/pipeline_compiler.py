@@ -0,0 +1,176 @@
+import ast
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+import kfp
+from kfp.v2.compiler.main import compile_pyfile
+
+from wanna.core.utils.hashing import hash_file
+
+
+def compile_pipeline(
+    pyfile: str,
+    function_name: Optional[str],
+    pipeline_parameters: Dict[str, Any],
+    package_path: str,
+    env: Dict[str, str],
+) -> None:
+    """
+    Exports the wanna env variables of the pipeline and compiles the kubeflow V2 pipeline.
+
+    Args:
+        pyfile: path to the python file with the pipeline
+        function_name: name of the pipeline function
+        pipeline_parameters: pipeline parameters
+        package_path: where to write the pipeline json spec
+        env: env variables the pipeline reads during the compilation
+    """
+    os.environ.update(env)
+    compile_pyfile(
+        pyfile=pyfile,
+        function_name=function_name,
+        pipeline_parameters=pipeline_parameters,
+        package_path=package_path,
+        type_check=True,
+        use_experimental=False,
+    )
+
+
+def compile_pipeline_isolated(**kwargs: Any) -> None:
+    """
+    Entry point of the compile worker processes, see compile_pipeline for the arguments.
+    The env variables are restored and the modules imported by the pipeline are forgotten afterwards,
+    so the next pipeline compiled by the same worker does not see them and imports its modules again.
+    """
+    environ = dict(os.environ)
+    modules = set(sys.modules)
+    try:
+        compile_pipeline(**kwargs)
+    finally:
+        for name in set(sys.modules) - modules:
+            del sys.modules[name]
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def _module_files(base: Path, module: str) -> List[Path]:
+    """
+    Files of the module and of its parent packages under base, empty if the module is not found there.
+    """
+    files = []
+    path = base
+    parts = module.split(".") if module else []
+    for part in parts:
+        path = path / part
+        if (path / "__init__.py").is_file():
+            files.append(path / "__init__.py")
+    if parts and path.with_suffix(".py").is_file():
+        files.append(path.with_suffix(".py"))
+    return files
+
+
+def _referenced_files(tree: ast.AST, bases: List[Path]) -> List[Path]:
+    """
+    Existing files whose paths appear as string literals, eg. component.yaml of load_component_from_file.
+    """
+    files = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Constant) and isinstance(node.value, str)):
+            continue
+        if not 0 < len(node.value) < 256 or "\n" in node.value or not Path(node.value).suffix:
+            continue
+        for base in bases:
+            try:
+                candidate = base / node.value
+                if candidate.is_file():
+                    files.append(candidate.resolve())
+                    break
+            except (OSError, ValueError):
+                continue
+    return files
+
+
+def local_sources(pyfile: Path) -> List[Path]:
+    """
+    The pipeline file and the local files it depends on transitively: modules and packages imported
+    from the directory of the pipeline file (kfp puts it on sys.path) and the files their string literals
+    point to. Installed packages are left out, their changes are only caught by the kfp version.
+
+    Args:
+        pyfile: path to the python file with the pipeline
+
+    Returns:
+        sorted resolved paths
+    """
+    root = pyfile.resolve().parent
+    sources: Set[Path] = set()
+    data: Set[Path] = set()
+    pending = [pyfile.resolve()]
+    while pending:
+        path = pending.pop()
+        if path in sources:
+            continue
+        sources.add(path)
+        tree = ast.parse(path.read_text(), filename=str(path))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    pending.extend(_module_files(root, alias.name))
+            elif isinstance(node, ast.ImportFrom):
+                base = root
+                if node.level:
+                    base = path.parent
+                    for _ in range(node.level - 1):
+                        base = base.parent
+                module = node.module or ""
+                pending.extend(_module_files(base, module))
+                # from package import module
+                for alias in node.names:
+                    pending.extend(_module_files(base, f"{module}.{alias.name}".lstrip(".")))
+        data.update(_referenced_files(tree, [path.parent, root, Path.cwd()]))
+    return sorted({path.resolve() for path in sources} | data)
+
+
+def compile_fingerprint(
+    pyfile: str,
+    function_name: Optional[str],
+    pipeline_parameters: Dict[str, Any],
+    env: Dict[str, str],
+) -> str:
+    """
+    Fingerprint of everything the compiled pipeline spec depends on: the local sources of the pipeline,
+    the pipeline parameters, the exported env variables (which carry the image tags) and the kfp version.
+    """
+    root = Path(pyfile).resolve().parent
+    payload = {
+        "sources": {os.path.relpath(path, root): hash_file(str(path)) for path in local_sources(Path(pyfile))},
+        "function_name": function_name,
+        "pipeline_parameters": pipeline_parameters,
+        "env": env,
+        "kfp": kfp.__version__,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _fingerprint_path(package_path: str) -> Path:
+    return Path(package_path).with_suffix(".fingerprint")
+
+
+def is_compiled(package_path: str, fingerprint: str) -> bool:
+    """
+    True if the pipeline spec exists and was compiled from inputs with the same fingerprint.
+    """
+    fingerprint_path = _fingerprint_path(package_path)
+    return (
+        Path(package_path).is_file()
+        and fingerprint_path.is_file()
+        and fingerprint_path.read_text().strip() == fingerprint
+    )
+
+
+def save_fingerprint(package_path: str, fingerprint: str) -> None:
+    _fingerprint_path(package_path).write_text(fingerprint)
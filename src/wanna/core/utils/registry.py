@@ -0,0 +1,295 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from google import auth
+from google.auth.credentials import Credentials
+from google.auth.transport.requests import Request
+
+from wanna.core.utils.credentials import get_credentials
+
+MANIFEST_MEDIA_TYPES = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+]
+GOOGLE_REGISTRY_SUFFIXES = ("gcr.io", "pkg.dev")
+DOCKER_HUB_HOST = "registry-1.docker.io"
+# key of Docker Hub in the docker config
+DOCKER_HUB_CONFIG_KEY = "https://index.docker.io/v1/"
+
+
+def parse_image_ref(image: str) -> Tuple[str, str, str]:
+    """
+    Splits a full image reference into registry host, repository name and tag (or digest).
+    Same as docker, references without a registry host point to Docker Hub.
+
+    Args:
+        image: eg. europe-west1-docker.pkg.dev/project/repository/image:tag
+
+    Returns:
+        (host, name, reference)
+    """
+    host, _, rest = image.partition("/")
+    if not rest or not ("." in host or ":" in host or host == "localhost"):
+        host, rest = DOCKER_HUB_HOST, image if "/" in image else f"library/{image}"
+    if "@" in rest:
+        name, _, reference = rest.partition("@")
+    elif ":" in rest:
+        name, _, reference = rest.rpartition(":")
+    else:
+        name, reference = rest, "latest"
+    return host, name, reference
+
+
+def docker_credentials(host: str) -> Optional[Tuple[str, str]]:
+    """
+    Registry credentials stored by docker login, looked up the same way as the docker CLI does:
+    the credential helper of the host, then the credential store, then the auths of the docker config.
+
+    Args:
+        host: registry host
+
+    Returns:
+        (username, password) or None if there are no credentials for the host
+    """
+    config_path = Path(os.environ.get("DOCKER_CONFIG") or Path.home() / ".docker") / "config.json"
+    if not config_path.is_file():
+        return None
+    with open(config_path) as f:
+        config = json.load(f)
+    key = DOCKER_HUB_CONFIG_KEY if host == DOCKER_HUB_HOST else host
+    helper = config.get("credHelpers", {}).get(key) or config.get("credsStore")
+    if helper:
+        try:
+            result = subprocess.run(
+                [f"docker-credential-{helper}", "get"], input=key, capture_output=True, text=True, check=True
+            )
+        except (OSError, subprocess.CalledProcessError):
+            pass
+        else:
+            secret = json.loads(result.stdout)
+            return secret["Username"], secret["Secret"]
+    auths = config.get("auths", {})
+    encoded = (auths.get(key) or auths.get(f"https://{key}") or {}).get("auth")
+    if not encoded:
+        return None
+    username, _, password = base64.b64decode(encoded).decode().partition(":")
+    return username, password
+
+
+class RegistryClient:
+    """
+    Minimal Docker Registry HTTP API v2 client, just enough to check and copy tags
+    without pulling images. Token authentication is negotiated per repository from the
+    registry challenge, GCP registries (Artifact Registry, GCR) are authenticated with the GCP credentials,
+    other registries with the credentials of docker login.
+
+    Args:
+        credentials: GCP credentials, the application default credentials are used when not set
+        timeout: timeout of one HTTP request in seconds
+    """
+
+    def __init__(self, credentials: Optional[Credentials] = None, timeout: int = 30):
+        self.credentials = credentials
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Authorization header of every (host, repository)
+        self.tokens: Dict[Tuple[str, str], str] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _base_url(host: str) -> str:
+        scheme = "http" if host.startswith(("localhost", "127.0.0.1")) else "https"
+        return f"{scheme}://{host}/v2"
+
+    def _basic_auth(self, host: str) -> Optional[Tuple[str, str]]:
+        if not host.endswith(GOOGLE_REGISTRY_SUFFIXES):
+            return docker_credentials(host)
+        with self.lock:
+            if not self.credentials:
+                self.credentials = get_credentials() or auth.default()[0]
+            if not self.credentials.valid:
+                self.credentials.refresh(Request())
+            return "oauth2accesstoken", self.credentials.token
+
+    def _authenticate(self, host: str, name: str, challenge: str) -> None:
+        scheme, _, params = challenge.partition(" ")
+        if scheme.lower() == "basic":
+            credentials = self._basic_auth(host)
+            if not credentials:
+                raise requests.HTTPError(f"No docker login credentials for {host}")
+            self.tokens[(host, name)] = f"Basic {base64.b64encode(':'.join(credentials).encode()).decode()}"
+            return
+        if scheme.lower() != "bearer":
+            raise requests.HTTPError(f"Unsupported registry authentication {scheme} for {host}")
+        options = dict(re.findall(r'(\w+)="([^"]*)"', params))
+        response = self.session.get(
+            options["realm"],
+            params={"service": options.get("service", host), "scope": f"repository:{name}:pull,push"},
+            auth=self._basic_auth(host),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        body = response.json()
+        self.tokens[(host, name)] = f"Bearer {body.get('token') or body['access_token']}"
+
+    def _request(
+        self, method: str, host: str, name: str, path: str = "", url: Optional[str] = None, **kwargs: Any
+    ) -> requests.Response:
+        url = url or f"{self._base_url(host)}/{name}/{path}"
+        for attempt in range(2):
+            headers = dict(kwargs.pop("headers", {}))
+            authorization = self.tokens.get((host, name))
+            if authorization:
+                headers["Authorization"] = authorization
+            response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+            kwargs["headers"] = headers
+            if response.status_code == 401 and attempt == 0 and "WWW-Authenticate" in response.headers:
+                self._authenticate(host, name, response.headers["WWW-Authenticate"])
+                continue
+            return response
+        return response
+
+    def get_digest(self, image: str) -> Optional[str]:
+        """
+        Resolves the image reference to its manifest digest without transferring any layers.
+
+        Args:
+            image: full image reference
+
+        Returns:
+            sha256:... digest or None if the image does not exist
+        """
+        host, name, reference = parse_image_ref(image)
+        headers = {"Accept": ", ".join(MANIFEST_MEDIA_TYPES)}
+        response = self._request("HEAD", host, name, f"manifests/{reference}", headers=headers)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        digest = response.headers.get("Docker-Content-Digest")
+        if not digest:
+            # not every registry sends the digest header, it is the sha256 of the manifest body
+            response = self._request("GET", host, name, f"manifests/{reference}", headers=headers)
+            response.raise_for_status()
+            digest = f"sha256:{hashlib.sha256(response.content).hexdigest()}"
+        return digest
+
+    def manifest_exists(self, image: str) -> bool:
+        """
+        Checks if the image tag exists in the registry with a cheap HEAD request.
+        """
+        host, name, reference = parse_image_ref(image)
+        response = self._request(
+            "HEAD", host, name, f"manifests/{reference}", headers={"Accept": ", ".join(MANIFEST_MEDIA_TYPES)}
+        )
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def add_tag(self, image: str, tag: str) -> None:
+        """
+        Tags the existing image with another tag in the same repository, no layers are transferred.
+
+        Args:
+            image: existing image reference
+            tag: new tag of the image
+        """
+        host, name, reference = parse_image_ref(image)
+        response = self._request(
+            "GET", host, name, f"manifests/{reference}", headers={"Accept": ", ".join(MANIFEST_MEDIA_TYPES)}
+        )
+        response.raise_for_status()
+        response = self._request(
+            "PUT",
+            host,
+            name,
+            f"manifests/{tag}",
+            data=response.content,
+            headers={"Content-Type": response.headers["Content-Type"]},
+        )
+        response.raise_for_status()
+
+    def copy_image(self, source: str, targets: List[str]) -> str:
+        """
+        Copies the image with all its blobs to another repository or registry and tags it there,
+        no layers are pulled to the local docker. Blobs the target repository already has are skipped,
+        blobs in the same registry are mounted from the source repository (cross-repository blob mount)
+        and only the remaining blobs are streamed from registry to registry.
+        Multi-platform images are copied with all their platforms.
+
+        Args:
+            source: image reference to copy
+            targets: image references in one target repository, eg. the version and latest tags
+
+        Returns:
+            sha256:... digest of the copied manifest
+        """
+        source_repo = parse_image_ref(source)
+        target_refs = [parse_image_ref(target) for target in targets]
+        target_repo = target_refs[0][:2]
+        if any(ref[:2] != target_repo for ref in target_refs):
+            raise ValueError(f"All target images must be in the same repository, got {targets}")
+        return self._copy_manifest(source_repo[:2], source_repo[2], target_repo, [ref[2] for ref in target_refs])
+
+    def _copy_manifest(
+        self, source: Tuple[str, str], reference: str, target: Tuple[str, str], target_references: List[str]
+    ) -> str:
+        response = self._request(
+            "GET", *source, f"manifests/{reference}", headers={"Accept": ", ".join(MANIFEST_MEDIA_TYPES)}
+        )
+        response.raise_for_status()
+        manifest = json.loads(response.content)
+        if "manifests" in manifest:
+            # image index, every platform manifest is copied under its digest first
+            for platform_manifest in manifest["manifests"]:
+                self._copy_manifest(source, platform_manifest["digest"], target, [platform_manifest["digest"]])
+        else:
+            for blob in [manifest["config"]] + manifest.get("layers", []):
+                self._copy_blob(source, target, blob["digest"])
+        for target_reference in target_references:
+            put = self._request(
+                "PUT",
+                *target,
+                f"manifests/{target_reference}",
+                data=response.content,
+                headers={"Content-Type": response.headers["Content-Type"]},
+            )
+            put.raise_for_status()
+        return f"sha256:{hashlib.sha256(response.content).hexdigest()}"
+
+    def _copy_blob(self, source: Tuple[str, str], target: Tuple[str, str], digest: str) -> None:
+        host, name = target
+        if self._request("HEAD", host, name, f"blobs/{digest}").status_code == 200:
+            return
+        # a registry that cannot mount the blob starts a regular upload instead (202)
+        params = {"mount": digest, "from": source[1]} if source[0] == host else {}
+        upload = self._request("POST", host, name, "blobs/uploads/", params=params)
+        if upload.status_code == 201:
+            return
+        upload.raise_for_status()
+        location = upload.headers["Location"]
+        if location.startswith("/"):
+            location = f"{self._base_url(host).rpartition('/v2')[0]}{location}"
+
+        blob = self._request("GET", *source, f"blobs/{digest}", stream=True)
+        blob.raise_for_status()
+        headers = {"Content-Type": "application/octet-stream"}
+        if "Content-Length" in blob.headers:
+            headers["Content-Length"] = blob.headers["Content-Length"]
+        try:
+            put = self._request(
+                "PUT", host, name, url=location, params={"digest": digest}, data=blob.raw, headers=headers
+            )
+        finally:
+            blob.close()
+        put.raise_for_status()
@@ -0,0 +1,66 @@
+import re
+from pathlib import Path
+from typing import List, Union
+
+# exact pins, eg. numpy==1.23.0 or pandas[parquet]==1.5.0, without environment markers
+PINNED_REQUIREMENT = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*(\[[^\]]*\])?===?[^\s;,]+$")
+# pip options telling where the requirements come from, needed by every install of the requirements
+INDEX_OPTIONS = (
+    "-i",
+    "--index-url",
+    "--extra-index-url",
+    "-f",
+    "--find-links",
+    "--trusted-host",
+    "--pre",
+    "--prefer-binary",
+    "--only-binary",
+    "--no-binary",
+)
+
+
+def read_requirements(requirements_txt: Union[Path, str]) -> List[str]:
+    """
+    Normalised lines of the requirements file, comments and empty lines are left out.
+    """
+    lines = []
+    with open(requirements_txt, "r") as f:
+        for line in f:
+            requirement = line.split(" #", 1)[0].strip()
+            if not requirement or requirement.startswith("#"):
+                continue
+            lines.append(re.sub(r"\s*(===?)\s*", r"\1", " ".join(requirement.split())))
+    return lines
+
+
+def is_pinned(requirement: str) -> bool:
+    return bool(PINNED_REQUIREMENT.match(requirement))
+
+
+def common_requirements(requirements_txts: List[Union[Path, str]]) -> List[str]:
+    """
+    Exact pins present in all the requirements files and the index options shared by all of them,
+    in the order of the first file. Empty if the files have no pinned requirement in common.
+
+    Args:
+        requirements_txts: paths to the requirements.txt files
+
+    Returns:
+        lines of the common requirements file
+    """
+    contents = [read_requirements(path) for path in requirements_txts]
+    shared = set(contents[0]).intersection(*contents[1:])
+    common = [
+        line
+        for line in contents[0]
+        if line in shared and (is_pinned(line) or line.split("=")[0].split()[0] in INDEX_OPTIONS)
+    ]
+    return common if any(is_pinned(line) for line in common) else []
+
+
+def remove_requirements(requirements_txt: Union[Path, str], requirements: List[str]) -> List[str]:
+    """
+    Lines of the requirements file without the given pinned requirements, pip options are kept.
+    """
+    removed = {line for line in requirements if is_pinned(line)}
+    return [line for line in read_requirements(requirements_txt) if line not in removed]
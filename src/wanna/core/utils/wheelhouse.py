@@ -0,0 +1,76 @@
+import hashlib
+import os
+import shlex
+import shutil
+from pathlib import Path
+from typing import Dict, List, Union
+
+WHEELHOUSE_MOUNT = "/wheelhouse"
+
+
+def requirement_keys(requirements_txt: Union[Path, str]) -> Dict[str, str]:
+    """
+    Reads the requirements file and keys every requirement by the hash of its normalised line.
+    Comments, empty lines and pip options (-r, -e, --extra-index-url, ...) are skipped,
+    pip still reads them from the requirements file during the install.
+
+    Args:
+        requirements_txt: path to the requirements.txt file
+
+    Returns:
+        requirement -> sha256 key, in the order of the file
+    """
+    keys = {}
+    with open(requirements_txt, "r") as f:
+        for line in f:
+            requirement = line.split(" #", 1)[0].strip()
+            if not requirement or requirement.startswith(("#", "-")):
+                continue
+            requirement = " ".join(requirement.split())
+            keys[requirement] = hashlib.sha256(requirement.encode("utf-8")).hexdigest()[:16]
+    return keys
+
+
+def missing_requirements(wheelhouse: Path, keys: Dict[str, str]) -> Dict[str, str]:
+    """
+    Requirements without built wheels in the wheelhouse, every requirement has its own <key> directory.
+    """
+    return {requirement: key for requirement, key in keys.items() if not (wheelhouse / key).is_dir()}
+
+
+def wheel_script(missing: Dict[str, str], mount: str = WHEELHOUSE_MOUNT) -> str:
+    """
+    Shell script building the wheels of the missing requirements (and their dependencies) into the mounted
+    wheelhouse. Wheels are built into a temporary directory first, so an interrupted build is not cached.
+    """
+    commands = []
+    for requirement, key in missing.items():
+        tmp_dir = shlex.quote(f"{mount}/.tmp-{key}")
+        commands.append(
+            f"rm -rf {tmp_dir} && pip wheel --wheel-dir {tmp_dir} {shlex.quote(requirement)}"
+            f" && mv {tmp_dir} {shlex.quote(f'{mount}/{key}')}"
+        )
+    return "set -e\n" + "\n".join(commands)
+
+
+def collect_wheels(wheelhouse: Path, keys: Dict[str, str], output_dir: Path) -> List[str]:
+    """
+    Copies the wheels of the given requirements from the wheelhouse into one flat directory
+    (usable with pip --find-links). Wheels of other requirements are not copied,
+    so the directory only changes when the requirements change.
+
+    Returns:
+        names of the collected wheels
+    """
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir, exist_ok=True)
+    wheels = []
+    for key in keys.values():
+        key_dir = wheelhouse / key
+        if not key_dir.is_dir():
+            continue
+        for wheel in sorted(key_dir.glob("*.whl")):
+            if not (output_dir / wheel.name).exists():
+                shutil.copy2(wheel, output_dir / wheel.name)
+                wheels.append(wheel.name)
+    return wheels
@@ -37,6 +37,12 @@ def mock_storage_client():
         yield _fixture
 
 
+@pytest.fixture(scope="session", autouse=True)
+def mock_io_storage_client():
+    with mock.patch("wanna.core.deployment.io.Client", mocks.MockStorageClient) as _fixture:
+        yield _fixture
+
+
 @pytest.fixture(scope="session", autouse=True)
 def mock_mock_upload_file():
     with mock.patch(
@@ -46,6 +52,18 @@ def mock_mock_upload_file():
         yield _fixture
 
 
+@pytest.fixture
+def mock_registry_get_digest():
+    """
+    Opt-in, every provided image resolves to a dummy digest without calling the registry.
+    """
+    with mock.patch(
+        "wanna.core.utils.registry.RegistryClient.get_digest",
+        mocks.mock_get_digest,
+    ) as _fixture:
+        yield _fixture
+
+
 # Credentials patching
 @pytest.fixture(scope="session", autouse=True)
 def mock_validators_get_credentials():
@@ -0,0 +1,61 @@
+import base64
+import hashlib
+import json
+from typing import Any
+
+import google_crc32c
+from mock import MagicMock, patch
+
+from wanna.core.deployment.models import JsonArtifact, PathArtifact, PushTask
+from wanna.core.deployment.vertex_connector import VertexConnector
+
+
+def md5(content: bytes) -> str:
+    return base64.b64encode(hashlib.md5(content).digest()).decode()
+
+
+def crc32c(content: bytes) -> str:
+    return base64.b64encode(google_crc32c.value(content).to_bytes(4, "big")).decode()
+
+
+class TestArtifactsPush:
+    def test_unchanged_artifacts_are_not_uploaded(self, tmp_path):
+        spec = tmp_path / "pipeline-spec.json"
+        spec.write_text('{"pipelineSpec": {}}')
+        changed_spec = tmp_path / "changed-spec.json"
+        changed_spec.write_text('{"pipelineSpec": {"changed": true}}')
+        manifest = {"pipeline_name": "sample"}
+        remote = {
+            "manifests/pipeline-spec.json": MagicMock(md5_hash=md5(spec.read_bytes())),
+            "manifests/changed-spec.json": MagicMock(md5_hash=md5(b"{}")),
+            # composite objects only have the crc32c
+            "manifests/wanna-manifest.json": MagicMock(md5_hash=None, crc32c=crc32c(json.dumps(manifest).encode())),
+        }
+        client = MagicMock()
+        client.return_value.bucket.return_value.get_blob.side_effect = remote.get
+        connector = VertexConnector[Any]()
+        task = PushTask(
+            container_artifacts=[],
+            manifest_artifacts=[
+                PathArtifact(name="spec", source=str(spec), destination="gs://bucket/manifests/pipeline-spec.json"),
+                PathArtifact(
+                    name="changed", source=str(changed_spec), destination="gs://bucket/manifests/changed-spec.json"
+                ),
+            ],
+            json_artifacts=[
+                JsonArtifact(
+                    name="manifest", json_body=manifest, destination="gs://bucket/manifests/wanna-manifest.json"
+                ),
+                JsonArtifact(name="new", json_body=manifest, destination="gs://bucket/manifests/new.json"),
+            ],
+        )
+
+        with patch("wanna.core.deployment.io.Client", client), patch.object(
+            VertexConnector, "upload_file"
+        ) as upload_file, patch.object(VertexConnector, "write") as write:
+            [(_, manifest_artifacts, json_artifacts)] = connector.push_artifacts(MagicMock(), [task])
+
+        assert [artifact.unchanged for artifact in manifest_artifacts] == [True, False]
+        assert [artifact.unchanged for artifact in json_artifacts] == [True, False]
+        upload_file.assert_called_once_with(str(changed_spec), "gs://bucket/manifests/changed-spec.json")
+        write.assert_called_once_with("gs://bucket/manifests/new.json", json.dumps(manifest))
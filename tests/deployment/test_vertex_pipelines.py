@@ -0,0 +1,89 @@
+from datetime import datetime
+from typing import Any
+
+from google.cloud.aiplatform.compat.types import pipeline_state_v1
+from mock import MagicMock, patch
+
+from wanna.core.deployment.vertex_connector import VertexConnector
+
+
+def pipeline_job(name: str, location: str, state: pipeline_state_v1.PipelineState) -> MagicMock:
+    job = MagicMock(project="project", location=location, display_name=name)
+    job.resource_name = f"projects/project/locations/{location}/pipelineJobs/{name}-run"
+    job.gca_resource.state = state
+    return job
+
+
+class TestVertexPipelines:
+    def test_wait_for_pipelines_lists_runs_with_shared_backoff(self):
+        train = pipeline_job("train", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_PENDING)
+        score = pipeline_job("score", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_RUNNING)
+        report = pipeline_job("report", "europe-west4", pipeline_state_v1.PipelineState.PIPELINE_STATE_RUNNING)
+        polls = {
+            "europe-west1": [
+                # train is not listed yet after its submission
+                [pipeline_job("score", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_RUNNING)],
+                [
+                    pipeline_job("train", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_SUCCEEDED),
+                    pipeline_job("score", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_FAILED),
+                ],
+            ],
+            "europe-west4": [
+                [pipeline_job("report", "europe-west4", pipeline_state_v1.PipelineState.PIPELINE_STATE_RUNNING)],
+                [pipeline_job("report", "europe-west4", pipeline_state_v1.PipelineState.PIPELINE_STATE_SUCCEEDED)],
+            ],
+        }
+        train.state = pipeline_state_v1.PipelineState.PIPELINE_STATE_RUNNING
+
+        def list_jobs(filter, project, location):
+            assert filter == 'create_time>="2022-05-01T11:55:00Z"'
+            return polls[location].pop(0)
+
+        with patch("wanna.core.deployment.vertex_pipelines.PipelineJob.list", side_effect=list_jobs) as list_mock:
+            with patch("wanna.core.deployment.vertex_pipelines.time.sleep") as sleep:
+                states = VertexConnector[Any]().wait_for_pipelines([train, score, report], datetime(2022, 5, 1, 12))
+
+        assert states == [
+            pipeline_state_v1.PipelineState.PIPELINE_STATE_SUCCEEDED,
+            pipeline_state_v1.PipelineState.PIPELINE_STATE_FAILED,
+            pipeline_state_v1.PipelineState.PIPELINE_STATE_SUCCEEDED,
+        ]
+        # one list call per location and poll
+        assert list_mock.call_count == 4
+        assert [call.args[0] for call in sleep.call_args_list] == [10.0, 15.0]
+
+    def test_wait_for_pipelines_follows_paused_runs(self):
+        train = pipeline_job("train", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_PAUSED)
+        polls = [
+            [pipeline_job("train", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_RUNNING)],
+            [pipeline_job("train", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_CANCELLED)],
+        ]
+
+        with patch("wanna.core.deployment.vertex_pipelines.PipelineJob.list", side_effect=lambda **_: polls.pop(0)):
+            with patch("wanna.core.deployment.vertex_pipelines.time.sleep"):
+                states = VertexConnector[Any]().wait_for_pipelines([train], datetime(2022, 5, 1, 12))
+
+        # the paused run was resumed and then cancelled
+        assert states == [pipeline_state_v1.PipelineState.PIPELINE_STATE_CANCELLED]
+        assert not polls
+
+    def test_exit_handler_skips_completed_runs(self):
+        failed = pipeline_job("train", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_FAILED)
+        failed.state = pipeline_state_v1.PipelineState.PIPELINE_STATE_FAILED
+        running = pipeline_job("score", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_RUNNING)
+        running.state = pipeline_state_v1.PipelineState.PIPELINE_STATE_RUNNING
+        paused = pipeline_job("report", "europe-west1", pipeline_state_v1.PipelineState.PIPELINE_STATE_PAUSED)
+        paused.state = pipeline_state_v1.PipelineState.PIPELINE_STATE_PAUSED
+
+        with patch("wanna.core.deployment.vertex_pipelines.atexit.register") as register:
+            for job in [failed, running, paused]:
+                VertexConnector._at_pipeline_exit(job.display_name, job, sync=True)
+        for call in register.call_args_list:
+            call.args[0]()
+
+        failed.wait.assert_not_called()
+        failed.cancel.assert_not_called()
+        running.wait.assert_called_once()
+        running.cancel.assert_called_once()
+        # a paused run could still be resumed, so it is cancelled as well
+        paused.cancel.assert_called_once()
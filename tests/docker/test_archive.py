@@ -0,0 +1,57 @@
+import gzip
+import io
+import os
+import tarfile
+
+from wanna.core.models.docker import ContextCompression
+from wanna.core.utils.archive import ParallelGzipWriter, context_key, write_tarfile
+from wanna.core.utils.dockerignore import DockerIgnore
+
+
+class TestArchive:
+    def test_parallel_gzip_writer_round_trip(self):
+        data = bytes(range(256)) * 10000
+        out = io.BytesIO()
+        writer = ParallelGzipWriter(out, block_size=64 * 1024, workers=3)
+        for i in range(0, len(data), 1000):
+            writer.write(data[i : i + 1000])
+        writer.close()
+        assert gzip.decompress(out.getvalue()) == data
+
+    def test_parallel_gzip_writer_empty(self):
+        out = io.BytesIO()
+        ParallelGzipWriter(out).close()
+        assert gzip.decompress(out.getvalue()) == b""
+
+    def test_write_tarfile(self, tmp_path):
+        context = tmp_path / "context"
+        (context / "src").mkdir(parents=True)
+        (context / "src" / "main.py").write_text("print('hello')")
+        (context / "notes.md").write_text("# notes")
+        ignore = DockerIgnore(["*.md"])
+
+        for compression, mode in [(ContextCompression.gzip, "r:gz"), (ContextCompression.none, "r:")]:
+            out = io.BytesIO()
+            write_tarfile(context, out, ignore=ignore, compression=compression)
+            out.seek(0)
+            with tarfile.open(fileobj=out, mode=mode) as tar:
+                assert tar.getnames() == ["src", "src/main.py"]
+                assert tar.extractfile("src/main.py").read() == b"print('hello')"
+
+    def test_write_tarfile_is_reproducible(self, tmp_path):
+        context = tmp_path / "context"
+        (context / "src").mkdir(parents=True)
+        (context / "src" / "main.py").write_text("print('hello')")
+        key = context_key(context)
+
+        first = io.BytesIO()
+        write_tarfile(context, first)
+        os.utime(context / "src" / "main.py", (0, 12345))
+        second = io.BytesIO()
+        write_tarfile(context, second)
+
+        assert first.getvalue() == second.getvalue()
+        assert context_key(context) == key
+        assert context_key(context, compression=ContextCompression.none) != key
+        with tarfile.open(fileobj=io.BytesIO(first.getvalue()), mode="r:gz") as tar:
+            assert all(m.mtime == 0 and m.uid == 0 and m.uname == "" for m in tar.getmembers())
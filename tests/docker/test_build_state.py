@@ -0,0 +1,68 @@
+import sqlite3
+
+from wanna.core.models.docker import DockerBuildStateModel
+from wanna.core.utils.build_state import BuildStateStore
+
+
+class TestBuildStateStore:
+    def make_state(self, **kwargs) -> DockerBuildStateModel:
+        return DockerBuildStateModel(
+            name="train",
+            repository="wanna-samples",
+            context_digest="a" * 64,
+            dockerfile_digest="b" * 64,
+            build_args="{}",
+            tags=["europe-docker.pkg.dev/p/wanna-samples/train:1"],
+            **kwargs,
+        )
+
+    def test_save_and_record_push(self, tmp_path):
+        store = BuildStateStore(tmp_path / "build" / "build-state.db")
+        assert store.get("train", "wanna-samples") is None
+        assert store.list() == []
+
+        state = self.make_state(build_duration_s=1.5)
+        store.save(state)
+        assert store.get("train", "wanna-samples") == state
+        assert store.get("train", "other-repository") is None
+
+        store.record_push("train", "wanna-samples", ["europe-docker.pkg.dev/p/wanna-samples/train:2"], "sha256:1")
+        pushed = store.get("train", "wanna-samples")
+        assert pushed.pushed_digest == "sha256:1"
+        assert pushed.pushed_at is not None
+        assert len(pushed.tags) == 2
+        assert store.list() == [pushed]
+
+    def test_stale_reason(self):
+        built = self.make_state(built_at="2022-01-01T00:00:00")
+        assert self.make_state().stale_reason(None) == "never built"
+        assert self.make_state().stale_reason(built) is None
+        assert self.make_state().copy(update={"context_digest": "c"}).stale_reason(built) == "context changed"
+        assert self.make_state().copy(update={"build_args": '{"a": 1}'}).stale_reason(built) == "build args changed"
+
+    def test_old_schema_is_dropped(self, tmp_path):
+        db_path = tmp_path / "build-state.db"
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE images (name TEXT)")
+        conn.execute("INSERT INTO images VALUES ('train')")
+        conn.execute("PRAGMA user_version = 99")
+        conn.commit()
+        conn.close()
+
+        store = BuildStateStore(db_path)
+        assert store.list() == []
+        store.save(self.make_state())
+        assert len(store.list()) == 1
+
+    def test_local_image_usage(self, tmp_path):
+        store = BuildStateStore(tmp_path / "build" / "build-state.db")
+        assert store.local_image_usage() == {}
+
+        store.touch_local_image(["train:1", "train:latest"])
+        store.touch_local_image(["train:2", "train:latest"])
+        usage = store.local_image_usage()
+        assert set(usage) == {"train:1", "train:2", "train:latest"}
+        assert usage["train:latest"] == usage["train:2"] >= usage["train:1"]
+
+        store.forget_local_images(["train:1"])
+        assert set(store.local_image_usage()) == {"train:2", "train:latest"}
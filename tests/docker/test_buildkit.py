@@ -0,0 +1,33 @@
+from wanna.core.utils.buildkit import parse_plain_progress
+
+PLAIN_PROGRESS = """#1 [internal] load build definition from Dockerfile
+#1 transferring dockerfile: 37B done
+#1 DONE 0.0s
+
+#4 [1/3] FROM docker.io/library/python:3.9@sha256:abc
+#4 DONE 0.0s
+
+#5 [2/3] RUN pip install -r requirements.txt
+#5 CACHED
+
+#6 [3/3] COPY . .
+#6 0.120 copying files
+#6 DONE 1.5s
+
+#7 exporting to image
+#7 DONE 0.3s
+"""
+
+
+class TestBuildkit:
+    def test_parse_plain_progress(self):
+        steps = parse_plain_progress(PLAIN_PROGRESS.splitlines())
+
+        assert [step.name for step in steps] == [
+            "[1/3] FROM docker.io/library/python:3.9@sha256:abc",
+            "[2/3] RUN pip install -r requirements.txt",
+            "[3/3] COPY . .",
+        ]
+        assert [step.cached for step in steps] == [False, True, False]
+        assert steps[2].duration_s == 1.5
+        assert steps[1].duration_s is None
@@ -0,0 +1,68 @@
+from wanna.core.models.docker import DockerBuildStepReport
+from wanna.core.utils.dockerfile_lint import lint_dockerfile, parse_dockerfile
+
+DOCKERFILE = """# syntax=docker/dockerfile:1
+FROM python:3.9-slim AS builder
+ARG PACKAGE_VERSION
+RUN apt-get update
+RUN apt-get install -y build-essential
+WORKDIR /app
+COPY . .
+RUN pip install \\
+    -r /app/requirements.txt
+RUN python -m build --version ${PACKAGE_VERSION}
+
+FROM python:3.9-slim
+COPY --from=builder /app/dist /dist
+RUN pip install /dist/*.whl
+"""
+
+
+class TestDockerfileLint:
+    def test_parse_dockerfile(self):
+        instructions = parse_dockerfile(DOCKERFILE)
+        assert [(i.line, i.keyword) for i in instructions][:4] == [(2, "FROM"), (3, "ARG"), (4, "RUN"), (5, "RUN")]
+        install = instructions[6]
+        assert (install.line, str(install)) == (8, "RUN pip install -r /app/requirements.txt")
+        copy = instructions[-2]
+        assert copy.flags == {"from": "builder"}
+        assert copy.sources == []
+        assert copy.destination == "/dist"
+
+    def test_lint_dockerfile(self, tmp_path):
+        dockerfile = tmp_path / "Dockerfile"
+        dockerfile.write_text(DOCKERFILE)
+        steps = [
+            DockerBuildStepReport(name="[builder 5/7] RUN pip install -r /app/requirements.txt", duration_s=100.0),
+            DockerBuildStepReport(name="[builder 4/7] COPY . .", duration_s=1.5),
+            DockerBuildStepReport(name="[builder 2/7] RUN apt-get update", duration_s=20.0),
+        ]
+
+        report = lint_dockerfile("train", dockerfile, steps)
+
+        assert [(f.line, f.rule) for f in report.findings] == [
+            (3, "early-arg"),
+            (4, "apt-update-alone"),
+            (8, "copy-before-install"),
+        ]
+        assert "lines 4, 5, 8" in report.findings[0].message
+        assert report.findings[0].suggestion == "move ARG PACKAGE_VERSION right above line 10"
+        assert report.findings[2].suggestion == (
+            "COPY requirements.txt ./\nRUN pip install -r /app/requirements.txt\nCOPY . ."
+        )
+        # COPY . ., both RUNs after it and the whole second stage copying from the builder
+        assert report.invalidated_from_line == 7
+        assert (report.invalidated, report.invalidated_runs, report.instructions) == (5, 3, 9)
+        assert report.rebuild_duration_s == 101.5
+
+    def test_lint_cache_friendly_dockerfile(self, tmp_path):
+        dockerfile = tmp_path / "Dockerfile"
+        dockerfile.write_text(
+            "FROM python:3.9\nWORKDIR /app\nCOPY requirements.txt ./\nRUN pip install -r requirements.txt\n"
+            "COPY . .\nARG VERSION\nRUN echo $VERSION > version.txt\n"
+        )
+
+        report = lint_dockerfile("serve", dockerfile)
+
+        assert report.findings == []
+        assert (report.invalidated, report.invalidated_from_line, report.rebuild_duration_s) == (3, 5, None)
@@ -0,0 +1,77 @@
+import tarfile
+
+from mock import patch
+
+from wanna.core.utils import dockerignore
+from wanna.core.utils.dockerignore import DockerIgnore, walk_context
+from wanna.core.utils.gcp import make_tarfile
+
+
+class TestDockerIgnore:
+    def test_patterns(self):
+        ignore = DockerIgnore(
+            [
+                "# comment",
+                "",
+                "*.log",
+                "/data",
+                "**/__pycache__",
+                "docs/**/*.png",
+                "tmp?",
+                "[ab].txt",
+            ]
+        )
+        assert ignore.matches("app.log")
+        assert not ignore.matches("logs/app.log")
+        assert ignore.matches("data")
+        assert ignore.matches("data/raw/train.csv")
+        assert not ignore.matches("src/data")
+        assert ignore.matches("__pycache__/main.pyc")
+        assert ignore.matches("src/pkg/__pycache__/main.pyc")
+        assert ignore.matches("docs/img.png")
+        assert ignore.matches("docs/a/b/img.png")
+        assert not ignore.matches("img.png")
+        assert ignore.matches("tmp1")
+        assert not ignore.matches("tmp12")
+        assert ignore.matches("a.txt")
+        assert not ignore.matches("c.txt")
+
+    def test_negations_last_match_wins(self):
+        ignore = DockerIgnore(["*.md", "!README.md", "README*.md"])
+        assert ignore.matches("CHANGELOG.md")
+        assert ignore.matches("README.md")
+        ignore = DockerIgnore(["*.md", "!README.md"])
+        assert not ignore.matches("README.md")
+
+    def test_can_prune(self):
+        ignore = DockerIgnore(["data", "!data/keep.csv", ".venv"])
+        assert not ignore.can_prune("data")
+        assert ignore.can_prune(".venv")
+
+
+class TestWalkContext:
+    def make_context(self, tmp_path):
+        for path in ["src/main.py", "data/train.csv", "data/keep.csv", ".venv/lib/site.py", "Dockerfile"]:
+            (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / path).write_text(path)
+        (tmp_path / ".dockerignore").write_text("data\n!data/keep.csv\n.venv\n")
+        return tmp_path
+
+    def test_walk_prunes_ignored_dirs(self, tmp_path):
+        context = self.make_context(tmp_path)
+        ignore = DockerIgnore.from_context_dir(context)
+        with patch.object(dockerignore.os, "scandir", wraps=dockerignore.os.scandir) as scandir_mock:
+            files = [rel_path for rel_path, _, is_dir in walk_context(context, ignore) if not is_dir]
+        assert files == [".dockerignore", "Dockerfile", "data/keep.csv", "src/main.py"]
+        scanned = [str(call.args[0]) for call in scandir_mock.call_args_list]
+        assert not any(".venv" in path for path in scanned)
+
+    def test_tarfile_uses_dockerignore(self, tmp_path):
+        context = self.make_context(tmp_path / "context")
+        tar_path = tmp_path / "context.tar.gz"
+        make_tarfile(context, tar_path, ignore=DockerIgnore.from_context_dir(context))
+        with tarfile.open(tar_path) as tar:
+            names = tar.getnames()
+        assert "data/keep.csv" in names
+        assert "data/train.csv" not in names
+        assert not any(name.startswith(".venv") for name in names)
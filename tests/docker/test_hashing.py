@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+
+import checksumdir
+import pytest
+from mock import patch
+
+from wanna.core.utils import hashing
+from wanna.core.utils.dockerignore import DockerIgnore
+from wanna.core.utils.hashing import FileHashIndex, dirhash, new_hasher
+
+
+class TestDirhash:
+    def make_context(self, tmp_path):
+        (tmp_path / "src").mkdir(parents=True)
+        (tmp_path / "src" / "main.py").write_text("print('hello')")
+        (tmp_path / "src" / "main.pyc").write_text("bytecode")
+        (tmp_path / "README.md").write_text("# readme")
+        (tmp_path / "Dockerfile").write_text("FROM python:3.9")
+        old = time.time() - 60
+        for path in tmp_path.rglob("*"):
+            os.utime(path, (old, old))
+        return tmp_path
+
+    def test_dirhash_is_compatible_with_checksumdir(self, tmp_path):
+        context = self.make_context(tmp_path / "context")
+        expected = checksumdir.dirhash(context, "sha256", excluded_extensions=["pyc", "md"])
+        ignore = DockerIgnore(["**/*.pyc", "**/*.md"])
+        assert dirhash(context, "sha256", ignore=ignore) == expected
+        assert dirhash(context, "sha256", ignore=ignore, index_path=tmp_path / "index.json") == expected
+
+    def test_dirhash_rehashes_only_modified_files(self, tmp_path):
+        context = self.make_context(tmp_path / "context")
+        index_path = tmp_path / "index.json"
+        first = dirhash(context, index_path=index_path)
+
+        with patch.object(hashing, "hash_file", wraps=hashing.hash_file) as hash_file_mock:
+            assert dirhash(context, index_path=index_path) == first
+            hash_file_mock.assert_not_called()
+
+            (context / "src" / "main.py").write_text("print('changed')")
+            second = dirhash(context, index_path=index_path)
+            assert second != first
+            hash_file_mock.assert_called_once_with(str(context / "src" / "main.py"), "sha256")
+
+    def test_index_drops_deleted_files(self, tmp_path):
+        context = self.make_context(tmp_path / "context")
+        index_path = tmp_path / "index.json"
+        dirhash(context, index_path=index_path)
+        assert "Dockerfile" in FileHashIndex(index_path).entries
+
+        os.remove(context / "Dockerfile")
+        dirhash(context, index_path=index_path)
+        assert "Dockerfile" not in FileHashIndex(index_path).entries
+
+    def test_dirhash_does_not_depend_on_threads(self, tmp_path):
+        context = tmp_path / "context"
+        for i in range(50):
+            (context / f"dir{i % 5}").mkdir(parents=True, exist_ok=True)
+            (context / f"dir{i % 5}" / f"file{i}.bin").write_bytes(os.urandom(1024 * (i + 1)))
+        expected = checksumdir.dirhash(context, "sha256")
+        assert dirhash(context, workers=1) == expected
+        assert dirhash(context, workers=8) == expected
+        assert dirhash(context, "blake2b", workers=8) == dirhash(context, "blake2b", workers=1)
+
+    def test_fast_hash_functions_need_optional_packages(self):
+        with patch.dict(sys.modules, {"xxhash": None, "blake3": None}):
+            with pytest.raises(ImportError, match="pip install xxhash"):
+                new_hasher("xxh3")
+            with pytest.raises(ImportError, match="pip install blake3"):
+                new_hasher("blake3")
+        assert new_hasher("sha256").name == "sha256"
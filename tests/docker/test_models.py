@@ -1,6 +1,9 @@
 import unittest
 
-from wanna.core.models.docker import DockerModel
+import pytest
+from pydantic import ValidationError
+
+from wanna.core.models.docker import CloudBuildOptionsModel, DockerModel
 
 
 class TestDockerModel(unittest.TestCase):
@@ -46,3 +49,22 @@ class TestDockerModel(unittest.TestCase):
                 "repository": "wanna-samples",
             }
         )
+
+    def test_cloud_build_options_merge(self):
+        docker_model = DockerModel.parse_obj(
+            {
+                "cloud_build_options": {"machine_type": "E2_HIGHCPU_32", "disk_size_gb": 200, "timeout_s": 3600},
+                "repository": "wanna-samples",
+            }
+        )
+        options = docker_model.cloud_build_options
+
+        assert options.merge(None) == options
+        assert options.merge(CloudBuildOptionsModel(timeout_s=600)) == CloudBuildOptionsModel(
+            machine_type="E2_HIGHCPU_32", disk_size_gb=200, timeout_s=600
+        )
+        assert options.merge(CloudBuildOptionsModel(worker_pool="gpu")) == CloudBuildOptionsModel(
+            worker_pool="gpu", timeout_s=3600
+        )
+        with pytest.raises(ValidationError):
+            CloudBuildOptionsModel(worker_pool="gpu", machine_type="E2_HIGHCPU_8")
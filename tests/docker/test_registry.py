@@ -0,0 +1,350 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import stat
+import uuid
+from urllib.parse import urlparse
+
+import pytest
+import requests
+from mock import MagicMock
+
+from wanna.core.utils.registry import RegistryClient, docker_credentials, parse_image_ref
+
+
+def response(status_code, headers=None, json=None, content=b""):
+    mock = MagicMock(status_code=status_code, headers=headers or {}, content=content)
+    mock.json.return_value = json
+    return mock
+
+
+OCI_MANIFEST = "application/vnd.oci.image.manifest.v1+json"
+
+
+def make_image(layers):
+    """
+    Blobs and manifest of a minimal image with the given layers.
+    """
+    config = json.dumps({"architecture": "amd64", "rootfs": {"diff_ids": []}}).encode()
+    blobs = {f"sha256:{hashlib.sha256(blob).hexdigest()}": blob for blob in [config] + layers}
+    descriptors = [{"digest": digest, "size": len(blob)} for digest, blob in blobs.items()]
+    manifest = {"schemaVersion": 2, "config": descriptors[0], "layers": descriptors[1:]}
+    return blobs, json.dumps(manifest).encode()
+
+
+class FakeRegistries:
+    """
+    In-memory implementation of the registry API calls used by RegistryClient, serving any number of hosts.
+    """
+
+    def __init__(self):
+        self.blobs = {}
+        self.manifests = {}
+        self.uploads = {}
+        self.calls = []
+
+    def response(self, status_code, headers=None, content=b"", raw=None):
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers.update(headers or {})
+        response._content = content
+        response.raw = raw
+        return response
+
+    def push_image(self, image, layers):
+        host, name, reference = parse_image_ref(image)
+        blobs, manifest = make_image(layers)
+        self.blobs.setdefault((host, name), {}).update(blobs)
+        return self.put_manifest(host, name, reference, manifest, OCI_MANIFEST)
+
+    def put_manifest(self, host, name, reference, manifest, media_type):
+        content = json.dumps(manifest).encode() if isinstance(manifest, dict) else manifest
+        digest = f"sha256:{hashlib.sha256(content).hexdigest()}"
+        repository = self.manifests.setdefault((host, name), {})
+        repository[reference] = repository[digest] = (content, media_type)
+        return digest
+
+    def request(self, method, url, headers=None, timeout=None, params=None, data=None, stream=False):
+        parsed = urlparse(url)
+        host, path = parsed.netloc, parsed.path[len("/v2/") :]
+        self.calls.append((method, host, path, dict(params or {})))
+        if "/blobs/uploads/" in path:
+            name = path.partition("/blobs/uploads/")[0]
+            session = path.partition("/blobs/uploads/")[2]
+            if method == "POST":
+                source = (host, (params or {}).get("from"))
+                digest = (params or {}).get("mount")
+                if digest and digest in self.blobs.get(source, {}):
+                    self.blobs.setdefault((host, name), {})[digest] = self.blobs[source][digest]
+                    return self.response(201)
+                session = str(uuid.uuid4())
+                self.uploads[session] = name
+                return self.response(202, {"Location": f"/v2/{name}/blobs/uploads/{session}"})
+            content = data.read() if hasattr(data, "read") else data
+            digest = params["digest"]
+            assert f"sha256:{hashlib.sha256(content).hexdigest()}" == digest
+            self.blobs.setdefault((host, self.uploads.pop(session)), {})[digest] = content
+            return self.response(201)
+        name, kind, reference = path.rsplit("/", 2)
+        if kind == "manifests":
+            if method == "PUT":
+                self.put_manifest(host, name, reference, data, headers["Content-Type"])
+                return self.response(201)
+            if reference not in self.manifests.get((host, name), {}):
+                return self.response(404)
+            content, media_type = self.manifests[(host, name)][reference]
+            digest = f"sha256:{hashlib.sha256(content).hexdigest()}"
+            return self.response(200, {"Content-Type": media_type, "Docker-Content-Digest": digest}, content)
+        blob = self.blobs.get((host, name), {}).get(reference)
+        if blob is None:
+            return self.response(404)
+        return self.response(200, {"Content-Length": str(len(blob))}, raw=io.BytesIO(blob))
+
+
+@pytest.fixture(autouse=True)
+def docker_config(tmp_path, monkeypatch):
+    """
+    Empty docker config, the tests do not see the docker login credentials of the machine.
+    """
+    config_dir = tmp_path / "docker-config"
+    config_dir.mkdir()
+    monkeypatch.setenv("DOCKER_CONFIG", str(config_dir))
+    return config_dir
+
+
+class TestRegistryClient:
+    def test_parse_image_ref(self):
+        assert parse_image_ref("localhost:5000/project/train:ctx-abc") == ("localhost:5000", "project/train", "ctx-abc")
+        assert parse_image_ref("gcr.io/project/train") == ("gcr.io", "project/train", "latest")
+        assert parse_image_ref("gcr.io/project/train@sha256:123") == ("gcr.io", "project/train", "sha256:123")
+        assert parse_image_ref("python:3.9") == ("registry-1.docker.io", "library/python", "3.9")
+        assert parse_image_ref("bitnami/redis") == ("registry-1.docker.io", "bitnami/redis", "latest")
+
+    def test_manifest_exists_negotiates_token(self):
+        client = RegistryClient()
+        client.session = MagicMock()
+        client.session.request.side_effect = [
+            response(401, {"WWW-Authenticate": 'Bearer realm="https://auth.example.com/token",service="registry"'}),
+            response(200),
+            response(404),
+        ]
+        client.session.get.return_value = response(200, json={"token": "secret"})
+
+        assert client.manifest_exists("registry.example.com/project/train:ctx-abc")
+        assert not client.manifest_exists("registry.example.com/project/train:ctx-def")
+
+        client.session.get.assert_called_once()
+        assert client.session.get.call_args.kwargs["params"]["scope"] == "repository:project/train:pull,push"
+        last_request = client.session.request.call_args
+        assert last_request.args == ("HEAD", "https://registry.example.com/v2/project/train/manifests/ctx-def")
+        assert last_request.kwargs["headers"]["Authorization"] == "Bearer secret"
+
+    def test_get_digest_from_header(self):
+        client = RegistryClient()
+        client.session = MagicMock()
+        digest = "sha256:" + "1" * 64
+        client.session.request.return_value = response(200, {"Docker-Content-Digest": digest})
+
+        assert client.get_digest("registry.example.com/project/train:v1") == digest
+
+        request = client.session.request.call_args
+        assert request.args == ("HEAD", "https://registry.example.com/v2/project/train/manifests/v1")
+        assert "application/vnd.oci.image.index.v1+json" in request.kwargs["headers"]["Accept"]
+
+    def test_get_digest_from_manifest_body(self):
+        client = RegistryClient()
+        client.session = MagicMock()
+        manifest = b'{"schemaVersion": 2}'
+        client.session.request.side_effect = [response(200), response(200, content=manifest)]
+
+        digest = client.get_digest("registry.example.com/project/train:v1")
+
+        assert digest == f"sha256:{hashlib.sha256(manifest).hexdigest()}"
+        assert [call.args[0] for call in client.session.request.call_args_list] == ["HEAD", "GET"]
+
+    def test_get_digest_of_missing_image(self):
+        client = RegistryClient()
+        client.session = MagicMock()
+        client.session.request.return_value = response(404)
+
+        assert client.get_digest("python:3.9") is None
+        assert client.session.request.call_args.args == (
+            "HEAD",
+            "https://registry-1.docker.io/v2/library/python/manifests/3.9",
+        )
+
+    def test_get_digest_errors(self):
+        client = RegistryClient()
+        client.session = MagicMock()
+        client.session.request.return_value = FakeRegistries().response(500)
+
+        with pytest.raises(requests.HTTPError):
+            client.get_digest("registry.example.com/project/train:v1")
+
+        client.session.request.return_value = response(401, {"WWW-Authenticate": 'Basic realm="registry"'})
+        with pytest.raises(requests.HTTPError, match="No docker login credentials for registry.example.com"):
+            client.get_digest("registry.example.com/project/train:v1")
+
+        client.session.request.return_value = response(401, {"WWW-Authenticate": 'Negotiate realm="registry"'})
+        with pytest.raises(requests.HTTPError, match="Unsupported registry authentication Negotiate"):
+            client.get_digest("registry.example.com/project/train:v1")
+
+    def test_docker_credentials(self, docker_config, monkeypatch):
+        assert docker_credentials("registry.example.com") is None
+
+        helper = docker_config / "docker-credential-fake"
+        helper.write_text('#!/bin/sh\nread host\necho "{\\"Username\\": \\"helper\\", \\"Secret\\": \\"$host\\"}"\n')
+        helper.chmod(helper.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv("PATH", f"{docker_config}{os.pathsep}{os.environ['PATH']}")
+        (docker_config / "config.json").write_text(
+            json.dumps(
+                {
+                    "auths": {
+                        "https://registry.example.com": {"auth": base64.b64encode(b"user:pass:word").decode()},
+                        "helper.example.com": {},
+                    },
+                    "credHelpers": {"helper.example.com": "fake", "https://index.docker.io/v1/": "fake"},
+                }
+            )
+        )
+
+        assert docker_credentials("registry.example.com") == ("user", "pass:word")
+        assert docker_credentials("helper.example.com") == ("helper", "helper.example.com")
+        assert docker_credentials("registry-1.docker.io") == ("helper", "https://index.docker.io/v1/")
+        assert docker_credentials("other.example.com") is None
+
+    def test_request_authenticates_with_docker_login(self, docker_config):
+        (docker_config / "config.json").write_text(
+            json.dumps({"auths": {"registry.example.com": {"auth": base64.b64encode(b"user:secret").decode()}}})
+        )
+        client = RegistryClient()
+        client.session = MagicMock()
+        digest = "sha256:" + "4" * 64
+        client.session.request.side_effect = [
+            response(401, {"WWW-Authenticate": 'Bearer realm="https://auth.example.com/token",service="registry"'}),
+            response(200, {"Docker-Content-Digest": digest}),
+            response(401, {"WWW-Authenticate": 'Basic realm="registry"'}),
+            response(200, {"Docker-Content-Digest": digest}),
+        ]
+        client.session.get.return_value = response(200, json={"token": "registry-token"})
+
+        assert client.get_digest("registry.example.com/project/train:v1") == digest
+        assert client.session.get.call_args.kwargs["auth"] == ("user", "secret")
+
+        # registries without a token service get the credentials in every request
+        assert client.get_digest("registry.example.com/project/serve:v1") == digest
+        assert client.session.request.call_args.kwargs["headers"]["Authorization"] == (
+            f"Basic {base64.b64encode(b'user:secret').decode()}"
+        )
+
+    def test_request_authenticates_gcp_registries_once(self):
+        credentials = MagicMock(valid=True, token="gcp-token")
+        client = RegistryClient(credentials=credentials)
+        client.session = MagicMock()
+        challenge = 'Bearer realm="https://europe-west1-docker.pkg.dev/v2/token",service="europe-west1-docker.pkg.dev"'
+        digest = "sha256:" + "2" * 64
+        client.session.request.side_effect = [
+            response(401, {"WWW-Authenticate": challenge}),
+            response(200, {"Docker-Content-Digest": digest}),
+            response(200, {"Docker-Content-Digest": digest}),
+        ]
+        client.session.get.return_value = response(200, json={"access_token": "registry-token"})
+
+        for _ in range(2):
+            assert client.get_digest("europe-west1-docker.pkg.dev/project/repository/train:v1") == digest
+
+        # the registry token is negotiated with the GCP access token and reused by the next requests
+        client.session.get.assert_called_once()
+        token_request = client.session.get.call_args
+        assert token_request.args == ("https://europe-west1-docker.pkg.dev/v2/token",)
+        assert token_request.kwargs["auth"] == ("oauth2accesstoken", "gcp-token")
+        assert token_request.kwargs["params"] == {
+            "service": "europe-west1-docker.pkg.dev",
+            "scope": "repository:project/repository/train:pull,push",
+        }
+        requests_headers = [call.kwargs["headers"] for call in client.session.request.call_args_list]
+        assert "Authorization" not in requests_headers[0]
+        assert requests_headers[1]["Authorization"] == requests_headers[2]["Authorization"] == "Bearer registry-token"
+
+    def test_add_tag_copies_manifest(self):
+        client = RegistryClient()
+        client.session = MagicMock()
+        manifest = response(200, {"Content-Type": "application/vnd.oci.image.manifest.v1+json"}, content=b"{}")
+        client.session.request.side_effect = [manifest, response(201)]
+
+        client.add_tag("localhost:5000/project/train:ctx-abc", "v1")
+
+        put = client.session.request.call_args
+        assert put.args == ("PUT", "http://localhost:5000/v2/project/train/manifests/v1")
+        assert put.kwargs["data"] == b"{}"
+        assert put.kwargs["headers"]["Content-Type"] == "application/vnd.oci.image.manifest.v1+json"
+
+    def test_copy_image_between_registries(self):
+        registries = FakeRegistries()
+        source_digest = registries.push_image("localhost:5001/dev/train:v1", [b"layer-1", b"layer-2"])
+        client = RegistryClient()
+        client.session.request = registries.request
+
+        digest = client.copy_image(
+            "localhost:5001/dev/train:v1", ["localhost:5002/prod/train:v1", "localhost:5002/prod/train:latest"]
+        )
+
+        assert digest == source_digest
+        assert registries.blobs[("localhost:5002", "prod/train")] == registries.blobs[("localhost:5001", "dev/train")]
+        assert registries.manifests[("localhost:5002", "prod/train")]["latest"] == (
+            registries.manifests[("localhost:5001", "dev/train")]["v1"]
+        )
+        # mounts are only attempted within one registry
+        assert not any(params.get("mount") for _, _, _, params in registries.calls)
+
+        registries.calls.clear()
+        client.copy_image("localhost:5001/dev/train:v1", ["localhost:5002/prod/train:v2"])
+        assert not any(method == "POST" for method, _, _, _ in registries.calls)
+
+    def test_copy_image_mounts_blobs_and_copies_platforms(self):
+        registries = FakeRegistries()
+        amd64 = registries.push_image("localhost:5001/dev/train:amd64", [b"layer-amd64"])
+        arm64 = registries.push_image("localhost:5001/dev/train:arm64", [b"layer-arm64"])
+        index = {
+            "schemaVersion": 2,
+            "manifests": [{"digest": amd64, "size": 1}, {"digest": arm64, "size": 1}],
+        }
+        index_digest = registries.put_manifest(
+            "localhost:5001", "dev/train", "v1", index, "application/vnd.oci.image.index.v1+json"
+        )
+        client = RegistryClient()
+        client.session.request = registries.request
+
+        assert client.copy_image("localhost:5001/dev/train:v1", ["localhost:5001/prod/train:v1"]) == index_digest
+
+        assert {amd64, arm64, "v1"} <= set(registries.manifests[("localhost:5001", "prod/train")])
+        # both platforms share the config blob
+        assert registries.blobs[("localhost:5001", "prod/train")] == registries.blobs[("localhost:5001", "dev/train")]
+        assert not any(method == "GET" and "/blobs/" in path for method, _, path, _ in registries.calls)
+
+    @pytest.mark.skipif(
+        not os.getenv("WANNA_TEST_REGISTRIES"),
+        reason="set WANNA_TEST_REGISTRIES=localhost:5001,localhost:5002 with two running registry:2 containers",
+    )
+    def test_copy_image_between_local_registries(self):
+        source_host, target_host = os.environ["WANNA_TEST_REGISTRIES"].split(",")
+        version = uuid.uuid4().hex[:8]
+        blobs, manifest = make_image([os.urandom(1024)])
+        for digest, blob in blobs.items():
+            upload = requests.post(f"http://{source_host}/v2/wanna/train/blobs/uploads/")
+            location = upload.headers["Location"]
+            location = location if location.startswith("http") else f"http://{source_host}{location}"
+            requests.put(location, params={"digest": digest}, data=blob).raise_for_status()
+        requests.put(
+            f"http://{source_host}/v2/wanna/train/manifests/{version}",
+            data=manifest,
+            headers={"Content-Type": OCI_MANIFEST},
+        ).raise_for_status()
+        client = RegistryClient()
+
+        digest = client.copy_image(f"{source_host}/wanna/train:{version}", [f"{target_host}/wanna/train:{version}"])
+
+        assert digest == f"sha256:{hashlib.sha256(manifest).hexdigest()}"
+        assert client.manifest_exists(f"{target_host}/wanna/train:{version}")
@@ -0,0 +1,33 @@
+from wanna.core.utils.requirements import common_requirements, remove_requirements
+
+
+class TestRequirements:
+    def test_common_requirements(self, tmp_path):
+        first = tmp_path / "first.txt"
+        first.write_text(
+            "--extra-index-url https://example.com/simple\n-r base.txt\nnumpy==1.23.0  # pinned\n"
+            "pandas==1.5.0\nscipy\ntorch==2.0.0 ; sys_platform == 'linux'\n"
+        )
+        second = tmp_path / "second.txt"
+        second.write_text(
+            "-r base.txt\n--extra-index-url https://example.com/simple\npandas == 1.5.0\nnumpy==1.23.0\nscipy\n"
+            "torch==2.0.0 ; sys_platform == 'linux'\n"
+        )
+
+        # unpinned requirements, requirements with markers and -r are left to the images
+        common = common_requirements([first, second])
+        assert common == ["--extra-index-url https://example.com/simple", "numpy==1.23.0", "pandas==1.5.0"]
+        assert remove_requirements(second, common) == [
+            "-r base.txt",
+            "--extra-index-url https://example.com/simple",
+            "scipy",
+            "torch==2.0.0 ; sys_platform=='linux'",
+        ]
+
+    def test_no_common_pins(self, tmp_path):
+        first = tmp_path / "first.txt"
+        first.write_text("--extra-index-url https://example.com/simple\nnumpy==1.23.0\n")
+        second = tmp_path / "second.txt"
+        second.write_text("--extra-index-url https://example.com/simple\nnumpy==1.24.0\n")
+
+        assert common_requirements([first, second]) == []
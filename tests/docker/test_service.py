@@ -0,0 +1,660 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from google import auth
+from google.cloud.devtools.cloudbuild_v1.types import BuildOptions
+from mock import MagicMock, patch
+from pydantic import ValidationError
+from python_on_whales.exceptions import DockerException
+
+from wanna.core.models.docker import (
+    CloudBuildOptionsModel,
+    ContextCompression,
+    DockerBuildCacheModel,
+    DockerBuildConfigModel,
+    DockerCacheType,
+    DockerLocalRetentionModel,
+    ImageBuildType,
+    LocalBuildImageModel,
+    NotebookReadyImageModel,
+)
+from wanna.core.services.docker import DockerService, digest_ref
+from wanna.core.utils.archive import write_tarfile
+from wanna.core.utils.config_loader import load_config_from_yaml
+from wanna.core.utils.wheelhouse import requirement_keys
+
+
+class TestDockerService:
+    sample_pipeline_dir = Path("samples") / "pipelines" / "sklearn"
+
+    @pytest.fixture(autouse=True)
+    def tmp_build_dir(self, tmp_path):
+        # build state, hash indexes and generated contexts must not be written into the samples
+        self.build_dir = tmp_path / "build"
+
+    def get_docker_service(self, **kwargs) -> DockerService:
+        auth.default = MagicMock(
+            return_value=(
+                None,
+                None,
+            )
+        )
+        config = load_config_from_yaml(self.sample_pipeline_dir / "wanna.yaml", "default")
+        service = DockerService(
+            docker_model=config.docker,  # type: ignore
+            gcp_profile=config.gcp_profile,
+            version="test",
+            work_dir=self.sample_pipeline_dir,
+            wanna_project_name=config.wanna_project.name,
+            **kwargs,
+        )
+        service.build_dir = self.build_dir
+        return service
+
+    @pytest.mark.usefixtures("mock_registry_get_digest")
+    @patch("wanna.core.services.docker.docker")
+    def test_build_images_in_parallel(self, docker_mock):
+        docker_mock.build = MagicMock(return_value=None)
+        docker_mock.pull = MagicMock(return_value=None)
+        service = self.get_docker_service()
+
+        service.build_images(["train", "serve", "train"])
+
+        docker_mock.build.assert_called_once()
+        docker_mock.pull.assert_not_called()
+        assert set(service.image_store.keys()) == {"train", "serve"}
+        assert service.image_digests == {"serve": "sha256:" + "0" * 64}
+        model, _, tag = service.image_store["serve"]
+        assert model.build_type == ImageBuildType.provided_image
+        assert tag == "europe-docker.pkg.dev/vertex-ai/prediction/xgboost-cpu.1-4:latest"
+
+        # images are now served from image_store
+        service.get_image("train")
+        docker_mock.build.assert_called_once()
+
+    @pytest.mark.parametrize("env_name", ["WANNA_DOCKER_BUILD_WORKERS", "WANNA_DOCKER_PUSH_WORKERS"])
+    @pytest.mark.parametrize("value", ["0", "-1", "many"])
+    def test_invalid_workers_override(self, env_name, value, monkeypatch):
+        monkeypatch.setenv(env_name, value)
+        with pytest.raises(ValidationError, match=env_name):
+            self.get_docker_service()
+
+    @patch("wanna.core.services.docker.docker")
+    def test_build_images_propagates_errors(self, docker_mock):
+        docker_mock.build = MagicMock(side_effect=RuntimeError("build failed"))
+        docker_mock.pull = MagicMock(return_value=None)
+        service = self.get_docker_service()
+
+        with pytest.raises(RuntimeError):
+            service.build_images(["train", "serve"])
+        assert "train" not in service.image_store
+
+    @patch("wanna.core.services.docker.docker")
+    def test_build_images_pushes_in_background(self, docker_mock):
+        docker_mock.build = MagicMock(return_value=None)
+        service = self.get_docker_service()
+
+        service.build_images(["train", "serve"], push=True)
+
+        tags = service._get_image_tags(service.image_store["train"][0])
+        service.push_image(tags)
+        docker_mock.image.push.assert_called_once_with(tags, False)
+
+        # the push executor is shut down by build_images, its threads exit after the started pushes
+        assert service._push_executor is None
+        for thread in threading.enumerate():
+            if thread.name.startswith("docker-push"):
+                thread.join(timeout=5)
+                assert not thread.is_alive()
+
+    @patch("wanna.core.services.docker.docker")
+    def test_background_push_errors_are_raised(self, docker_mock):
+        docker_mock.build = MagicMock(return_value=None)
+        docker_mock.image.push = MagicMock(side_effect=RuntimeError("push failed"))
+        service = self.get_docker_service()
+
+        # raised by build_images if the push fails before the build finishes, otherwise by push_image
+        with pytest.raises(RuntimeError):
+            service.build_images(["train"], push=True)
+            service.push_image_ref("train")
+        assert service._push_executor is None
+
+    @patch("wanna.core.services.docker.docker")
+    def test_cloud_build_source(self, docker_mock):
+        service = self.get_docker_service()
+        source, steps = service._get_cloud_build_source(f"{service.context_store}/abc.tar.gz")
+        assert source.storage_source.bucket == service.bucket
+        assert source.storage_source.object_ == "build/docker/contexts/abc.tar.gz"
+        assert steps == []
+
+        service.cloud_build_context_compression = ContextCompression.zstd
+        source, steps = service._get_cloud_build_source(f"{service.context_store}/abc.tar.zst")
+        assert source is None
+        assert len(steps) == 1
+        assert "zstd -dc" in steps[0].args[1]
+        assert f"gs://{service.bucket}/build/docker/contexts/abc.tar.zst" in steps[0].args[1]
+
+    @patch("wanna.core.services.docker.docker")
+    def test_upload_build_context_is_content_addressed(self, docker_mock, tmp_path):
+        context = tmp_path / "context"
+        context.mkdir()
+        (context / "Dockerfile").write_text("FROM python:3.9")
+        store = tmp_path / "store"
+        store.mkdir()
+        service = self.get_docker_service()
+        service.context_store = str(store)
+        service.cloud_build_stream_context = True
+
+        with patch("wanna.core.services.docker.write_tarfile", wraps=write_tarfile) as write_tarfile_mock:
+            first = service._upload_build_context(context, [context / "Dockerfile"], "train")
+            assert service._upload_build_context(context, [context / "Dockerfile"], "train") == first
+            write_tarfile_mock.assert_called_once()
+        assert os.listdir(store) == [os.path.basename(first)]
+
+        (context / "main.py").write_text("print('hello')")
+        assert service._upload_build_context(context, [context / "Dockerfile"], "train") != first
+
+    @patch("wanna.core.services.docker.docker")
+    @patch("wanna.core.services.docker.CloudBuildClient")
+    def test_cloud_build_batch(self, cloud_build_client_mock, docker_mock):
+        service = self.get_docker_service()
+        service.cloud_build = True
+        service.cloud_build_batch = True
+        service.image_models = service.image_models + [
+            LocalBuildImageModel(
+                name="evaluate",
+                build_type=ImageBuildType.local_build_image,
+                context_dir=".",
+                dockerfile="Dockerfile.train",
+            )
+        ]
+        service._upload_build_context = MagicMock(return_value=f"{service.context_store}/abc.tar.gz")
+
+        service.build_images(["train", "serve", "evaluate"])
+
+        service._upload_build_context.assert_called_once()
+        cloud_build_client_mock.return_value.create_build.assert_called_once()
+        build = cloud_build_client_mock.return_value.create_build.call_args.kwargs["request"].build
+        assert build.source.storage_source.object_ == "build/docker/contexts/abc.tar.gz"
+        assert [step.id for step in build.steps] == ["build-train", "build-evaluate"]
+        assert all(list(step.wait_for) == ["-"] for step in build.steps)
+        assert len(build.images) == 4
+        assert service.build_state.get("train", "wanna-samples").built_at
+        assert set(service.image_store.keys()) == {"train", "serve", "evaluate"}
+
+    @patch("wanna.core.services.docker.docker")
+    @patch("wanna.core.services.docker.CloudBuildClient")
+    def test_cloud_build_options(self, cloud_build_client_mock, docker_mock):
+        service = self.get_docker_service()
+        service.cloud_build = True
+        service.cloud_build_batch = True
+        service.cloud_build_options = CloudBuildOptionsModel(machine_type="E2_HIGHCPU_8", timeout_s=3600)
+        service.image_models = service.image_models + [
+            LocalBuildImageModel(
+                name="cuda",
+                build_type=ImageBuildType.local_build_image,
+                context_dir=".",
+                dockerfile="Dockerfile.train",
+                cloud_build_options=CloudBuildOptionsModel(worker_pool="gpu-pool", timeout_s=10800),
+            )
+        ]
+        service._upload_build_context = MagicMock(return_value=f"{service.context_store}/abc.tar.gz")
+
+        service.build_images(["train", "cuda"])
+
+        requests = [c.kwargs["request"] for c in cloud_build_client_mock.return_value.create_build.call_args_list]
+        assert len(requests) == 2
+        default, cuda = requests
+        assert [step.id for step in default.build.steps] == ["build-train"]
+        assert default.build.options.machine_type == BuildOptions.MachineType.E2_HIGHCPU_8
+        assert default.build.timeout.seconds == 3600
+        assert default.parent == ""
+        assert [step.id for step in cuda.build.steps] == ["build-cuda"]
+        assert cuda.build.options.machine_type == BuildOptions.MachineType.UNSPECIFIED
+        assert cuda.parent == "projects/your-gcp-project-id/locations/europe-west1"
+        assert cuda.build.options.pool.name == f"{cuda.parent}/workerPools/gpu-pool"
+        assert cuda.build.timeout.seconds == 10800
+
+    @patch("wanna.core.services.docker.docker")
+    def test_bake_images(self, docker_mock):
+        service = self.get_docker_service()
+        service.bake = True
+        service.build_config = DockerBuildConfigModel(build_args={"PYTHON_VERSION": "3.9"}, target="runtime")
+        service.image_models = service.image_models + [
+            LocalBuildImageModel(
+                name="evaluate",
+                build_type=ImageBuildType.local_build_image,
+                context_dir=".",
+                dockerfile="Dockerfile.train",
+            )
+        ]
+
+        service.build_images(["train", "serve", "evaluate"])
+
+        docker_mock.build.assert_not_called()
+        docker_mock.buildx.bake.assert_called_once()
+        assert docker_mock.buildx.bake.call_args.kwargs["targets"] == ["train", "evaluate"]
+        with open(service.build_dir / "docker-bake.json") as f:
+            bake_file = json.load(f)
+        assert bake_file["group"]["default"]["targets"] == ["train", "evaluate"]
+        train = bake_file["target"]["train"]
+        assert train["context"] == str(self.sample_pipeline_dir / ".")
+        assert train["dockerfile"] == str(self.sample_pipeline_dir / "Dockerfile.train")
+        assert train["tags"][0].endswith("/train:test")
+        assert train["args"] == {"PYTHON_VERSION": "3.9"}
+        assert train["target"] == "runtime"
+        assert service.build_state.get("evaluate", "wanna-samples").built_at
+        assert set(service.image_store.keys()) == {"train", "serve", "evaluate"}
+        assert service.image_store["train"][1] == docker_mock.image.inspect.return_value
+
+    @patch("wanna.core.services.docker.docker")
+    def test_notebook_image_wheelhouse(self, docker_mock, tmp_path):
+        requirements = tmp_path / "requirements.txt"
+        requirements.write_text("numpy==1.23.0\npandas==1.5.0\n")
+        wheelhouse = tmp_path / "wheelhouse"
+        (wheelhouse / requirement_keys(requirements)["numpy==1.23.0"]).mkdir(parents=True)
+        (wheelhouse / requirement_keys(requirements)["numpy==1.23.0"] / "numpy.whl").write_text("numpy")
+
+        def build_wheels(image, command, **kwargs):
+            assert "numpy" not in command[2]
+            (wheelhouse / requirement_keys(requirements)["pandas==1.5.0"]).mkdir()
+            (wheelhouse / requirement_keys(requirements)["pandas==1.5.0"] / "pandas.whl").write_text("pandas")
+
+        docker_mock.run = MagicMock(side_effect=build_wheels)
+        service = self.get_docker_service()
+        service.image_models = [
+            NotebookReadyImageModel(
+                name="notebook-wheels",
+                build_type=ImageBuildType.notebook_ready_image,
+                requirements_txt=requirements,
+                pip_cache=True,
+                wheelhouse=wheelhouse,
+            )
+        ]
+
+        service.get_image("notebook-wheels")
+
+        docker_mock.run.assert_called_once()
+        context_dir = docker_mock.build.call_args.args[0]
+        assert sorted(path.name for path in (context_dir / "wheelhouse").iterdir()) == ["numpy.whl", "pandas.whl"]
+        dockerfile = docker_mock.build.call_args.kwargs["file"].read_text()
+        assert "--mount=type=cache,target=/root/.cache/pip" in dockerfile
+        assert "--find-links /tmp/wheelhouse -r requirements.txt" in dockerfile
+
+    @patch("wanna.core.services.docker.docker")
+    def test_notebook_common_base(self, docker_mock, tmp_path):
+        docker_mock.build = MagicMock(return_value=None)
+        requirements = {
+            "notebook-a": "numpy==1.23.0\npandas==1.5.0\nscipy\n",
+            "notebook-b": "--extra-index-url https://example.com/simple\nnumpy == 1.23.0\npandas==1.5.0\ntorch==2.0\n",
+            "notebook-c": "numpy==1.23.0\n",
+        }
+        service = self.get_docker_service()
+        service.image_models = []
+        for name, content in requirements.items():
+            (tmp_path / f"{name}.txt").write_text(content)
+            service.image_models.append(
+                NotebookReadyImageModel(
+                    name=name,
+                    build_type=ImageBuildType.notebook_ready_image,
+                    requirements_txt=tmp_path / f"{name}.txt",
+                    base_image="python:3.9" if name == "notebook-c" else "base-cpu:latest",
+                )
+            )
+        service._add_common_base_images()
+
+        common = service._common_bases["notebook-a"]
+        assert service._common_bases == {"notebook-a": common, "notebook-b": common}
+        assert service._common_requirements == {common.name: ["numpy==1.23.0", "pandas==1.5.0"]}
+
+        service.build_images(["notebook-a", "notebook-b"])
+
+        builds = {c.kwargs["tags"][0].rsplit("/", 1)[1]: c for c in docker_mock.build.call_args_list}
+        # the common image is built first, the images built FROM it then in parallel
+        assert list(builds)[0] == f"{common.name}:test"
+        assert set(builds) == {f"{common.name}:test", "notebook-a:test", "notebook-b:test"}
+        common_dir = builds[f"{common.name}:test"].args[0]
+        assert (common_dir / "requirements.txt").read_text() == "numpy==1.23.0\npandas==1.5.0\n"
+        b_dir = builds["notebook-b:test"].args[0]
+        assert (b_dir / "requirements.txt").read_text() == "--extra-index-url https://example.com/simple\ntorch==2.0\n"
+        common_tag = builds[f"{common.name}:test"].kwargs["tags"][0]
+        assert f"FROM {common_tag}" in (b_dir / "notebook-b.Dockerfile").read_text()
+        assert set(service.image_store) == {common.name, "notebook-a", "notebook-b"}
+
+    @patch("wanna.core.services.docker.docker")
+    def test_build_state_skips_unchanged_images(self, docker_mock):
+        docker_mock.build = MagicMock(return_value=None)
+        service = self.get_docker_service()
+        service.docker_repository = "wanna_samples"
+        assert service.get_build_status()[0][:2] == ("train", "stale (never built)")
+        # the status neither records the build state nor persists the file hash index
+        assert not service.build_dir.exists()
+
+        _, _, tag = service.get_image("train")
+        docker_mock.build.assert_called_once()
+        state = service.build_state.get("train", "wanna_samples")
+        assert state.tags == [tag, tag.replace(":test", ":latest")]
+        assert state.build_duration_s is not None
+
+        digest = "sha256:" + "2" * 64
+        docker_mock.image.inspect.return_value.repo_digests = [digest_ref(tag, digest)]
+        service.push_image([tag])
+        docker_mock.image.push.assert_called_once()
+        assert service.build_state.get("train", "wanna_samples").pushed_digest == digest
+
+        service = self.get_docker_service()
+        service.docker_repository = "wanna_samples"
+        service.get_image("train")
+        docker_mock.build.assert_called_once()
+        service.push_image([tag])
+        docker_mock.image.push.assert_called_once()
+        assert service.get_build_status()[0][:2] == ("train", "up to date")
+
+        service.build_config = DockerBuildConfigModel(build_args={"PYTHON_VERSION": "3.10"})
+        assert service.get_build_status()[0][:2] == ("train", "stale (build args changed)")
+        service._get_image("train")
+        assert docker_mock.build.call_count == 2
+        assert service.build_state.get("train", "wanna_samples").pushed_digest is None
+
+    @patch("wanna.core.services.docker.docker")
+    def test_build_state_skips_unchanged_notebook_images(self, docker_mock, tmp_path):
+        docker_mock.build = MagicMock(return_value=None)
+        requirements = tmp_path / "requirements.txt"
+        requirements.write_text("numpy==1.23.0\n")
+        model = NotebookReadyImageModel(
+            name="notebook", build_type=ImageBuildType.notebook_ready_image, requirements_txt=requirements
+        )
+        for _ in range(2):
+            # the build context of notebook images is generated in build/docker/notebook
+            service = self.get_docker_service()
+            service.image_models = [model]
+            service.get_image("notebook")
+
+        docker_mock.build.assert_called_once()
+        assert service.get_build_status()[0][1].startswith("up to date")
+        # without pip_cache and wheelhouse, the Dockerfile does not need BuildKit
+        dockerfile = docker_mock.build.call_args.kwargs["file"].read_text()
+        assert "--mount" not in dockerfile
+        assert "RUN pip install -r requirements.txt" in dockerfile
+
+    @patch("wanna.core.services.docker.docker")
+    def test_build_status_and_lint_are_read_only(self, docker_mock, tmp_path):
+        docker_mock.build = MagicMock(return_value=None)
+        requirements = tmp_path / "requirements.txt"
+        requirements.write_text("numpy==1.23.0\n")
+        wheelhouse = tmp_path / "wheelhouse"
+        (wheelhouse / requirement_keys(requirements)["numpy==1.23.0"]).mkdir(parents=True)
+        (wheelhouse / requirement_keys(requirements)["numpy==1.23.0"] / "numpy.whl").write_text("numpy")
+        service = self.get_docker_service()
+        service.image_models = [
+            NotebookReadyImageModel(
+                name="notebook",
+                build_type=ImageBuildType.notebook_ready_image,
+                requirements_txt=requirements,
+                wheelhouse=wheelhouse,
+            )
+        ]
+
+        assert service.get_build_status()[0][1] == "stale (never built)"
+        assert not (tmp_path / "build" / "notebook").exists()
+
+        service.get_image("notebook")
+        assert service.get_build_status()[0][1].startswith("up to date")
+
+        # the new requirement has no wheel yet, it is built only by the next build
+        requirements.write_text("numpy==1.23.0\npandas==1.5.0\n")
+        assert service.get_build_status()[0][1] == "stale (context changed)"
+        assert service.lint_images()[0].name == "notebook"
+        assert (tmp_path / "build" / "notebook" / "requirements.txt").read_text() == "numpy==1.23.0\n"
+        docker_mock.run.assert_not_called()
+
+    @patch("wanna.core.services.docker.docker")
+    def test_gc_images(self, docker_mock):
+        service = self.get_docker_service()
+        repository = service._get_image_tags(service.find_image_model_by_name("train"))[0].rsplit(":", 1)[0]
+
+        def local_image(tags, days_ago, size_gb):
+            image = MagicMock(repo_tags=tags, size=int(size_gb * 1024**3))
+            image.created = datetime.now(timezone.utc) - timedelta(days=days_ago)
+            return image
+
+        images = [
+            local_image([f"{repository}:1", "other/image:1"], 30, 1),
+            local_image([f"{repository}:2"], 20, 1),
+            local_image([f"{repository}:3"], 10, 2),
+            local_image([f"{repository}:4", f"{repository}:latest"], 1, 2),
+            local_image(["other/image:latest"], 100, 10),
+        ]
+        docker_mock.image.list = MagicMock(return_value=images)
+        # version 1 was used by a build yesterday
+        service.build_state.touch_local_image([f"{repository}:1"])
+
+        removed = service.gc_images(DockerLocalRetentionModel(keep_versions=3), dry_run=True)
+        assert removed == [("train", [f"{repository}:2"], 1024**3)]
+        docker_mock.image.remove.assert_not_called()
+
+        removed = service.gc_images(DockerLocalRetentionModel(keep_versions=3, max_size_gb=4))
+        # only the tags of the project are removed, other tags of the same image stay
+        assert [tags for _, tags, _ in removed] == [[f"{repository}:2"], [f"{repository}:3"]]
+        docker_mock.image.remove.assert_any_call([f"{repository}:3"], prune=True)
+        # dangling images of the whole docker host are pruned only on request
+        docker_mock.image.prune.assert_not_called()
+
+        # an image that docker fails to remove is kept and does not fail the build
+        docker_mock.image.remove.side_effect = [DockerException(["docker", "image", "remove"], 1), None]
+        removed = service.gc_images(DockerLocalRetentionModel(keep_versions=3, max_size_gb=4, prune_dangling=True))
+        assert [tags for _, tags, _ in removed] == [[f"{repository}:3"]]
+        docker_mock.image.prune.assert_called_once()
+
+    @patch("wanna.core.services.docker.docker")
+    def test_promote_images(self, docker_mock):
+        source = self.get_docker_service()
+        target = self.get_docker_service()
+        target.docker_project_id = "prod-project"
+        target.registry_client = MagicMock()
+        target.registry_client.copy_image.return_value = "sha256:" + "3" * 64
+
+        target.promote_images(source)
+
+        docker_mock.build.assert_not_called()
+        target.registry_client.copy_image.assert_called_once()
+        source_tag, target_tags = target.registry_client.copy_image.call_args.args
+        assert source_tag == source._get_image_tags(source.find_image_model_by_name("train"))[0]
+        assert source_tag.endswith("/train:test") and "/prod-project/" not in source_tag
+        assert [tag.replace("/prod-project/", f"/{source.docker_project_id}/") for tag in target_tags] == [
+            source_tag,
+            source_tag.replace(":test", ":latest"),
+        ]
+        assert target.image_digests == {"train": "sha256:" + "3" * 64}
+
+        target.registry_client.get_digest.return_value = None
+        with pytest.raises(ValueError):
+            target.promote_images(source, ["train"])
+
+    @patch("wanna.core.services.docker.docker")
+    def test_remote_cache_hit_skips_build(self, docker_mock):
+        docker_mock.build = MagicMock(return_value=None)
+        service = self.get_docker_service()
+        service.remote_cache = True
+        service.registry_client = MagicMock()
+        service.registry_client.manifest_exists.return_value = True
+        service.registry_client.get_digest.return_value = "sha256:" + "3" * 64
+
+        _, image, tag = service.get_image("train")
+
+        docker_mock.build.assert_not_called()
+        assert image is None
+        cache_tag = service.registry_client.manifest_exists.call_args.args[0]
+        assert cache_tag.startswith(tag.rpartition(":")[0] + ":ctx-")
+        assert [c.args for c in service.registry_client.add_tag.call_args_list] == [
+            (cache_tag, "test"),
+            (cache_tag, "latest"),
+        ]
+        service.push_image([tag])
+        docker_mock.image.push.assert_not_called()
+
+    @patch("wanna.core.services.docker.docker")
+    def test_remote_cache_hit_is_not_a_local_image(self, docker_mock):
+        docker_mock.build = MagicMock(return_value=None)
+        digest = "sha256:" + "3" * 64
+        for version in ["test", "test", "v2"]:
+            service = self.get_docker_service()
+            service.version = version
+            service.remote_cache = True
+            service.registry_client = MagicMock()
+            service.registry_client.manifest_exists.return_value = True
+            service.registry_client.get_digest.return_value = digest
+
+            _, _, tag = service.get_image("train")
+            service.push_image([tag, tag.replace(f":{version}", ":latest")])
+
+            docker_mock.build.assert_not_called()
+            docker_mock.image.push.assert_not_called()
+            state = service.build_state.get("train", service.docker_repository)
+            assert state.pushed_digest == digest
+            assert state.built_at is None
+            assert service.build_state.local_image_usage() == {}
+            assert service.get_build_status()[0][1] == "up to date"
+        # the second run skips the image, the new version is tagged from the remote cache again
+        assert [c.args[1] for c in service.registry_client.add_tag.call_args_list] == ["v2", "latest"]
+
+    @patch("wanna.core.services.docker.docker")
+    def test_remote_cache_tag_covers_exact_context(self, docker_mock, tmp_path):
+        service = self.get_docker_service()
+        context_dir = tmp_path / "context"
+        (context_dir / "tests").mkdir(parents=True)
+        (context_dir / "Dockerfile").write_text("FROM python:3.9\nCOPY . .\n")
+        (context_dir / "main.py").write_text("print('hello')\n")
+        (context_dir / "tests" / "test_main.py").write_text("")
+        (context_dir / ".dockerignore").write_text("*.log\n")
+        state = service._get_build_state("train", context_dir, context_dir / "Dockerfile", ["repo/train:test"], {})
+
+        def cache_tag() -> str:
+            return service._get_cache_tag("repo/train:test", state, context_dir, context_dir / "Dockerfile")
+
+        tag = cache_tag()
+        assert tag.startswith("repo/train:ctx-")
+        (context_dir / "debug.log").write_text("ignored by .dockerignore")
+        assert cache_tag() == tag
+        # renamed files and files the context hash of the build state skips are sent to docker too
+        (context_dir / "main.py").rename(context_dir / "app.py")
+        renamed = cache_tag()
+        assert renamed != tag
+        (context_dir / "tests" / "test_main.py").write_text("assert True\n")
+        assert cache_tag() != renamed
+
+    @patch("wanna.core.services.docker.docker")
+    def test_remote_cache_miss_tags_pushed_image(self, docker_mock):
+        docker_mock.build = MagicMock(return_value=None)
+        service = self.get_docker_service()
+        service.remote_cache = True
+        service.registry_client = MagicMock()
+        service.registry_client.manifest_exists.return_value = False
+
+        _, _, tag = service.get_image("train")
+        docker_mock.build.assert_called_once()
+        service.push_image([tag])
+
+        docker_mock.image.push.assert_called_once()
+        cache_tag = service.registry_client.manifest_exists.call_args.args[0]
+        service.registry_client.add_tag.assert_called_once_with(tag, cache_tag.rpartition(":")[2])
+
+    @patch("wanna.core.services.docker.docker")
+    def test_build_cache_args(self, docker_mock):
+        docker_mock.build = MagicMock(return_value=None)
+        service = self.get_docker_service()
+        service.build_config = DockerBuildConfigModel(
+            build_cache=DockerBuildCacheModel(type=DockerCacheType.registry, mode="min")
+        )
+
+        _, _, tag = service.get_image("train")
+
+        image = tag.rpartition(":")[0]
+        kwargs = docker_mock.build.call_args.kwargs
+        assert "build_cache" not in kwargs
+        assert kwargs["cache_from"] == {"type": "registry", "ref": f"{image}:buildcache"}
+        assert kwargs["cache_to"] == {"type": "registry", "ref": f"{image}:buildcache", "mode": "min"}
+        assert service._get_cloud_build_cache_args([tag]) == [
+            "--cache-from",
+            f"{image}:latest",
+            "--build-arg",
+            "BUILDKIT_INLINE_CACHE=1",
+        ]
+
+        service.build_config = DockerBuildConfigModel(build_cache=DockerBuildCacheModel(type=DockerCacheType.local))
+        cache_args = service._get_build_cache_args("train", [tag])
+        assert cache_args["cache_to"]["dest"] == str(service.build_dir / "cache" / "train")
+
+    @patch("wanna.core.services.docker.docker")
+    def test_provided_image_must_exist(self, docker_mock):
+        service = self.get_docker_service()
+        service.registry_client = MagicMock()
+        service.registry_client.get_digest.return_value = None
+
+        with pytest.raises(ValueError):
+            service.get_image("serve")
+
+    def test_digest_ref(self):
+        digest = "sha256:" + "1" * 64
+        assert digest_ref("gcr.io/project/train:v1", digest) == f"gcr.io/project/train@{digest}"
+        assert digest_ref("localhost:5000/train", digest) == f"localhost:5000/train@{digest}"
+        assert digest_ref(f"gcr.io/project/train@{digest}", digest) == f"gcr.io/project/train@{digest}"
+
+    @patch("wanna.core.services.docker.docker")
+    def test_pin_digests(self, docker_mock):
+        docker_mock.build = MagicMock(return_value=None)
+        service = self.get_docker_service()
+        service.pin_digests = True
+        service.registry_client = MagicMock()
+        digest = "sha256:" + "1" * 64
+
+        # nothing is pushed by a build without push, the image is not in the registry yet
+        service.registry_client.get_digest.return_value = None
+        service.build_images(["train"])
+        assert service.get_image("train")[2].endswith("/train:test")
+        docker_mock.image.push.assert_not_called()
+
+        service = self.get_docker_service()
+        service.pin_digests = True
+        service.registry_client = MagicMock()
+        service.registry_client.get_digest.return_value = digest
+        service.build_images(["train", "serve"], push=True)
+        _, _, train_ref = service.get_image("train")
+        _, _, serve_ref = service.get_image("serve")
+
+        assert train_ref.endswith(f"/train@{digest}")
+        assert serve_ref == f"europe-docker.pkg.dev/vertex-ai/prediction/xgboost-cpu.1-4@{digest}"
+        # the built image is pushed to get its registry digest
+        docker_mock.image.push.assert_called_once()
+        assert service.image_digests == {"train": digest, "serve": digest}
+
+        # a later push of the digest reference is a no-op
+        service.push_image([train_ref])
+        docker_mock.image.push.assert_called_once()
+
+    @patch("wanna.core.services.docker.run")
+    @patch("wanna.core.services.docker.docker")
+    def test_build_telemetry(self, docker_mock, run_mock, tmp_path):
+        docker_mock.build = MagicMock(return_value=iter(["#5 [2/2] RUN make", "#5 DONE 2.0s"]))
+        docker_mock.image.inspect.return_value = MagicMock(size=300 * 1024**2, repo_tags=[])
+        run_mock.return_value = "1024\n0\n2048"
+        service = self.get_docker_service()
+        service.build_telemetry = True
+
+        service.build_images(["train", "serve"])
+        service.push_image(docker_mock.image.inspect.return_value.repo_tags + [service.image_store["train"][2]])
+        service.write_build_report()
+
+        assert docker_mock.build.call_args.kwargs["stream_logs"] is True
+        with open(tmp_path / "build" / "build-report.json") as f:
+            report = {image["name"]: image for image in json.load(f)}
+        assert report["serve"]["status"] == "provided"
+        assert report["train"]["status"] == "built"
+        assert report["train"]["steps"] == [{"name": "[2/2] RUN make", "cached": False, "duration_s": 2.0}]
+        assert report["train"]["cache_hit_ratio"] == 0.0
+        assert report["train"]["layer_sizes"] == [1024, 0, 2048]
+        assert report["train"]["push_duration_s"] is not None
@@ -0,0 +1,44 @@
+from wanna.core.utils.wheelhouse import collect_wheels, missing_requirements, requirement_keys, wheel_script
+
+
+class TestWheelhouse:
+    def test_requirement_keys(self, tmp_path):
+        requirements = tmp_path / "requirements.txt"
+        requirements.write_text(
+            "# pinned deps\n--extra-index-url https://example.com/simple\nnumpy==1.23.0\n"
+            "pandas  ==1.5.0  # comment\n\nscikit-learn\n"
+        )
+        keys = requirement_keys(requirements)
+        assert list(keys) == ["numpy==1.23.0", "pandas ==1.5.0", "scikit-learn"]
+
+        requirements.write_text("numpy==1.23.0\npandas ==1.5.1\n")
+        changed = requirement_keys(requirements)
+        assert changed["numpy==1.23.0"] == keys["numpy==1.23.0"]
+        assert changed["pandas ==1.5.1"] != keys["pandas ==1.5.0"]
+
+    def test_only_missing_requirements_are_built(self, tmp_path):
+        wheelhouse = tmp_path / "wheelhouse"
+        keys = {"numpy==1.23.0": "aaa", "pandas==1.5.0": "bbb"}
+        (wheelhouse / "aaa").mkdir(parents=True)
+        (wheelhouse / "aaa" / "numpy-1.23.0-cp39-cp39-linux_x86_64.whl").write_text("wheel")
+
+        missing = missing_requirements(wheelhouse, keys)
+        assert missing == {"pandas==1.5.0": "bbb"}
+        script = wheel_script(missing)
+        assert "pip wheel --wheel-dir /wheelhouse/.tmp-bbb pandas==1.5.0" in script
+        assert "numpy" not in script
+
+    def test_collect_wheels(self, tmp_path):
+        wheelhouse = tmp_path / "wheelhouse"
+        for key, wheels in {"aaa": ["numpy.whl"], "bbb": ["pandas.whl", "numpy.whl"], "ccc": ["torch.whl"]}.items():
+            (wheelhouse / key).mkdir(parents=True)
+            for wheel in wheels:
+                (wheelhouse / key / wheel).write_text(wheel)
+        output_dir = tmp_path / "context" / "wheelhouse"
+        (output_dir).mkdir(parents=True)
+        (output_dir / "stale.whl").write_text("stale")
+
+        wheels = collect_wheels(wheelhouse, {"numpy": "aaa", "pandas": "bbb"}, output_dir)
+
+        assert wheels == ["numpy.whl", "pandas.whl"]
+        assert sorted(path.name for path in output_dir.iterdir()) == ["numpy.whl", "pandas.whl"]
@@ -88,6 +88,32 @@ class MockStorageClient:
     def get_bucket(self, bucket_name: str):
         return Bucket(client=self, name=bucket_name)
 
+    def bucket(self, bucket_name: str):
+        return MockBucket(bucket_name)
+
+
+class MockBucket:
+    """
+    Empty bucket, every object is missing.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def get_blob(self, blob_name: str):
+        return None
+
+    def blob(self, blob_name: str):
+        return MockBlob(blob_name)
+
+
+class MockBlob:
+    def __init__(self, name: str):
+        self.name = name
+
+    def exists(self) -> bool:
+        return False
+
 
 def mock_get_credentials() -> Optional[Credentials]:
     return None
@@ -109,6 +135,10 @@ def mock_upload_file(any, src, dest):
     return None
 
 
+def mock_get_digest(any, image: str) -> Optional[str]:
+    return "sha256:" + "0" * 64
+
+
 def mock_list_running_instances(project_id: str, region: str):
     tensorboard_names = ["tb1", "tb2"]
     return [
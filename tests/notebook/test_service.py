@@ -89,7 +89,7 @@ class TestNotebookService:
         nb_service = NotebookService(config=config, workdir=Path("."))
         instance = config.notebooks[0]
         nb_service.docker_service._build_image = MagicMock(return_value=(None, None, None))
-        nb_service.docker_service._pull_image = MagicMock(return_value=None)
+        nb_service.docker_service._get_provided_image_digest = MagicMock(return_value=None)
         request = nb_service._create_instance_request(instance)
         assert (
             request.instance.container_image.repository
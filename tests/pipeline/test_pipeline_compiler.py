@@ -0,0 +1,121 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from wanna.core.utils.pipeline_compiler import (
+    compile_fingerprint,
+    compile_pipeline_isolated,
+    is_compiled,
+    local_sources,
+    save_fingerprint,
+)
+
+PIPELINE = """
+import os
+
+from kfp.v2 import dsl
+
+
+@dsl.component
+def hello(text: str) -> str:
+    return text
+
+
+@dsl.pipeline(name=os.environ["TEST_PIPELINE_NAME"], pipeline_root="gs://bucket/root")
+def wanna_pipeline(text: str = "hello"):
+    hello(text=text)
+"""
+
+LOCAL_PIPELINE = """
+import json
+
+from kfp.v2 import dsl
+
+from project.config import PIPELINE_NAME
+from project.components import train
+
+COMPONENT = "components/predict.yaml"
+"""
+
+
+def write_local_pipeline(root):
+    (root / "project" / "components").mkdir(parents=True)
+    (root / "pipeline.py").write_text(LOCAL_PIPELINE)
+    (root / "project" / "__init__.py").write_text("")
+    (root / "project" / "config.py").write_text('PIPELINE_NAME = "local"\n')
+    (root / "project" / "components" / "__init__.py").write_text("")
+    (root / "project" / "components" / "train.py").write_text("from ..utils import helper\n")
+    (root / "project" / "utils.py").write_text("def helper():\n    pass\n")
+    (root / "project" / "unused.py").write_text("")
+    (root / "components").mkdir()
+    (root / "components" / "predict.yaml").write_text("name: predict\n")
+
+
+class TestPipelineCompiler:
+    def test_pipelines_are_isolated_in_worker(self, tmp_path):
+        jobs = []
+        for name in ("first-pipeline", "second-pipeline"):
+            # both pipelines are in pipeline.py, the second one must not get the cached module of the first one
+            (tmp_path / name).mkdir()
+            (tmp_path / name / "pipeline.py").write_text(PIPELINE)
+            jobs.append(
+                dict(
+                    pyfile=str(tmp_path / name / "pipeline.py"),
+                    function_name="wanna_pipeline",
+                    pipeline_parameters={"text": name},
+                    package_path=str(tmp_path / f"{name}.json"),
+                    env={"TEST_PIPELINE_NAME": name},
+                )
+            )
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            for future in [executor.submit(compile_pipeline_isolated, **job) for job in jobs]:
+                future.result()
+
+        for name in ("first-pipeline", "second-pipeline"):
+            with open(tmp_path / f"{name}.json") as f:
+                spec = json.load(f)
+            assert spec["pipelineSpec"]["pipelineInfo"]["name"] == name
+        assert "TEST_PIPELINE_NAME" not in os.environ
+
+    def test_local_sources_are_transitive(self, tmp_path):
+        write_local_pipeline(tmp_path)
+        sources = [str(path.relative_to(tmp_path.resolve())) for path in local_sources(tmp_path / "pipeline.py")]
+        assert sources == [
+            "components/predict.yaml",
+            "pipeline.py",
+            "project/__init__.py",
+            "project/components/__init__.py",
+            "project/components/train.py",
+            "project/config.py",
+            "project/utils.py",
+        ]
+
+    def test_fingerprint_changes_with_inputs(self, tmp_path):
+        write_local_pipeline(tmp_path)
+        args = dict(
+            pyfile=str(tmp_path / "pipeline.py"),
+            function_name="wanna_pipeline",
+            pipeline_parameters={"text": "hello"},
+            env={"TRAIN_DOCKER_URI": "europe-docker.pkg.dev/project/repo/train:1"},
+        )
+        fingerprint = compile_fingerprint(**args)
+        assert compile_fingerprint(**args) == fingerprint
+
+        (tmp_path / "project" / "unused.py").write_text("CHANGED = True\n")
+        assert compile_fingerprint(**args) == fingerprint
+        (tmp_path / "project" / "utils.py").write_text("def helper():\n    return 1\n")
+        changed_source = compile_fingerprint(**args)
+        assert changed_source != fingerprint
+        assert compile_fingerprint(**{**args, "pipeline_parameters": {"text": "bye"}}) != changed_source
+        assert compile_fingerprint(**{**args, "env": {"TRAIN_DOCKER_URI": "train:2"}}) != changed_source
+
+    def test_is_compiled(self, tmp_path):
+        package_path = str(tmp_path / "pipeline-spec.json")
+        save_fingerprint(package_path, "abc")
+        assert not is_compiled(package_path, "abc")
+        (tmp_path / "pipeline-spec.json").write_text("{}")
+        assert is_compiled(package_path, "abc")
+        assert not is_compiled(package_path, "def")
+        assert (tmp_path / "pipeline-spec.fingerprint").exists()
@@ -1,18 +1,24 @@
 import os
 import shutil
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pytest
 from google import auth
 from google.cloud import aiplatform, logging, scheduler_v1
+from google.cloud.aiplatform.compat.types import pipeline_state_v1
 from google.cloud.aiplatform.pipeline_jobs import PipelineJob
 from google.cloud.functions_v1.services.cloud_functions_service import CloudFunctionsServiceClient
 from google.cloud.monitoring_v3 import AlertPolicyServiceClient
-from mock import patch
+from mock import PropertyMock, patch
 from mock.mock import MagicMock
+from pydantic import ValidationError
 
 import wanna.core.services.pipeline
 from wanna.core.deployment.models import ContainerArtifact, JsonArtifact, PathArtifact
+from wanna.core.deployment.vertex_connector import VertexConnector
 from wanna.core.models.docker import DockerBuildResult, ImageBuildType, LocalBuildImageModel
 from wanna.core.services.docker import DockerService
 from wanna.core.services.pipeline import PipelineService
@@ -20,16 +26,23 @@ from wanna.core.services.tensorboard import TensorboardService
 from wanna.core.utils.config_loader import load_config_from_yaml
 
 
+@pytest.mark.usefixtures("mock_registry_get_digest")
 class TestPipelineService(unittest.TestCase):
     parent = Path(os.path.dirname(os.path.abspath(__file__))).parent.parent
     test_runner_dir = parent / ".build" / "test_pipeline_service"
     sample_pipeline_dir = parent / "samples" / "pipelines" / "sklearn"
     pipeline_build_dir = sample_pipeline_dir / "build"
 
-    def setup(self) -> None:
+    def setUp(self) -> None:
         self.project_id = "gcp-project"
         self.zone = "us-east1-a"
-        shutil.rmtree(self.pipeline_build_dir, ignore_errors=True)
+        # the pipeline is built from a copy of the sample, build outputs are not written into the samples
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.sample_pipeline_dir = Path(self.tmp_dir.name) / "sklearn"
+        shutil.copytree(
+            TestPipelineService.sample_pipeline_dir, self.sample_pipeline_dir, ignore=shutil.ignore_patterns("build")
+        )
+        self.pipeline_build_dir = self.sample_pipeline_dir / "build"
         self.test_runner_dir.mkdir(parents=True, exist_ok=True)
         self.maxDiff = None
         auth.default = MagicMock(
@@ -40,7 +53,7 @@ class TestPipelineService(unittest.TestCase):
         )
 
     def tearDown(self) -> None:
-        pass
+        self.tmp_dir.cleanup()
 
     @patch("wanna.core.services.docker.docker")
     def test_run_pipeline(self, docker_mock):
@@ -89,7 +102,12 @@ class TestPipelineService(unittest.TestCase):
             DockerBuildResult(
                 name="train", tags=[expected_train_docker_tags[0]], build_type=ImageBuildType.local_build_image
             ),
-            DockerBuildResult(name="serve", tags=expected_serve_docker_tags, build_type=ImageBuildType.provided_image),
+            DockerBuildResult(
+                name="serve",
+                tags=expected_serve_docker_tags,
+                build_type=ImageBuildType.provided_image,
+                digest="sha256:" + "0" * 64,
+            ),
         ]
         expected_json_spec_path = (
             self.pipeline_build_dir
@@ -120,7 +138,6 @@ class TestPipelineService(unittest.TestCase):
             )
         )
         PipelineJob.submit = MagicMock(return_value=None)
-        PipelineJob.wait = MagicMock(return_value=None)
         PipelineJob._dashboard_uri = MagicMock(return_value=None)
 
         # === Build ===
@@ -158,19 +175,33 @@ class TestPipelineService(unittest.TestCase):
         # Check Kubeflow V2 pipelines json spec was created and exists
         self.assertTrue(expected_json_spec_path.exists())
 
+        # Unchanged inputs reuse the compiled spec
+        with patch("wanna.core.services.pipeline.compile_pipeline") as compile_mock:
+            self.assertEqual(pipeline_service.build("wanna-sklearn-sample"), pipelines)
+            compile_mock.assert_not_called()
+
         # === Run ===
         # Run pipeline on Vertex AI(Mocked GCP Calls)
         # Passing dummy callback as pipeline_job.state can't be mocked
         aiplatform.init = MagicMock(return_value=None)
-        PipelineService.run([str(manifest_path)], sync=True)
+        succeeded = [pipeline_state_v1.PipelineState.PIPELINE_STATE_SUCCEEDED]
+        with patch.object(VertexConnector, "wait_for_pipelines", return_value=succeeded) as wait_for_pipelines:
+            self.assertTrue(PipelineService.run([str(manifest_path)], sync=True))
         aiplatform.init.assert_called_once()
 
         # Test GCP services were called and with correct args
         # pipeline_jobs.PipelineJob.assert_called_once()
         PipelineJob.submit.assert_called_once()
-        PipelineJob.wait.assert_called_once()
+        wait_for_pipelines.assert_called_once()
         PipelineJob._dashboard_uri.assert_called_once()
 
+        # a run cancelled in the console fails the command
+        cancelled = [pipeline_state_v1.PipelineState.PIPELINE_STATE_CANCELLED]
+        with patch.object(VertexConnector, "wait_for_pipelines", return_value=cancelled), patch.object(
+            PipelineJob, "display_name", new_callable=PropertyMock, return_value="wanna-sklearn-sample"
+        ):
+            self.assertFalse(PipelineService.run([str(manifest_path)], sync=True))
+
         # === Push ===
         DockerService.push_image = MagicMock(return_value=None)
         push_result = pipeline_service.push(pipelines, local=True)
@@ -184,6 +215,7 @@ class TestPipelineService(unittest.TestCase):
         # Should have been updated to new pushed path
         pipeline_meta.json_spec_path = expected_pipeline_spec_path
 
+        # the local push destinations are the build files themselves, so nothing is written again
         expected_push_result = [
             (
                 [
@@ -194,6 +226,7 @@ class TestPipelineService(unittest.TestCase):
                         name="Kubeflow V2 pipeline spec",
                         source=str(expected_json_spec_path),
                         destination=expected_pipeline_spec_path,
+                        unchanged=True,
                     ),
                 ],
                 [
@@ -201,6 +234,7 @@ class TestPipelineService(unittest.TestCase):
                         name="WANNA pipeline manifest",
                         json_body=pipeline_meta.dict(),
                         destination=expected_manifest_json_path,
+                        unchanged=True,
                     ),
                 ],
             )
@@ -291,3 +325,55 @@ class TestPipelineService(unittest.TestCase):
         AlertPolicyServiceClient.create_alert_policy.assert_called()
         # logging.Client.metrics_api.metric_get.assert_called()
         # logging.Client.metrics_api.metric_create.assert_called()
+
+    @patch("wanna.core.services.docker.docker")
+    def test_invalid_compile_workers_override(self, docker_mock):
+        config = load_config_from_yaml(self.sample_pipeline_dir / "wanna.yaml", "default")
+        for value in ["0", "-1", "many"]:
+            with patch.dict(os.environ, {"WANNA_PIPELINE_COMPILE_WORKERS": value}):
+                with self.assertRaisesRegex(ValidationError, "WANNA_PIPELINE_COMPILE_WORKERS"):
+                    PipelineService(config=config, workdir=self.sample_pipeline_dir, version="test")
+        with patch.dict(os.environ, {"WANNA_PIPELINE_COMPILE_WORKERS": "3"}):
+            pipeline_service = PipelineService(config=config, workdir=self.sample_pipeline_dir, version="test")
+        self.assertEqual(pipeline_service.compile_workers, 3)
+
+    @patch("wanna.core.services.docker.docker")
+    def test_compile_in_processes_exports_env(self, docker_mock):
+        config = load_config_from_yaml(self.sample_pipeline_dir / "wanna.yaml", "default")
+        pipeline_service = PipelineService(
+            config=config, workdir=self.sample_pipeline_dir, version="test", compile_workers=2
+        )
+        pipelines = [MagicMock(), MagicMock()]
+        prepared = [
+            (
+                {
+                    "pyfile": "pipeline.py",
+                    "function_name": "wanna_pipeline",
+                    "pipeline_parameters": {},
+                    "package_path": f"{name}.json",
+                    "env": {f"WANNA_{name.upper()}_PIPELINE_NAME": name},
+                },
+                MagicMock(),
+            )
+            for name in ["cached", "stale"]
+        ]
+
+        # the cached pipeline is not compiled again, the stale one is compiled by a worker
+        with patch.object(PipelineService, "_prepare_one_instance", side_effect=prepared), patch.object(
+            PipelineService, "_write_manifest"
+        ), patch.object(PipelineService, "_compile_fingerprint"), patch(
+            "wanna.core.services.pipeline.is_compiled", side_effect=[True, False]
+        ), patch(
+            "wanna.core.services.pipeline.save_fingerprint"
+        ), patch(
+            "wanna.core.services.pipeline.ProcessPoolExecutor",
+            side_effect=lambda max_workers, mp_context: ThreadPoolExecutor(max_workers=max_workers),
+        ), patch(
+            "wanna.core.services.pipeline.compile_pipeline_isolated"
+        ) as compile_mock, patch.dict(
+            os.environ
+        ):
+            pipeline_service._compile_instances_in_processes(pipelines)
+            compile_mock.assert_called_once_with(**prepared[1][0])
+            self.assertEqual(os.environ.get("WANNA_CACHED_PIPELINE_NAME"), "cached")
+            self.assertEqual(os.environ.get("WANNA_STALE_PIPELINE_NAME"), "stale")
@@ -0,0 +1,45 @@
+import os
+import unittest
+from pathlib import Path
+
+from typer.testing import CliRunner
+
+from wanna.cli.plugins.docker_plugin import DockerPlugin
+
+
+class TestDockerPlugin(unittest.TestCase):
+    runner = CliRunner()
+    plugin = DockerPlugin()
+    parent = Path(os.path.dirname(os.path.abspath(__file__))).parent.parent
+    sample_pipeline_dir = parent / "samples" / "pipelines" / "sklearn"
+
+    def test_docker_status_cli(self):
+        result = self.runner.invoke(
+            self.plugin.app,
+            [
+                "status",
+                "--file",
+                str(self.sample_pipeline_dir / "wanna.yaml"),
+                "--profile",
+                "default",
+            ],
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn("train", result.output)
+        self.assertIn("provided", result.output)
+
+    def test_docker_lint_cli(self):
+        result = self.runner.invoke(
+            self.plugin.app,
+            [
+                "lint",
+                "--file",
+                str(self.sample_pipeline_dir / "wanna.yaml"),
+                "--profile",
+                "default",
+                "--strict",
+            ],
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn("train", result.output)
+        self.assertIn("a source change does not invalidate any layer", result.output)